@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+'''
+Compare the native environment exports with the files Conda writes.
+
+For each environment, builds the spec, *.yml* and history *.json* exports
+from the `conda-meta` folder and compares them with the output of
+`conda list --explicit`, `conda env export` and
+`conda env export --from-history --json`.  Exits with status 1 if any
+export differs.  Requires a real Conda installation.
+
+Usage:
+    python benchmarks/compare_exports.py base TestProject
+'''
+
+
+# %% Imports
+from typing import List, Dict
+import sys
+import shutil
+import argparse
+import difflib
+import subprocess
+from pathlib import Path
+
+BENCHMARK_FOLDER = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_FOLDER.parent / 'src'))
+
+from conda_meta import (discover_environments, export_env_specs,  # pylint: disable=wrong-import-position
+                        find_base_prefix)
+
+# The conda arguments that produce each export.
+EXPORT_ARGS = {
+    'spec': ['list', '--explicit'],
+    'yml': ['env', 'export'],
+    'history': ['env', 'export', '--from-history', '--json']
+    }
+
+
+# %% Comparison
+def find_conda()->str:
+    '''Find the conda executable, preferring the base installation.'''
+    base_prefix = find_base_prefix()
+    if base_prefix is not None:
+        for conda_path in (base_prefix / 'bin' / 'conda',
+                           base_prefix / 'Scripts' / 'conda.exe',
+                           base_prefix / 'condabin' / 'conda.bat'):
+            if conda_path.is_file():
+                return str(conda_path)
+    return shutil.which('conda')
+
+
+def conda_exports(conda: str, env_path: Path)->Dict[str, str]:
+    '''Run the conda export commands for an environment.
+
+    Args:
+        conda (str): The conda executable.
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        Dict[str, str]: The output of each export command, indexed by
+            export type.
+    '''
+    exports = {}
+    for key, args in EXPORT_ARGS.items():
+        output = subprocess.run([conda, *args, '--prefix', str(env_path)],
+                                capture_output=True, text=True, check=True)
+        exports[key] = output.stdout
+    return exports
+
+
+def compare_environment(conda: str, env_name: str, env_path: Path)->List[str]:
+    '''Compare the native and conda exports for one environment.
+
+    Args:
+        conda (str): The conda executable.
+        env_name (str): The name of the Conda environment.
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        List[str]: The export types that differ.
+    '''
+    expected = conda_exports(conda, env_path)
+    native = export_env_specs(env_name, env_path)
+    different = []
+    for key, conda_text in expected.items():
+        if native[key] == conda_text:
+            continue
+        different.append(key)
+        diff = difflib.unified_diff(conda_text.splitlines(),
+                                    native[key].splitlines(),
+                                    'conda', 'native', lineterm='')
+        print('\n'.join(list(diff)[:40]))
+    return different
+
+
+def main()->int:
+    '''Compare the exports for the requested environments.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('environments', nargs='*',
+                        help='Environment names.  Defaults to all '
+                        'environments.')
+    parser.add_argument('--conda', help='The conda executable.  Defaults to '
+                        'the one in the base installation.')
+    args = parser.parse_args()
+    conda = args.conda or find_conda()
+    if not conda:
+        print('FAILED: conda was not found.')
+        return 1
+    environments = discover_environments()
+    if args.environments:
+        environments = [(name, path) for name, path in environments
+                        if name in args.environments]
+    failed = False
+    for env_name, env_path in environments:
+        different = compare_environment(conda, env_name, env_path)
+        if different:
+            failed = True
+            print(f'{env_name:<24}DIFFERENT: {", ".join(different)}')
+        else:
+            print(f'{env_name:<24}same')
+    if failed:
+        print('FAILED: the native exports do not match conda.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
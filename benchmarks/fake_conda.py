@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+'''
+Fake `conda` and `pip` executables for benchmarking env_tools.
+
+Produces realistic `conda env list`, `conda list --explicit`,
+`conda env export`, `conda info --json` and `--json` install output without
+an Anaconda installation.  The size and latency of the fake installation are
+set with environment variables:
+    FAKE_CONDA_ENVS       Number of environments (default 20).
+    FAKE_CONDA_PACKAGES   Number of packages in each environment (default 300).
+    FAKE_CONDA_LATENCY    Seconds to sleep before each command (default 0).
+    FAKE_CONDA_ROOT       The base installation path
+                          (default C:\\FakeAnaconda3).
+
+Use `install_fake_conda` to create `conda` and `pip` launchers in a folder
+that can be put at the front of PATH.
+'''
+
+
+# %% Imports
+from typing import List, Dict
+import os
+import sys
+import json
+import time
+import random
+from pathlib import Path
+
+
+# %% Fake installation settings
+def settings()->Dict[str, object]:
+    '''Read the fake installation settings from the environment.'''
+    return {
+        'envs': int(os.environ.get('FAKE_CONDA_ENVS', '20')),
+        'packages': int(os.environ.get('FAKE_CONDA_PACKAGES', '300')),
+        'latency': float(os.environ.get('FAKE_CONDA_LATENCY', '0')),
+        'root': os.environ.get('FAKE_CONDA_ROOT', r'C:\FakeAnaconda3')
+        }
+
+
+def env_names(config: Dict[str, object])->List[str]:
+    '''The names of the fake environments, including base.'''
+    return ['base'] + [f'env_{index:03d}'
+                       for index in range(1, config['envs'])]
+
+
+def env_prefix(config: Dict[str, object], env_name: str)->str:
+    '''The path of a fake environment.'''
+    if env_name == 'base':
+        return config['root']
+    return '\\'.join([config['root'], 'envs', env_name])
+
+
+def packages(config: Dict[str, object], env_name: str)->List[Dict[str, str]]:
+    '''Generate a repeatable package list for a fake environment.'''
+    rng = random.Random(env_name)
+    package_list = []
+    for index in range(config['packages']):
+        # Most packages are shared between environments with the same version.
+        version = f'{index % 7 + 1}.{index % 13}.{rng.randint(0, 2)}'
+        package_list.append({
+            'name': f'package-{index:04d}',
+            'version': version,
+            'build': f'py310h{index:06x}_{rng.randint(0, 3)}',
+            'channel': 'conda-forge' if index % 4 else 'defaults'
+            })
+    return package_list
+
+
+def package_url(package: Dict[str, str])->str:
+    '''The download URL of a fake package.'''
+    if package['channel'] == 'defaults':
+        base = 'https://repo.anaconda.com/pkgs/main/win-64'
+    else:
+        base = 'https://conda.anaconda.org/conda-forge/win-64'
+    file_name = '-'.join([package['name'], package['version'],
+                          package['build']])
+    return f'{base}/{file_name}.conda'
+
+
+# %% Command output
+def get_option(args: List[str], *names: str)->str:
+    '''Get the value following one of the option names.'''
+    for name in names:
+        if name in args:
+            index = args.index(name)
+            if index + 1 < len(args):
+                return args[index + 1]
+    return None
+
+
+def selected_env(config: Dict[str, object], args: List[str])->str:
+    '''The environment named by --name/-n or --prefix/-p.'''
+    name = get_option(args, '--name', '-n')
+    if name:
+        return name
+    prefix = get_option(args, '--prefix', '-p')
+    if prefix:
+        return prefix.rstrip('\\').split('\\')[-1]
+    return 'base'
+
+
+def env_list(config: Dict[str, object])->str:
+    '''Output of `conda env list`.'''
+    lines = ['# conda environments:', '#']
+    for name in env_names(config):
+        marker = '*' if name == 'base' else ' '
+        lines.append(f'{name:<25} {marker}  {env_prefix(config, name)}')
+    return '\n'.join(lines) + '\n'
+
+
+def explicit_spec(config: Dict[str, object], env_name: str)->str:
+    '''Output of `conda list --explicit`.'''
+    lines = ['# This file may be used to create an environment using:',
+             '# $ conda create --name <env> --file <this file>',
+             '# platform: win-64',
+             '@EXPLICIT']
+    lines.extend(package_url(package)
+                 for package in packages(config, env_name))
+    return '\n'.join(lines) + '\n'
+
+
+def env_export(config: Dict[str, object], env_name: str,
+               from_history: bool, as_json: bool)->str:
+    '''Output of `conda env export`.'''
+    channels = ['conda-forge', 'defaults']
+    if from_history:
+        dependencies = [package['name']
+                        for package in packages(config, env_name)[:10]]
+    else:
+        dependencies = ['='.join([package['name'], package['version'],
+                                  package['build']])
+                        for package in packages(config, env_name)]
+    export = {'name': env_name, 'channels': channels,
+              'dependencies': dependencies,
+              'prefix': env_prefix(config, env_name)}
+    if as_json:
+        return json.dumps(export, indent=2, sort_keys=True) + '\n'
+    lines = [f'name: {env_name}', 'channels:']
+    lines.extend(f'  - {channel}' for channel in channels)
+    lines.append('dependencies:')
+    lines.extend(f'  - {dependency}' for dependency in dependencies)
+    lines.append(f'prefix: {export["prefix"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def install_result(config: Dict[str, object], env_name: str,
+                   requested: List[str])->str:
+    '''Output of `conda install --json` or `conda create --json`.'''
+    link = [{'base_url': 'https://conda.anaconda.org/conda-forge',
+             'build_number': 0, 'build_string': 'pyhd8ed1ab_0',
+             'channel': 'conda-forge',
+             'dist_name': f'{name}-1.0.0-pyhd8ed1ab_0',
+             'name': name, 'platform': 'noarch', 'version': '1.0.0'}
+            for name in requested]
+    result = {'actions': {'FETCH': [], 'LINK': link, 'PREFIX':
+                          env_prefix(config, env_name)},
+              'prefix': env_prefix(config, env_name), 'success': True}
+    return json.dumps(result, indent=2, sort_keys=True) + '\n'
+
+
+def conda_info(config: Dict[str, object])->str:
+    '''Output of `conda info --envs --json`.'''
+    info = {'active_prefix': config['root'], 'active_prefix_name': 'base',
+            'channels': ['https://conda.anaconda.org/conda-forge/win-64'],
+            'conda_version': '23.7.4',
+            'envs': [env_prefix(config, name) for name in env_names(config)],
+            'envs_dirs': ['\\'.join([config['root'], 'envs'])],
+            'platform': 'win-64', 'root_prefix': config['root']}
+    return json.dumps(info, indent=2, sort_keys=True) + '\n'
+
+
+def pip_report(args: List[str])->str:
+    '''Output of `pip install --report -`.'''
+    requested = [arg for arg in args[1:] if not arg.startswith('-')]
+    report = {'version': '1', 'install': [
+        {'metadata': {'name': name, 'version': '1.0.0'}, 'requested': True}
+        for name in requested]}
+    return json.dumps(report)
+
+
+def run_conda(args: List[str])->str:
+    '''Generate the output for a conda command line.'''
+    config = settings()
+    command = ' '.join(args[:2])
+    if command == 'env list':
+        return env_list(config)
+    if command == 'env export':
+        output = env_export(config, selected_env(config, args),
+                            '--from-history' in args, '--json' in args)
+        file_name = get_option(args, '--file', '-f')
+        if file_name:
+            Path(file_name.strip('"')).write_text(output, encoding='utf-8')
+            return ''
+        return output
+    if args[:1] == ['list'] and '--explicit' in args:
+        return explicit_spec(config, selected_env(config, args))
+    if args[:1] in (['install'], ['create']):
+        requested = [arg for arg in args[1:] if not arg.startswith('-')
+                     and arg != get_option(args, '--name', '-n')
+                     and arg != get_option(args, '--prefix', '-p')]
+        return install_result(config, selected_env(config, args), requested)
+    if args[:1] == ['info']:
+        return conda_info(config)
+    raise SystemExit(f'fake conda: unsupported command {" ".join(args)}')
+
+
+def main():
+    '''Run the fake `conda` or `pip` command given on the command line.'''
+    config = settings()
+    if config['latency']:
+        time.sleep(config['latency'])
+    program = sys.argv[1]
+    args = sys.argv[2:]
+    if program == 'pip':
+        output = pip_report(args)
+    else:
+        output = run_conda(args)
+    sys.stdout.write(output)
+
+
+# %% Launchers
+def install_fake_conda(bin_folder: Path)->Path:
+    '''Create `conda` and `pip` launchers for the fake executables.
+
+    Args:
+        bin_folder (Path): The folder to hold the launchers.  Put it at the
+            front of PATH to use the fake executables.
+
+    Returns:
+        Path: The launcher folder.
+    '''
+    bin_folder.mkdir(parents=True, exist_ok=True)
+    script = Path(__file__).resolve()
+    for program in ('conda', 'pip'):
+        if os.name == 'nt':
+            launcher = bin_folder / f'{program}.bat'
+            launcher.write_text(
+                f'@"{sys.executable}" "{script}" {program} %*\n')
+        else:
+            launcher = bin_folder / program
+            launcher.write_text('\n'.join([
+                '#!/bin/sh',
+                f'exec "{sys.executable}" "{script}" {program} "$@"', '']))
+            launcher.chmod(0o755)
+    return bin_folder
+
+
+def hide_conda_installation(home_folder: Path):
+    '''Stop env_tools from finding a real Conda installation.
+
+    env_tools reads the environments of a Conda installation directly when
+    it can find one, in which case the fake `conda` would not be used.  The
+    variables set by an activated Conda shell are removed and the home
+    folder is replaced, so that the fake executables are used unless Conda
+    is installed in a system folder such as /opt/conda.
+
+    Args:
+        home_folder (Path): An empty folder to use as the home folder.
+    '''
+    for variable in ('CONDA_EXE', 'CONDA_PREFIX', 'CONDARC',
+                     'CONDA_ENVS_DIRS', 'CONDA_ENVS_PATH'):
+        os.environ.pop(variable, None)
+    home_folder.mkdir(parents=True, exist_ok=True)
+    os.environ['HOME'] = str(home_folder)
+    os.environ['USERPROFILE'] = str(home_folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+Measure the start-up time of env_tools.
+
+Times `import env_tools` and `python -m env_tools list` (against the fake
+conda executables) in fresh python processes, and checks that pandas is not
+imported unless a table is requested.  Exits with status 1 if pandas is
+imported or the median import time exceeds the limit.
+
+Usage:
+    python benchmarks/import_time.py --repeat 10 --limit 0.3
+'''
+
+
+# %% Imports
+from typing import List
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+BENCHMARK_FOLDER = Path(__file__).resolve().parent
+SOURCE_FOLDER = BENCHMARK_FOLDER.parent / 'src'
+sys.path.insert(0, str(BENCHMARK_FOLDER))
+
+from fake_conda import install_fake_conda, hide_conda_installation  # pylint: disable=wrong-import-position
+
+# Reports the modules loaded by importing env_tools.
+IMPORT_CHECK = ('import sys, env_tools; '
+                'print("pandas" in sys.modules)')
+
+
+# %% Timing
+def time_process(cmd: List[str], repeat: int)->List[float]:
+    '''Time repeated runs of a python command in a new process.
+
+    Args:
+        cmd (List[str]): The arguments to pass to python.
+        repeat (int): The number of runs.
+
+    Returns:
+        List[float]: The duration of each run in seconds.
+    '''
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *cmd], cwd=SOURCE_FOLDER, check=True,
+                       capture_output=True)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def pandas_imported()->bool:
+    '''Check whether importing env_tools also imports pandas.'''
+    output = subprocess.run([sys.executable, '-c', IMPORT_CHECK],
+                            cwd=SOURCE_FOLDER, check=True,
+                            capture_output=True, text=True)
+    return output.stdout.strip() == 'True'
+
+
+# %% Main
+def main()->int:
+    '''Measure the start-up times and check them against the limit.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of times to repeat each measurement.')
+    parser.add_argument('--limit', type=float, default=0.3,
+                        help='Maximum median seconds for `import env_tools`.')
+    args = parser.parse_args()
+
+    baseline = time_process(['-c', 'pass'], args.repeat)
+    import_times = time_process(['-c', 'import env_tools'], args.repeat)
+    with tempfile.TemporaryDirectory() as temp_folder:
+        bin_folder = install_fake_conda(Path(temp_folder) / 'bin')
+        hide_conda_installation(Path(temp_folder) / 'home')
+        os.environ['PATH'] = os.pathsep.join([str(bin_folder),
+                                              os.environ['PATH']])
+        list_times = time_process(['-m', 'env_tools', 'list'], args.repeat)
+
+    python_start = statistics.median(baseline)
+    import_time = statistics.median(import_times) - python_start
+    list_time = statistics.median(list_times) - python_start
+    uses_pandas = pandas_imported()
+    print(f'{"python start-up":<28}{python_start:>10.4f} s')
+    print(f'{"import env_tools":<28}{import_time:>10.4f} s')
+    print(f'{"python -m env_tools list":<28}{list_time:>10.4f} s')
+    print(f'{"pandas imported":<28}{str(uses_pandas):>10}')
+    if uses_pandas or import_time > args.limit:
+        print('FAILED: env_tools start-up is too slow.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark env_tools operations against the fake conda executables.
+
+Times `list_environments`, `set_env_ref`, `save_env_specs`, `log_all_envs`,
+`build_env_table` and `install_packages` without an Anaconda installation,
+and appends the results to a JSON-lines history file so that runs can be
+compared over time.
+
+Usage:
+    python benchmarks/run_benchmarks.py --envs 500 --packages 3000
+'''
+
+
+# %% Imports
+from typing import Callable, Dict, List
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+BENCHMARK_FOLDER = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_FOLDER.parent / 'src'))
+sys.path.insert(0, str(BENCHMARK_FOLDER))
+
+from fake_conda import install_fake_conda, hide_conda_installation  # pylint: disable=wrong-import-position
+
+
+# %% Benchmark helpers
+def time_call(func: Callable, repeat: int, setup: Callable = None)->List[float]:
+    '''Time repeated calls to a function.
+
+    Args:
+        func (Callable): The function to time.
+        repeat (int): The number of calls.
+        setup (Callable, optional): Called before each timed call.
+
+    Returns:
+        List[float]: The duration of each call in seconds.
+    '''
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def git_commit()->str:
+    '''The current git commit of the repository, if available.'''
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=BENCHMARK_FOLDER, capture_output=True,
+                                check=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return output.stdout.strip()
+
+
+def run_benchmarks(repeat: int, work_folder: Path)->Dict[str, List[float]]:
+    '''Run each benchmark.
+
+    Args:
+        repeat (int): The number of times to repeat each benchmark.
+        work_folder (Path): A temporary folder for exported files.
+
+    Returns:
+        Dict[str, List[float]]: The durations for each benchmark.
+    '''
+    import env_tools  # pylint: disable=import-outside-toplevel
+    registry = env_tools.env_registry
+    env_list = env_tools.list_environments(force_refresh=True)
+    env_name = env_list[-1][0]
+    results = {}
+    results['list_environments (cold)'] = time_call(
+        lambda: env_tools.list_environments(force_refresh=True), repeat)
+    results['list_environments (cached)'] = time_call(
+        env_tools.list_environments, repeat)
+    results['set_env_ref (cold)'] = time_call(
+        lambda: env_tools.set_env_ref(env_name), repeat, registry.invalidate)
+    results['set_env_ref (cached)'] = time_call(
+        lambda: env_tools.set_env_ref(env_name), repeat)
+    spec_folder = work_folder / 'specs'
+    spec_folder.mkdir()
+    results['save_env_specs'] = time_call(
+        lambda: env_tools.save_env_specs(env_name, spec_folder), repeat)
+    results['save_env_specs (parallel)'] = time_call(
+        lambda: env_tools.save_env_specs(env_name, spec_folder,
+                                         parallel=True), repeat)
+    for workers in (1, 4):
+        log_folder = work_folder / f'log_{workers}'
+        results[f'log_all_envs (workers={workers})'] = time_call(
+            lambda: env_tools.log_all_envs(log_folder, max_workers=workers),
+            1, registry.invalidate)
+    results['build_env_table'] = time_call(env_tools.build_env_table, repeat,
+                                           registry.invalidate)
+    results['install_packages'] = time_call(
+        lambda: env_tools.install_packages(env_name, ['numpy', 'pandas']),
+        repeat)
+    return results
+
+
+def summarize(results: Dict[str, List[float]])->Dict[str, Dict[str, float]]:
+    '''Reduce the durations for each benchmark to min, median and max.'''
+    return {name: {'min': min(durations),
+                   'median': statistics.median(durations),
+                   'max': max(durations)}
+            for name, durations in results.items()}
+
+
+def load_history(history_file: Path)->List[dict]:
+    '''Read the earlier benchmark runs.'''
+    if not history_file.exists():
+        return []
+    with history_file.open(encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def print_report(summary: Dict[str, Dict[str, float]], previous: dict = None):
+    '''Print the benchmark medians, compared with the previous run.'''
+    print(f'{"Benchmark":<32}{"median (s)":>12}{"previous":>12}{"change":>10}')
+    for name, stats in summary.items():
+        line = f'{name:<32}{stats["median"]:>12.4f}'
+        if previous and name in previous['results']:
+            before = previous['results'][name]['median']
+            change = (stats['median'] - before) / before if before else 0.0
+            line += f'{before:>12.4f}{change:>+10.1%}'
+        print(line)
+
+
+# %% Main
+def main():
+    '''Run the benchmarks and record the results.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--envs', type=int, default=20,
+                        help='Number of fake environments.')
+    parser.add_argument('--packages', type=int, default=300,
+                        help='Number of packages in each environment.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds of latency for each fake command.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times to repeat each benchmark.')
+    parser.add_argument('--history', type=Path,
+                        default=BENCHMARK_FOLDER / 'benchmark_history.jsonl',
+                        help='JSON-lines file that records each run.')
+    parser.add_argument('--no-save', action='store_true',
+                        help='Do not add this run to the history file.')
+    args = parser.parse_args()
+
+    config = {'envs': args.envs, 'packages': args.packages,
+              'latency': args.latency, 'repeat': args.repeat}
+    with tempfile.TemporaryDirectory() as temp_folder:
+        work_folder = Path(temp_folder)
+        bin_folder = install_fake_conda(work_folder / 'bin')
+        hide_conda_installation(work_folder / 'home')
+        os.environ['PATH'] = os.pathsep.join([str(bin_folder),
+                                              os.environ['PATH']])
+        os.environ['FAKE_CONDA_ENVS'] = str(args.envs)
+        os.environ['FAKE_CONDA_PACKAGES'] = str(args.packages)
+        os.environ['FAKE_CONDA_LATENCY'] = str(args.latency)
+        results = run_benchmarks(args.repeat, work_folder)
+
+    summary = summarize(results)
+    history = load_history(args.history)
+    matching = [run for run in history if run.get('config') == config]
+    print_report(summary, matching[-1] if matching else None)
+    if not args.no_save:
+        run = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'commit': git_commit(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'config': config,
+               'results': summary}
+        with args.history.open('a', encoding='utf-8') as file:
+            file.write(json.dumps(run) + '\n')
+
+
+if __name__ == '__main__':
+    main()
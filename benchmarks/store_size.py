@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+'''
+Compare the size of the snapshot store with the snapshots it holds.
+
+Loads snapshot folders into a new snapshot store, checks that every
+snapshot is restored byte for byte, and reports the size of the raw
+snapshot files and of the store database.  Exits with status 1 if the
+store is not smaller than the raw snapshots.
+
+Usage:
+    python benchmarks/store_size.py "Environment Info Files/Home envs Oct 13 2023"
+'''
+
+
+# %% Imports
+from typing import List
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCHMARK_FOLDER = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_FOLDER.parent / 'src'))
+
+from snapshot_store import SnapshotStore  # pylint: disable=wrong-import-position
+
+# The archived snapshots included with the repository.
+ARCHIVE_FOLDER = BENCHMARK_FOLDER.parent / 'Environment Info Files'
+
+
+# %% Size check
+def snapshot_files(snapshot_folder: Path)->List[Path]:
+    '''List the files in a snapshot folder.'''
+    return sorted(file for file in snapshot_folder.iterdir() if file.is_file())
+
+
+def main()->int:
+    '''Store the snapshots and compare the sizes.'''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('folders', nargs='*', type=Path,
+                        help='Snapshot folders.  Defaults to the "Home envs" '
+                        'folders in Environment Info Files.')
+    args = parser.parse_args()
+    folders = args.folders or sorted(ARCHIVE_FOLDER.glob('Home envs*'))
+
+    raw_size = 0
+    with tempfile.TemporaryDirectory() as temp_folder:
+        with SnapshotStore(Path(temp_folder) / 'store') as store:
+            for folder in folders:
+                files = snapshot_files(folder)
+                raw_size += sum(file.stat().st_size for file in files)
+                store.add_folder(folder)
+                restore_folder = Path(temp_folder) / 'restore' / folder.name
+                store.restore_snapshot(folder.name, restore_folder)
+                for file in files:
+                    restored = restore_folder / file.name
+                    if restored.read_bytes() != file.read_bytes():
+                        print(f'FAILED: {file} was not restored exactly.')
+                        return 1
+            summary = store.size_summary()
+    print(f'{"snapshots":<24}{summary["snapshots"]:>10}')
+    print(f'{"distinct files":<24}{summary["files"]:>10}')
+    print(f'{"raw snapshot bytes":<24}{raw_size:>10}')
+    print(f'{"distinct file bytes":<24}{summary["file bytes"]:>10}')
+    print(f'{"store bytes":<24}{summary["bytes"]:>10}')
+    if summary['bytes'] >= raw_size:
+        print('FAILED: the store is not smaller than the raw snapshots.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,555 @@
+'''Multi-Project Environment Build Runner.
+
+ Build many project environments as one parallel job.  Each project is
+ described declaratively (see `ProjectSpec`) and turned into a set of build
+ steps with dependencies.  Steps from independent projects run
+ concurrently, while steps that run the Conda solver or download packages
+ are limited so that the shared package cache stays consistent.  Failed
+ steps are retried, the state of every step is saved so that an
+ interrupted or failed build can be resumed, and each step is timed.
+
+ Example project file:
+    [
+        {"env_name": "TestProject",
+         "project_folder": "D:/Python/Projects/TestProject",
+         "python_version": "3.11",
+         "package_list": ["pandas", "xlwings", "ipykernel"],
+         "pip_package_list": ["units"],
+         "install_xlwings": true}
+    ]
+ '''
+
+# %%  Imports
+from typing import Any, Callable, Dict, List
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+import argparse
+import contextvars
+import threading
+import json
+import time
+
+from env_tools import ProjectException, create_environment
+from env_tools import install_packages, pip_install_packages
+from env_tools import configure_logging
+from project_steps import install_kernel, configure_xlwings
+from project_steps import build_jupyter_bat, build_vs_code_bat, save_logs
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Type Definitions
+# A step action receives the outputs of the project's completed steps.
+StepAction = Callable[[Dict[str, Any]], Any]
+
+
+# %% Constants
+# The maximum number of steps using each limited resource at once.
+DEFAULT_LIMITS = {'solver': 1, 'download': 2}
+
+DONE = 'done'
+RESUMED = 'resumed'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+PENDING = 'pending'
+
+
+# %% Project definition
+@dataclass
+class ProjectSpec():
+    '''The definition of a project environment.
+
+    Attributes:
+        env_name (str): The name for the Conda environment.
+        project_folder (Path): The top folder of the project.
+        python_version (str): The python version. Defaults to '3.10'.
+        package_list (List[str]): The Conda packages to install.
+        pip_package_list (List[str]): The packages to install with pip.
+        install_jupyter (bool): Install the Jupyter kernel. Defaults to True.
+        install_xlwings (bool): Configure xlwings. Defaults to False.
+        build_batch_files (bool): Write the JupyterLab and VS Code batch
+            files. Defaults to True.
+        env_folder (Path): The folder for the batch files and logs.  If None,
+            the 'environment' folder in project_folder is used.
+    '''
+    env_name: str
+    project_folder: Path
+    python_version: str = '3.10'
+    package_list: List[str] = field(default_factory=list)
+    pip_package_list: List[str] = field(default_factory=list)
+    install_jupyter: bool = True
+    install_xlwings: bool = False
+    build_batch_files: bool = True
+    env_folder: Path = None
+
+    def __post_init__(self):
+        self.project_folder = Path(self.project_folder)
+        self.python_version = str(self.python_version)
+        if self.env_folder is None:
+            self.env_folder = self.project_folder / 'environment'
+        else:
+            self.env_folder = Path(self.env_folder)
+
+
+def load_projects(project_file: Path)->List[ProjectSpec]:
+    '''Read project definitions from a .json file.
+
+    Args:
+        project_file (Path): A .json file containing a list of project
+            definitions, or a dictionary with the list under 'projects'.
+
+    Returns:
+        List[ProjectSpec]: The project definitions.
+    '''
+    projects = json.loads(Path(project_file).read_text(encoding='utf-8'))
+    if isinstance(projects, dict):
+        projects = projects['projects']
+    return [ProjectSpec(**project) for project in projects]
+
+
+# %% Build steps
+@dataclass
+class BuildStep():
+    '''One step in building a project environment.
+
+    Attributes:
+        project (str): The name of the project the step belongs to.
+        name (str): The name of the step, unique within the project.
+        action (StepAction): The function that performs the step.  It is
+            called with the outputs of the project's completed steps and its
+            return value is saved as the step output.
+        depends (List[str]): The steps that must finish first.  Names
+            without a ':' refer to steps in the same project; other steps
+            are referred to as '<project>:<step>'.
+        resource (str): The limited resource the step uses, if any, e.g.
+            'solver' or 'download'.
+    '''
+    project: str
+    name: str
+    action: StepAction
+    depends: List[str] = field(default_factory=list)
+    resource: str = None
+
+    @property
+    def step_id(self)->str:
+        '''The unique identifier for the step.'''
+        return f'{self.project}:{self.name}'
+
+    def dependency_ids(self)->List[str]:
+        '''The identifiers of the steps this step depends on.'''
+        return [step if ':' in step else f'{self.project}:{step}'
+                for step in self.depends]
+
+
+@dataclass
+class StepResult():
+    '''The outcome of a build step.
+
+    Attributes:
+        step_id (str): The step identifier.
+        status (str): One of 'pending', 'done', 'resumed' (done in an
+            earlier run), 'failed' or 'skipped' (a dependency failed).
+        attempts (int): The number of times the step was run.
+        started (str): The time the step started.
+        duration (float): The time taken in seconds, including retries.
+        error (str): The error message if the step failed.
+        output (Any): The value returned by the step action.
+    '''
+    step_id: str
+    status: str = PENDING
+    attempts: int = 0
+    started: str = ''
+    duration: float = 0.0
+    error: str = ''
+    output: Any = None
+
+
+def project_build_steps(project: ProjectSpec,
+                        wheelhouse: Path = None)->List[BuildStep]:
+    '''Convert a project definition into build steps.
+
+    Args:
+        project (ProjectSpec): The project definition.
+        wheelhouse (Path, optional): A folder of wheels shared by the pip
+            installs.  Default is None.
+
+    Returns:
+        List[BuildStep]: The steps needed to build the project environment.
+    '''
+    env_name = project.env_name
+
+    def create_step(outputs):
+        return create_environment(env_name, project.python_version)
+
+    def install_step(outputs):
+        if not project.package_list:
+            return {}
+        return install_packages(env_name, project.package_list)
+
+    def pip_step(outputs):
+        return pip_install_packages(env_name, project.pip_package_list,
+                                    batch=True, wheelhouse=wheelhouse)
+
+    def kernel_step(outputs):
+        return install_kernel(env_name)
+
+    def xlwings_step(outputs):
+        return configure_xlwings(env_name)
+
+    def batch_file_step(outputs):
+        project.env_folder.mkdir(parents=True, exist_ok=True)
+        project_drive = project.project_folder.drive
+        return [str(build_jupyter_bat(env_name, project.env_folder,
+                                      project.project_folder, project_drive)),
+                str(build_vs_code_bat(env_name, project.env_folder,
+                                      project.project_folder, project_drive))]
+
+    def save_logs_step(outputs):
+        project.env_folder.mkdir(parents=True, exist_ok=True)
+        return str(save_logs(outputs.get('create'), outputs.get('install'),
+                             outputs.get('pip install'), env_name,
+                             project.env_folder))
+
+    steps = [
+        BuildStep(env_name, 'create', create_step, resource='solver'),
+        BuildStep(env_name, 'install', install_step, ['create'],
+                  resource='solver')
+        ]
+    log_depends = ['create', 'install']
+    if project.pip_package_list:
+        steps.append(BuildStep(env_name, 'pip install', pip_step, ['install'],
+                               resource='download'))
+        log_depends.append('pip install')
+    if project.install_jupyter:
+        steps.append(BuildStep(env_name, 'kernel', kernel_step, ['install']))
+    if project.install_xlwings:
+        steps.append(BuildStep(env_name, 'xlwings', xlwings_step, ['install']))
+    if project.build_batch_files:
+        steps.append(BuildStep(env_name, 'batch files', batch_file_step,
+                               ['create']))
+    steps.append(BuildStep(env_name, 'save logs', save_logs_step,
+                           log_depends))
+    return steps
+
+
+# %% Runner
+class BuildRunner():
+    '''Run build steps concurrently in dependency order.
+
+    Attributes:
+        steps (Dict[str, BuildStep]): The steps, by step identifier.
+        limits (Dict[str, int]): The maximum number of steps using each
+            limited resource at once.
+        max_workers (int): The maximum number of steps running at once.
+        retries (int): The number of times a step that raises a
+            ProjectException is retried.
+        retry_delay (float): The seconds to wait before retrying a step.
+        state_file (Path): A .json file recording the completed steps.  If
+            it exists when the runner starts, steps it lists as done are not
+            run again.
+        results (Dict[str, StepResult]): The result of each step.
+    '''
+    def __init__(self, steps: List[BuildStep], limits: Dict[str, int] = None,
+                 max_workers: int = 4, retries: int = 1,
+                 retry_delay: float = 5.0, state_file: Path = None):
+        self.steps = {step.step_id: step for step in steps}
+        if len(self.steps) < len(steps):
+            raise ValueError('Build step identifiers must be unique.')
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.state_file = Path(state_file) if state_file else None
+        self.results = {step_id: StepResult(step_id)
+                        for step_id in self.steps}
+        self.lock = threading.Lock()
+        self.check_dependencies()
+
+    def check_dependencies(self):
+        '''Check that every dependency exists and that there are no cycles.
+
+        Raises:
+            ValueError: A dependency is missing or the steps form a cycle.
+        '''
+        remaining = dict()
+        for step_id, step in self.steps.items():
+            dependencies = set(step.dependency_ids())
+            missing = dependencies - set(self.steps)
+            if missing:
+                raise ValueError(f'Step {step_id} depends on unknown steps: '
+                                 f'{", ".join(sorted(missing))}')
+            remaining[step_id] = dependencies
+        while remaining:
+            ready = {step_id for step_id, dependencies in remaining.items()
+                     if not dependencies & set(remaining)}
+            if not ready:
+                raise ValueError('Build steps form a cycle: '
+                                 f'{", ".join(sorted(remaining))}')
+            for step_id in ready:
+                del remaining[step_id]
+
+    # State
+    def load_state(self):
+        '''Mark the steps completed in an earlier run as resumed.'''
+        if self.state_file is None or not self.state_file.exists():
+            return
+        state = json.loads(self.state_file.read_text(encoding='utf-8'))
+        for step_id, saved in state.items():
+            if step_id in self.results and saved.get('status') in (DONE,
+                                                                    RESUMED):
+                result = StepResult(**saved)
+                result.status = RESUMED
+                self.results[step_id] = result
+                logger.info('Resuming after completed step %s', step_id)
+
+    def save_state(self):
+        '''Write the results of the completed steps to the state file.'''
+        if self.state_file is None:
+            return
+        with self.lock:
+            state = {step_id: asdict(result)
+                     for step_id, result in self.results.items()
+                     if result.status in (DONE, RESUMED)}
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            self.state_file.write_text(json.dumps(state, indent=2,
+                                                  default=str),
+                                       encoding='utf-8')
+
+    def project_outputs(self, project: str)->Dict[str, Any]:
+        '''Collect the outputs of a project's completed steps.'''
+        with self.lock:
+            return {self.steps[step_id].name: result.output
+                    for step_id, result in self.results.items()
+                    if self.steps[step_id].project == project
+                    and result.status in (DONE, RESUMED)}
+
+    # Running
+    def run_step(self, step: BuildStep)->StepResult:
+        '''Run one step, retrying it if it raises a ProjectException.'''
+        result = StepResult(step.step_id)
+        result.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        start = time.perf_counter()
+        outputs = self.project_outputs(step.project)
+        while True:
+            result.attempts += 1
+            try:
+                result.output = step.action(outputs)
+            except ProjectException as err:
+                result.error = str(err)
+                if result.attempts > self.retries:
+                    result.status = FAILED
+                    break
+                logger.warning('Step %s failed (attempt %d), retrying: %s',
+                               step.step_id, result.attempts, err)
+                time.sleep(self.retry_delay)
+            except Exception as err:  # pylint: disable=broad-except
+                result.error = f'{type(err).__name__}: {err}'
+                result.status = FAILED
+                break
+            else:
+                result.error = ''
+                result.status = DONE
+                break
+        result.duration = time.perf_counter() - start
+        return result
+
+    def skip_dependents(self, failed_id: str, remaining: Dict[str, BuildStep]):
+        '''Mark the steps that depend on a failed step as skipped.'''
+        blocked = {failed_id}
+        changed = True
+        while changed:
+            changed = False
+            for step_id, step in list(remaining.items()):
+                if blocked & set(step.dependency_ids()):
+                    self.results[step_id].status = SKIPPED
+                    self.results[step_id].error = f'{failed_id} failed'
+                    blocked.add(step_id)
+                    del remaining[step_id]
+                    changed = True
+
+    def fail_stranded(self, remaining: Dict[str, BuildStep]):
+        '''Fail the steps that can never start and skip their dependents.
+
+        A step can not start when its resource limit is less than one.
+        '''
+        for step_id, step in list(remaining.items()):
+            if step_id not in remaining:
+                continue
+            limit = self.limits.get(step.resource, self.max_workers)
+            result = self.results[step_id]
+            result.status = FAILED
+            result.error = (f'Could not start; the {step.resource} limit '
+                            f'is {limit}')
+            logger.error('Step %s failed: %s', step_id, result.error)
+            del remaining[step_id]
+            self.skip_dependents(step_id, remaining)
+
+    def run(self)->Dict[str, StepResult]:
+        '''Run all of the steps that are not already complete.
+
+        Returns:
+            Dict[str, StepResult]: The result of each step.
+        '''
+        self.load_state()
+        finished = {step_id for step_id, result in self.results.items()
+                    if result.status == RESUMED}
+        remaining = {step_id: step for step_id, step in self.steps.items()
+                     if step_id not in finished}
+        in_use = {resource: 0 for resource in self.limits}
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while remaining or running:
+                for step_id, step in list(remaining.items()):
+                    if len(running) >= self.max_workers:
+                        break
+                    if not set(step.dependency_ids()) <= finished:
+                        continue
+                    resource = step.resource
+                    if resource is not None:
+                        if in_use.get(resource, 0) >= self.limits.get(
+                                resource, self.max_workers):
+                            continue
+                        in_use[resource] = in_use.get(resource, 0) + 1
+                    logger.info('Starting step %s', step_id)
+                    # Run in a copy of this context to keep the current
+                    # operation.
+                    future = executor.submit(contextvars.copy_context().run,
+                                             self.run_step, step)
+                    running[future] = step
+                    del remaining[step_id]
+                if not running:
+                    # Nothing is running and nothing can start, because a
+                    # resource limit is below one.
+                    self.fail_stranded(remaining)
+                    break
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    step = running.pop(future)
+                    if step.resource is not None:
+                        in_use[step.resource] -= 1
+                    result = future.result()
+                    with self.lock:
+                        self.results[step.step_id] = result
+                    if result.status == DONE:
+                        finished.add(step.step_id)
+                        logger.info('Finished step %s in %.1f s',
+                                    step.step_id, result.duration)
+                        self.save_state()
+                    else:
+                        logger.error('Step %s failed: %s', step.step_id,
+                                     result.error)
+                        self.skip_dependents(step.step_id, remaining)
+        return self.results
+
+    # Reporting
+    @property
+    def failed(self)->List[str]:
+        '''The steps that failed.'''
+        return [step_id for step_id, result in self.results.items()
+                if result.status == FAILED]
+
+    def timings(self)->List[Dict[str, Any]]:
+        '''List the status and timing of each step.
+
+        Returns:
+            List[Dict[str, Any]]: 'Project', 'Step', 'Status', 'Attempts',
+                'Started', 'Seconds' and 'Error' for each step.
+        '''
+        return [{'Project': self.steps[step_id].project,
+                 'Step': self.steps[step_id].name,
+                 'Status': result.status,
+                 'Attempts': result.attempts,
+                 'Started': result.started,
+                 'Seconds': round(result.duration, 2),
+                 'Error': result.error}
+                for step_id, result in self.results.items()]
+
+    def summary(self)->str:
+        '''Describe the status and timing of each step.'''
+        lines = list()
+        for timing in self.timings():
+            line = (f'{timing["Project"]:<20} {timing["Step"]:<12} '
+                    f'{timing["Status"]:<8} {timing["Seconds"]:>8.2f} s')
+            if timing['Error']:
+                line += f'  {timing["Error"]}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def build_projects(projects: List[ProjectSpec], state_file: Path = None,
+                   limits: Dict[str, int] = None, max_workers: int = 4,
+                   retries: int = 1, wheelhouse: Path = None)->BuildRunner:
+    '''Build the environments for several projects concurrently.
+
+    Args:
+        projects (List[ProjectSpec]): The project definitions.
+        state_file (Path, optional): A .json file used to resume an
+            interrupted build.  Default is None.
+        limits (Dict[str, int], optional): The maximum number of 'solver'
+            and 'download' steps at once.  Defaults to DEFAULT_LIMITS.
+        max_workers (int, optional): The maximum number of steps running at
+            once.  Defaults to 4.
+        retries (int, optional): The number of times a failed step is
+            retried.  Defaults to 1.
+        wheelhouse (Path, optional): A folder of wheels shared by the pip
+            installs.  Default is None.
+
+    Returns:
+        BuildRunner: The runner, holding the result of each step.
+    '''
+    steps = list()
+    for project in projects:
+        steps.extend(project_build_steps(project, wheelhouse))
+    runner = BuildRunner(steps, limits, max_workers, retries,
+                         state_file=state_file)
+    runner.run()
+    return runner
+
+
+# %% Main
+def main(args: List[str] = None)->int:
+    '''Build the project environments listed in a project file.'''
+    parser = argparse.ArgumentParser(
+        description='Build several project environments concurrently.')
+    parser.add_argument('project_file', type=Path,
+                        help='A .json file listing the projects to build.')
+    parser.add_argument('--state', type=Path, default=None,
+                        help='A .json file used to resume an interrupted '
+                        'build.  Defaults to <project_file>.state.json.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='The maximum number of steps running at once.')
+    parser.add_argument('--solver-limit', type=int,
+                        default=DEFAULT_LIMITS['solver'],
+                        help='The maximum number of conda create and install '
+                        'steps at once.')
+    parser.add_argument('--download-limit', type=int,
+                        default=DEFAULT_LIMITS['download'],
+                        help='The maximum number of pip install steps at once.')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='The number of times a failed step is retried.')
+    parser.add_argument('--wheelhouse', type=Path, default=None,
+                        help='A folder of wheels shared by the pip installs.')
+    options = parser.parse_args(args)
+    for option in ('workers', 'solver_limit', 'download_limit'):
+        if getattr(options, option) < 1:
+            parser.error(f'--{option.replace("_", "-")} must be at least 1')
+    configure_logging()
+    state_file = options.state
+    if state_file is None:
+        state_file = options.project_file.with_suffix('.state.json')
+    projects = load_projects(options.project_file)
+    runner = build_projects(projects, state_file,
+                            {'solver': options.solver_limit,
+                             'download': options.download_limit},
+                            options.workers, options.retries,
+                            options.wheelhouse)
+    print(runner.summary())
+    return 1 if runner.failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
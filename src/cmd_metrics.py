@@ -0,0 +1,159 @@
+'''Console Command Metrics.
+
+ Collect the measurements recorded for each console command run by
+ `env_tools`, export them as JSON-lines or CSV, and summarize them by
+ operation.
+ '''
+
+# %%  Imports
+from typing import List, Dict, Any
+import csv
+import json
+import math
+import threading
+from pathlib import Path
+from dataclasses import asdict, fields
+
+import env_tools
+from env_tools import CommandRecord
+
+
+# %% Metrics Collector
+class MetricsCollector():
+    '''In-memory collector for console command measurements.
+
+    Collection is off until `enable` is called, so there is no overhead
+    when metrics are not needed.  The collector can also be used as a
+    context manager:
+        with MetricsCollector() as metrics:
+            log_all_envs(env_storage_path)
+        print(metrics.summary())
+
+    Attributes:
+        records (List[CommandRecord]): The collected command measurements.
+    '''
+    def __init__(self):
+        self.records: List[CommandRecord] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, record: CommandRecord):
+        with self.lock:
+            self.records.append(record)
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    @property
+    def enabled(self)->bool:
+        '''True if the collector is receiving command measurements.'''
+        return self in env_tools.command_hooks
+
+    def enable(self):
+        '''Start collecting command measurements.'''
+        if not self.enabled:
+            env_tools.command_hooks.append(self)
+
+    def disable(self):
+        '''Stop collecting command measurements.'''
+        if self.enabled:
+            env_tools.command_hooks.remove(self)
+
+    def clear(self):
+        '''Discard the collected measurements.'''
+        with self.lock:
+            self.records.clear()
+
+    def as_dicts(self)->List[Dict[str, Any]]:
+        '''The collected measurements as a list of dictionaries.
+
+        Returns:
+            List[Dict[str, Any]]: One dictionary for each command.
+        '''
+        with self.lock:
+            return [asdict(record) for record in self.records]
+
+    def to_jsonl(self, file_path: Path):
+        '''Save the measurements as a JSON-lines file.
+
+        Args:
+            file_path (Path): The file to write.
+        '''
+        with Path(file_path).open('w', encoding='utf-8') as file:
+            for record in self.as_dicts():
+                file.write(json.dumps(record))
+                file.write('\n')
+
+    def to_csv(self, file_path: Path):
+        '''Save the measurements as a CSV file.
+
+        Args:
+            file_path (Path): The file to write.
+        '''
+        columns = [column.name for column in fields(CommandRecord)]
+        with Path(file_path).open('w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.as_dicts())
+
+    def summary(self):
+        '''Summarize the command wall times by operation.
+
+        Returns:
+            pd.DataFrame: For each operation, the number of commands, the
+                p50, p95 and maximum wall time, the total wall and CPU time,
+                and the total stdout and stderr bytes.
+        '''
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+        operations: Dict[str, List[CommandRecord]] = {}
+        with self.lock:
+            for record in self.records:
+                operations.setdefault(record.operation, []).append(record)
+        rows = []
+        for operation, records in operations.items():
+            wall_times = sorted(record.wall_time for record in records)
+            cpu_times = [record.cpu_time for record in records
+                         if record.cpu_time is not None]
+            rows.append({
+                'Operation': operation,
+                'Count': len(records),
+                'p50': percentile(wall_times, 50),
+                'p95': percentile(wall_times, 95),
+                'Max': wall_times[-1],
+                'Total': sum(wall_times),
+                'CPU': sum(cpu_times) if cpu_times else None,
+                'Failures': sum(1 for record in records
+                                if record.exit_code != 0),
+                'Stdout Bytes': sum(record.stdout_bytes for record in records),
+                'Stderr Bytes': sum(record.stderr_bytes for record in records)
+                })
+        summary_table = pd.DataFrame(rows)
+        if not summary_table.empty:
+            summary_table.sort_values('Total', ascending=False, inplace=True)
+            summary_table.set_index('Operation', inplace=True)
+        return summary_table
+
+
+def percentile(sorted_values: List[float], percent: float)->float:
+    '''Calculate a percentile using linear interpolation.
+
+    Args:
+        sorted_values (List[float]): The values in ascending order.
+        percent (float): The percentile to calculate (0-100).
+
+    Returns:
+        float: The percentile value, or None if there are no values.
+    '''
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    fraction = position - lower
+    return (sorted_values[lower] * (1 - fraction)
+            + sorted_values[upper] * fraction)
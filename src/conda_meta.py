@@ -0,0 +1,1122 @@
+'''Conda Environment Metadata.
+
+ Read the package records and request history that Conda stores in an
+ environment's `conda-meta` folder and build the explicit spec, *.yml* and
+ history *.json* exports without starting `conda`.
+
+ The Conda environments and the basic `conda info` settings are also found
+ from the files that Conda itself reads: the base installation,
+ `~/.conda/environments.txt` and the `envs_dirs` configuration setting.
+ '''
+
+# %%  Imports
+from typing import List, Dict, Tuple, Union
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+from ast import literal_eval
+from pathlib import Path
+from collections import Counter
+
+
+# %% Type Definitions
+# PackageRecord is the parsed contents of a `conda-meta/<package>.json` file.
+PackageRecord = Dict[str, Union[str, int, list, dict]]
+
+
+# %% Constants
+SPEC_HEADER = '\n'.join([
+    '# This file may be used to create an environment using:',
+    '# $ conda create --name <env> --file <this file>',
+    '# platform: {platform}',
+    ''
+    ])
+
+# The Conda version line added to the explicit spec header by `conda list`.
+CREATED_BY_HEADER = '# created-by: conda {version}\n'
+
+# Anaconda tokens and user names embedded in package URLs.
+URL_TOKEN_PATTERN = re.compile(r'/t/[^/]+')
+URL_AUTH_PATTERN = re.compile(r'^([a-z][a-z0-9.+-]*://)[^/@]+@', re.IGNORECASE)
+
+# Default Conda channels are reported by their canonical name *defaults*.
+DEFAULT_CHANNEL_HOSTS = ('repo.anaconda.com/pkgs/', 'repo.continuum.io/pkgs/')
+
+# Subdirectory names that can appear at the end of a channel URL.
+SUBDIR_PATTERN = re.compile(
+    r'/(noarch|(win|linux|osx|zos)-[a-z0-9_]+)/?$')
+
+# The site-packages folders that record an installed distribution.
+DIST_SUFFIXES = ('.dist-info', '.egg-info')
+
+# Characters that end the package name in a match specification.
+SPEC_NAME_PATTERN = re.compile(r'^([^\s=<>!~\[]+)')
+
+# The key=value options in the brackets of a match specification.
+SPEC_OPTION_PATTERN = re.compile(r'''(\w+)\s*=\s*("[^"]*"|'[^']*'|[^,]*)''')
+
+# The list of environment paths that Conda updates whenever an environment is
+# created or removed.
+ENVIRONMENTS_FILE = Path.home() / '.conda' / 'environments.txt'
+
+# Usual locations of a base installation, checked when no `conda`
+# executable can be found.
+COMMON_BASE_FOLDERS = [
+    Path.home() / name
+    for name in ('anaconda3', 'miniconda3', 'miniforge3', 'mambaforge')
+    ] + [
+    Path(r'C:\ProgramData\Anaconda3'), Path(r'C:\ProgramData\Miniconda3'),
+    Path('/opt/conda'), Path('/opt/anaconda3'), Path('/opt/miniconda3')
+    ]
+
+
+# %% conda-meta readers
+def meta_folder(env_path: Path)->Path:
+    '''Get the `conda-meta` folder for a Conda environment.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Raises:
+        FileNotFoundError: env_path does not contain a `conda-meta` folder.
+
+    Returns:
+        Path: The path to the `conda-meta` folder.
+    '''
+    meta_path = Path(env_path) / 'conda-meta'
+    if not meta_path.is_dir():
+        raise FileNotFoundError(f'No conda-meta folder found in {env_path}')
+    return meta_path
+
+
+def read_package_records(env_path: Path)->List[PackageRecord]:
+    '''Read the package records for all packages installed by Conda.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        List[PackageRecord]: The parsed `conda-meta/*.json` files.
+    '''
+    records = []
+    for record_file in meta_folder(env_path).glob('*.json'):
+        with record_file.open(encoding='utf-8') as file:
+            records.append(json.load(file))
+    return records
+
+
+def spec_name(spec: str)->str:
+    '''Get the package name from a match specification.
+
+    e.g. `conda-forge::numpy>=1.20` -> `numpy`.
+
+    Args:
+        spec (str): A Conda match specification.
+
+    Returns:
+        str: The package name.
+    '''
+    spec = spec.strip().split('::')[-1]
+    found = SPEC_NAME_PATTERN.match(spec)
+    if found:
+        return found.group(1).lower()
+    return spec.lower()
+
+
+def env_form_spec(spec: str)->str:
+    '''Write a match specification the way `conda env export` does.
+
+    The channel is dropped, an exact version is written with a single '=',
+    a version with a wildcard is shortened to its prefix and version ranges
+    are moved into brackets.  e.g. `conda==25.7.0` -> `conda=25.7.0`,
+    `pandas=2.1.*` -> `pandas=2.1` and
+    `numpy >=1.20` -> `numpy[version='>=1.20']`.
+
+    Args:
+        spec (str): A Conda match specification.
+
+    Returns:
+        str: The specification in *environment.yml* form.
+    '''
+    spec = spec.strip().split('::')[-1]
+    options = {}
+    if spec.endswith(']') and '[' in spec:
+        spec, bracket_text = spec[:-1].split('[', 1)
+        for key, value in SPEC_OPTION_PATTERN.findall(bracket_text):
+            options[key] = value.strip('\'"')
+    name = spec_name(spec)
+    rest = spec.strip()[len(name):].strip()
+    version = options.pop('version', None)
+    build = options.pop('build', None)
+    if rest and version is None:
+        if any(char in rest for char in '|,') or ' ' not in rest and (
+                rest[:1] in '<>' or rest[:2] in ('!=', '~=')):
+            version = rest
+        elif not rest.startswith('='):
+            version, _, build = rest.partition(' ')
+        elif rest.startswith('=='):
+            version, _, build = rest[2:].partition('=')
+            version = '==' + version
+        else:
+            version, _, build = rest[1:].partition('=')
+            if not build and not version.endswith('*'):
+                version += '*'
+    if version and version.startswith('==') and version.endswith('*'):
+        version = version[2:]
+    builder = [name]
+    brackets = []
+    exact = False
+    if version:
+        if any(char in version for char in '><$^|,'):
+            brackets.append(f"version='{version}'")
+        elif version[:2] in ('!=', '~='):
+            if build:
+                brackets.append(f"version='{version}'")
+            else:
+                builder.append(version)
+        elif version.endswith('.*'):
+            builder.append('=' + version[:-2])
+        elif version.endswith('*'):
+            builder.append('=' + version[:-1])
+        else:
+            builder.append('=' + version.lstrip('='))
+            exact = True
+    if build:
+        if any(char in build for char in '><$^|,'):
+            brackets.append(f"build='{build}'")
+        elif exact and '*' not in build:
+            builder.append('=' + build)
+        else:
+            brackets.append(f'build={build}')
+    for key, value in options.items():
+        if any(char in value for char in ', ='):
+            brackets.append(f"{key}='{value}'")
+        else:
+            brackets.append(f'{key}={value}')
+    if brackets:
+        builder.append('[{}]'.format(','.join(brackets)))
+    return ''.join(builder)
+
+
+def parse_history_specs(specs_string: str)->List[str]:
+    '''Parse the list of specifications from a history comment line.
+
+    Args:
+        specs_string (str): The text following '# <action> specs:'.
+
+    Returns:
+        List[str]: The match specifications.
+    '''
+    specs_string = specs_string.strip()
+    if specs_string.startswith('['):
+        specs = literal_eval(specs_string)
+    else:
+        # Old history format: comma separated specs with no brackets.
+        specs = [spec.strip() for spec in specs_string.split(',')]
+    return [spec for spec in specs if spec and not spec.endswith('@')]
+
+
+def read_history_specs(env_path: Path,
+                       records: List[PackageRecord] = None)->Dict[str, str]:
+    '''Get the explicitly requested packages from the environment history.
+
+    This follows the same rules as `conda env export --from-history`:
+    requested specs are replaced by later requests for the same package and
+    dropped when the package is removed or is no longer installed.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+        records (List[PackageRecord], optional): The Conda package records for
+            the environment.  If None, they are read from `conda-meta`.
+
+    Returns:
+        Dict[str, str]: The requested match specifications indexed by
+            package name, in the order they were first requested.
+    '''
+    history_file = meta_folder(env_path) / 'history'
+    spec_map = {}
+    if history_file.exists():
+        spec_pattern = re.compile(r'#\s*(\w+)\s*specs:\s*(.+)?')
+        with history_file.open(encoding='utf-8', errors='replace') as file:
+            for line in file:
+                found = spec_pattern.match(line.strip())
+                if not found:
+                    continue
+                action, specs_string = found.groups()
+                specs = parse_history_specs(specs_string or '')
+                if action in ('remove', 'uninstall'):
+                    for spec in specs:
+                        spec_map.pop(spec_name(spec), None)
+                elif action in ('update', 'install', 'create', 'neutered'):
+                    spec_map.update((spec_name(spec), spec) for spec in specs)
+    if records is None:
+        records = read_package_records(env_path)
+    installed = {record['name'] for record in records}
+    return {name: spec for name, spec in spec_map.items() if name in installed}
+
+
+def read_pip_packages(env_path: Path,
+                      records: List[PackageRecord] = None)->Dict[str, str]:
+    '''Find the Python packages that were installed by pip rather than Conda.
+
+    A package is considered to be installed by pip if its *.dist-info* or
+    *.egg-info* folder is not one of the files of a Conda package.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+        records (List[PackageRecord], optional): The Conda package records for
+            the environment.  If None, they are read from `conda-meta`.
+
+    Returns:
+        Dict[str, str]: Package versions indexed by package name.
+    '''
+    if records is None:
+        records = read_package_records(env_path)
+    conda_dist_folders = set()
+    for record in records:
+        for file_name in record.get('files', []):
+            parts = file_name.replace('\\', '/').split('/')
+            for part in parts[:-1]:
+                if part.endswith(DIST_SUFFIXES):
+                    conda_dist_folders.add(part.lower())
+                    break
+    pip_packages = {}
+    for site_packages in find_site_packages(env_path):
+        for dist_folder in site_packages.iterdir():
+            if not dist_folder.name.endswith(DIST_SUFFIXES):
+                continue
+            if dist_folder.name.lower() in conda_dist_folders:
+                continue
+            metadata = read_dist_metadata(dist_folder)
+            if 'Name' in metadata and 'Version' in metadata:
+                pip_packages[metadata['Name'].lower()] = metadata['Version']
+    return pip_packages
+
+
+def find_site_packages(env_path: Path)->List[Path]:
+    '''Find the *site-packages* folders in a Conda environment.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        List[Path]: The Windows (`Lib/site-packages`) or posix
+            (`lib/python*/site-packages`) folders that exist.
+    '''
+    env_path = Path(env_path)
+    candidates = [env_path / 'Lib' / 'site-packages']
+    candidates.extend(env_path.glob('lib/python*/site-packages'))
+    return [folder for folder in candidates if folder.is_dir()]
+
+
+def read_dist_metadata(dist_folder: Path)->Dict[str, str]:
+    '''Read the header fields from a *.dist-info* or *.egg-info* folder.
+
+    Only the header lines are read; the long description is skipped.
+
+    Args:
+        dist_folder (Path): The *.dist-info* or *.egg-info* folder, or an
+            *.egg-info* file.
+
+    Returns:
+        Dict[str, str]: The first value of each header field.
+    '''
+    if dist_folder.is_dir():
+        metadata_file = dist_folder / 'METADATA'
+        if not metadata_file.exists():
+            metadata_file = dist_folder / 'PKG-INFO'
+    else:
+        metadata_file = dist_folder
+    metadata = {}
+    if not metadata_file.exists():
+        return metadata
+    with metadata_file.open(encoding='utf-8', errors='replace') as file:
+        for line in file:
+            if not line.strip():
+                # A blank line ends the header section.
+                break
+            key, sep, value = line.partition(':')
+            if sep and not key.startswith((' ', '\t')):
+                metadata.setdefault(key.strip(), value.strip())
+    return metadata
+
+
+# %% Conda configuration
+def read_config_list(config_file: Path, key: str)->List[str]:
+    '''Read a top-level list setting from a Conda configuration file.
+
+    Only the simple block list form used in `.condarc` files is supported:
+        channels:
+          - conda-forge
+          - defaults
+
+    Args:
+        config_file (Path): The `.condarc` or `config.yaml` file.
+        key (str): The setting name, e.g. 'channels'.
+
+    Returns:
+        List[str]: The list items, or an empty list if the setting is not
+            present.
+    '''
+    items = []
+    if not config_file.is_file():
+        return items
+    in_list = False
+    for line in config_file.read_text(encoding='utf-8').splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        if not line[0].isspace():
+            setting, _, value = line.partition(':')
+            in_list = setting.strip() == key
+            value = value.strip()
+            if in_list and value.startswith('['):
+                # Inline list form: key: [a, b]
+                items.extend(item.strip().strip('\'"')
+                             for item in value.strip('[]').split(',')
+                             if item.strip())
+                in_list = False
+        elif in_list and line.strip().startswith('-'):
+            item = line.strip()[1:].split(' #')[0].strip().strip('\'"')
+            items.append(item)
+    return items
+
+
+def find_root_prefix(env_path: Path)->Path:
+    '''Find the Anaconda base installation that an environment belongs to.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        Path: The base environment path.  If the environment is not inside an
+            `envs` folder of a base installation, env_path is returned.
+    '''
+    env_path = Path(env_path)
+    if env_path.parent.name == 'envs':
+        root = env_path.parent.parent
+        if (root / 'conda-meta').is_dir():
+            return root
+    return env_path
+
+
+def config_files(root_prefix: Path = None, env_path: Path = None)->List[Path]:
+    '''List the Conda configuration files in order of increasing precedence.
+
+    Each configuration folder can contain `.condarc`, `condarc` and
+    `condarc.d/*.yml` or `*.yaml` files.  The folders are searched in the
+    same order as Conda's search path.
+
+    Args:
+        root_prefix (Path, optional): The base environment path.
+        env_path (Path, optional): The path to the target Conda environment,
+            whose configuration files take precedence over the user's.
+
+    Returns:
+        List[Path]: The configuration files that exist.
+    '''
+    if sys.platform.startswith('win'):
+        folders = [Path('C:/ProgramData/conda')]
+    else:
+        folders = [Path('/etc/conda'), Path('/var/lib/conda')]
+    if root_prefix:
+        folders.append(Path(root_prefix))
+    home = Path.home()
+    if os.environ.get('XDG_CONFIG_HOME'):
+        folders.append(Path(os.environ['XDG_CONFIG_HOME']) / 'conda')
+    folders.extend([home / '.config' / 'conda', home / '.conda'])
+    # ~/.condarc comes after the user folders and before the environment.
+    folders.append(home / '.condarc')
+    if env_path:
+        folders.append(Path(env_path))
+    candidates = []
+    for folder in folders:
+        if folder.name == '.condarc':
+            candidates.append(folder)
+            continue
+        candidates.extend([folder / '.condarc', folder / 'condarc'])
+        config_folder = folder / 'condarc.d'
+        if config_folder.is_dir():
+            candidates.extend(sorted(config_folder.glob('*.y*ml')))
+    if os.environ.get('CONDARC'):
+        candidates.append(Path(os.environ['CONDARC']))
+    unique = {}
+    for file in candidates:
+        if file.is_file():
+            unique.setdefault(path_key(file), file)
+    return list(unique.values())
+
+
+def read_config_setting(key: str, root_prefix: Path = None,
+                        env_path: Path = None)->List[str]:
+    '''Get a list setting from the Conda configuration files.
+
+    As in Conda, the lists from all of the configuration files that define
+    the setting are combined, with the items from higher precedence files
+    first and duplicates removed.
+
+    Args:
+        key (str): The setting name, e.g. 'envs_dirs'.
+        root_prefix (Path, optional): The base environment path.
+        env_path (Path, optional): The path to the target Conda environment.
+
+    Returns:
+        List[str]: The configured items, or an empty list if the setting is
+            not configured.
+    '''
+    items = {}
+    for config_file in reversed(config_files(root_prefix, env_path)):
+        items.update(dict.fromkeys(read_config_list(config_file, key)))
+    return list(items)
+
+
+def read_channels(root_prefix: Path = None, env_path: Path = None)->List[str]:
+    '''Get the configured Conda channels.
+
+    Args:
+        root_prefix (Path, optional): The base environment path.
+        env_path (Path, optional): The path to the target Conda environment.
+
+    Returns:
+        List[str]: The configured channels.  Defaults to ['defaults'].
+    '''
+    channels = read_config_setting('channels', root_prefix, env_path)
+    if not channels:
+        channels = ['defaults']
+    return channels
+
+
+# %% Export builders
+def canonical_channel(channel: str)->str:
+    '''Convert a package record channel URL to the channel's canonical name.
+
+    e.g. 'https://conda.anaconda.org/conda-forge/win-64' -> 'conda-forge'
+
+    Args:
+        channel (str): The channel recorded in the package record.
+
+    Returns:
+        str: The canonical channel name.
+    '''
+    if any(host in channel for host in DEFAULT_CHANNEL_HOSTS):
+        return 'defaults'
+    channel = SUBDIR_PATTERN.sub('', channel.rstrip('/'))
+    for host in ('https://conda.anaconda.org/', 'http://conda.anaconda.org/'):
+        if channel.startswith(host):
+            return channel[len(host):]
+    return channel
+
+
+def record_platform(records: List[PackageRecord])->str:
+    '''Determine the Conda platform (subdir) of an environment.
+
+    Args:
+        records (List[PackageRecord]): The environment's package records.
+
+    Returns:
+        str: The most common non-noarch subdir, or the platform of the current
+            interpreter if there are no platform specific packages.
+    '''
+    subdirs = Counter(record.get('subdir') for record in records
+                      if record.get('subdir') not in (None, 'noarch'))
+    if subdirs:
+        return subdirs.most_common(1)[0][0]
+    if sys.platform.startswith('win'):
+        return 'win-64'
+    if sys.platform == 'darwin':
+        return 'osx-64'
+    return 'linux-64'
+
+
+def record_dist(record: PackageRecord)->str:
+    '''Build the Conda distribution name of a package record.
+
+    e.g. 'defaults/linux-64::python-3.11.5-h955ad1f_0'
+
+    Args:
+        record (PackageRecord): The package record.
+
+    Returns:
+        str: The channel, subdir, name, version and build of the package.
+    '''
+    subdir = record.get('subdir')
+    subdir = f'/{subdir}' if subdir else ''
+    channel = canonical_channel(record.get('channel', ''))
+    return (f'{channel}{subdir}::{record["name"]}-{record.get("version")}'
+            f'-{record.get("build")}')
+
+
+def sort_records(records: List[PackageRecord])->List[PackageRecord]:
+    '''Sort package records in dependency order.
+
+    Follows the `PrefixGraph` ordering that `conda list --explicit` uses:
+    packages that are not connected to any other package come first, sorted
+    by name, followed by each level of packages whose dependencies are
+    already listed, sorted by name.  As in Conda, *pip* is not treated as a
+    dependency of *python*, *menuinst* is placed ahead of every package that
+    depends on *python* and, on Windows, *conda* is placed ahead of the
+    noarch python packages.  A dependency cycle is broken by listing the
+    package with the fewest unlisted dependencies.
+
+    Args:
+        records (List[PackageRecord]): The environment's package records.
+
+    Returns:
+        List[PackageRecord]: The sorted package records.
+    '''
+    by_name = {record['name']: record for record in records}
+    graph = {}
+    for name, record in by_name.items():
+        depends = {spec_name(dep) for dep in record.get('depends', [])}
+        graph[name] = {dep for dep in depends if dep in by_name}
+    if 'python' in graph:
+        graph['python'].discard('pip')
+        if 'menuinst' in graph:
+            for name, parents in graph.items():
+                if 'python' in parents and name not in graph['menuinst']:
+                    parents.add('menuinst')
+    if sys.platform.startswith('win') and 'conda' in graph:
+        for name, parents in graph.items():
+            record = by_name[name]
+            noarch_python = (record.get('noarch') == 'python' or
+                             record.get('package_type') == 'noarch_python')
+            if noarch_python and name not in graph['conda']:
+                parents.add('conda')
+    for name, parents in graph.items():
+        parents.discard(name)
+
+    all_parents = set().union(*graph.values())
+    ordered = sorted(name for name, parents in graph.items()
+                     if not parents and name not in all_parents)
+    while graph:
+        level = sorted(name for name, parents in graph.items() if not parents)
+        if not level:
+            # Dependency cycle; list the package with the fewest parents.
+            level = [min(graph, key=lambda name: (len(graph[name]),
+                                                  record_dist(by_name[name])))]
+        for name in level:
+            del graph[name]
+        for parents in graph.values():
+            parents.difference_update(level)
+        ordered.extend(level)
+    return [by_name[name] for name in dict.fromkeys(ordered)]
+
+
+def strip_url_auth(url: str)->str:
+    '''Remove user names, passwords and Anaconda tokens from a package URL.
+
+    Args:
+        url (str): The package URL.
+
+    Returns:
+        str: The URL as written by `conda list --explicit`.
+    '''
+    return URL_AUTH_PATTERN.sub(r'\1', URL_TOKEN_PATTERN.sub('', url, count=1))
+
+
+def build_spec_text(records: List[PackageRecord],
+                    conda_version: str = None)->str:
+    '''Build the text of an explicit spec file.
+
+    Equivalent to `conda list --explicit`.
+
+    Args:
+        records (List[PackageRecord]): The environment's package records.
+        conda_version (str, optional): The version of Conda in the base
+            environment, reported in the *created-by* header line.  If None,
+            the line is left out.
+
+    Returns:
+        str: The explicit spec file text.
+    '''
+    lines = [SPEC_HEADER.format(platform=record_platform(records))]
+    if conda_version:
+        lines.append(CREATED_BY_HEADER.format(version=conda_version))
+    lines.append('@EXPLICIT\n')
+    for record in sort_records(records):
+        url = record.get('url')
+        if not url or url.startswith('<unknown>'):
+            lines.append(f'# no URL for: {record.get("fn")}\n')
+        else:
+            lines.append(f'{strip_url_auth(url)}\n')
+    return ''.join(lines)
+
+
+def yaml_scalar(value: str)->str:
+    '''Quote a string for a yaml file if required.
+
+    Args:
+        value (str): The string to include in the yaml file.
+
+    Returns:
+        str: The string, single quoted if it contains yaml syntax characters.
+    '''
+    needs_quotes = (': ' in value or ' #' in value or value.endswith(':')
+                    or value[:1] in '!&*{}[],#|>@`"\'%-?' or value != value.strip())
+    if value and needs_quotes:
+        value = value.replace("'", "''")
+        return f"'{value}'"
+    return value
+
+
+def build_yml_text(env_name: str, env_path: Path,
+                   records: List[PackageRecord],
+                   pip_packages: Dict[str, str],
+                   channels: List[str])->str:
+    '''Build the text of an environment *.yml* file.
+
+    Equivalent to `conda env export`.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+        env_path (Path): The path to the Conda environment.
+        records (List[PackageRecord]): The environment's package records.
+        pip_packages (Dict[str, str]): Pip installed package versions indexed
+            by package name.
+        channels (List[str]): The configured Conda channels.  The channels of
+            the installed packages are listed ahead of them, as
+            `conda env export` does.
+
+    Returns:
+        str: The *.yml* file text.
+    '''
+    conda_records = sorted((record for record in records
+                            if record.get('channel') != 'pypi'),
+                           key=lambda record: record['name'])
+    record_channels = [canonical_channel(record.get('channel', ''))
+                       for record in conda_records]
+    channels = dict.fromkeys(channel for channel in record_channels + channels
+                             if channel and channel != '<unknown>')
+    lines = [f'name: {yaml_scalar(env_name)}']
+    if channels:
+        lines.append('channels:')
+        lines.extend(f'  - {yaml_scalar(channel)}' for channel in channels)
+    if conda_records or pip_packages:
+        lines.append('dependencies:')
+    lines.extend('  - ' + '='.join([record['name'], record['version'],
+                                   record['build']])
+                 for record in conda_records)
+    if pip_packages:
+        lines.append('  - pip:')
+        lines.extend(f'      - {name}=={version}'
+                     for name, version in sorted(pip_packages.items()))
+    env_vars = read_env_vars(env_path)
+    if env_vars:
+        lines.append('variables:')
+        lines.extend(f'  {name}: {yaml_scalar(value)}'
+                     for name, value in env_vars.items())
+    lines.append(f'prefix: {yaml_scalar(str(env_path))}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def build_history_text(env_name: str, env_path: Path,
+                       records: List[PackageRecord],
+                       history_specs: Dict[str, str],
+                       channels: List[str])->str:
+    '''Build the text of an environment history *.json* file.
+
+    Equivalent to `conda env export --from-history --json`.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+        env_path (Path): The path to the Conda environment.
+        records (List[PackageRecord]): The environment's package records,
+            listed in place of the requested specifications if there are
+            none.
+        history_specs (Dict[str, str]): The requested match specifications
+            indexed by package name.
+        channels (List[str]): The configured Conda channels.
+
+    Returns:
+        str: The *.json* file text.
+    '''
+    if history_specs:
+        dependencies = [env_form_spec(spec) for spec in history_specs.values()]
+    else:
+        # Conda lists every installed package when there is no history.
+        dependencies = ['{name}=={version}={build}'.format(**record)
+                        for record in records]
+    history = {'name': env_name}
+    if channels:
+        history['channels'] = list(channels)
+    if dependencies:
+        history['dependencies'] = dependencies
+    env_vars = read_env_vars(env_path)
+    if env_vars:
+        history['variables'] = env_vars
+    history['prefix'] = str(env_path)
+    return json.dumps(history, indent=2, ensure_ascii=False) + '\n'
+
+
+def read_env_vars(env_path: Path)->Dict[str, str]:
+    '''Read environment variables set with `conda env config vars`.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        Dict[str, str]: The environment variables.
+    '''
+    state_file = Path(env_path) / 'conda-meta' / 'state'
+    if not state_file.is_file():
+        return {}
+    state = json.loads(state_file.read_text(encoding='utf-8'))
+    return state.get('env_vars', {})
+
+
+def export_env_specs(env_name: str, env_path: Path, spec: bool = True,
+                     yml: bool = True, history: bool = True)->Dict[str, str]:
+    '''Build the spec, *.yml* and history *.json* exports for an environment.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+        env_path (Path): The path to the Conda environment.
+        spec (bool, optional): Build the explicit spec text. Defaults to True.
+        yml (bool, optional): Build the *.yml* text. Defaults to True.
+        history (bool, optional): Build the history *.json* text.
+            Defaults to True.
+
+    Raises:
+        FileNotFoundError: env_path does not contain a `conda-meta` folder.
+
+    Returns:
+        Dict[str, str]: The export text for each of 'spec', 'yml' and
+            'history' requested.
+    '''
+    env_path = Path(env_path)
+    records = read_package_records(env_path)
+    root_prefix = find_root_prefix(env_path)
+    channels = read_channels(root_prefix, env_path)
+    exports = {}
+    if spec:
+        conda_record = find_package_record(root_prefix, 'conda')
+        exports['spec'] = build_spec_text(records,
+                                          conda_record.get('version'))
+    if yml:
+        pip_packages = read_pip_packages(env_path, records)
+        exports['yml'] = build_yml_text(env_name, env_path, records,
+                                        pip_packages, channels)
+    if history:
+        history_specs = read_history_specs(env_path, records)
+        exports['history'] = build_history_text(env_name, env_path, records,
+                                                history_specs, channels)
+    return exports
+
+
+# %% Environment fingerprint
+def env_fingerprint(env_path: Path)->str:
+    '''Generate a fingerprint that changes when an environment is modified.
+
+    The fingerprint combines the name, size and modification time of every
+    file in the `conda-meta` folder with a hash of the `conda-meta/history`
+    file.  Conda updates these files on every install, update or removal.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Raises:
+        FileNotFoundError: env_path does not contain a `conda-meta` folder.
+
+    Returns:
+        str: A hexadecimal sha256 fingerprint.
+    '''
+    meta_path = meta_folder(env_path)
+    fingerprint = hashlib.sha256()
+    with os.scandir(meta_path) as entries:
+        file_stats = sorted((entry.name, entry.stat().st_mtime_ns,
+                             entry.stat().st_size)
+                            for entry in entries if entry.is_file())
+    for name, mtime, size in file_stats:
+        fingerprint.update(f'{name}|{mtime}|{size}\n'.encode('utf-8'))
+    history_file = meta_path / 'history'
+    if history_file.is_file():
+        fingerprint.update(hashlib.sha256(history_file.read_bytes()).digest())
+    return fingerprint.hexdigest()
+
+
+# %% Environment discovery
+def path_key(path: Path)->str:
+    '''Normalize a path for comparison (case-insensitive on Windows).'''
+    return os.path.normcase(os.path.normpath(str(path)))
+
+
+def expand_path(path_text: str)->Path:
+    '''Expand `~` and environment variables in a configured path.'''
+    return Path(os.path.expandvars(os.path.expanduser(path_text.strip())))
+
+
+def is_conda_env(env_path: Path)->bool:
+    '''Check whether a folder is a Conda environment.
+
+    Args:
+        env_path (Path): The folder to check.
+
+    Returns:
+        bool: True if the folder contains a `conda-meta/history` file, which
+            is the test Conda itself uses.
+    '''
+    return os.path.isfile(os.path.join(env_path, 'conda-meta', 'history'))
+
+
+def is_base_prefix(prefix: Path)->bool:
+    '''Check whether a folder is a Conda base installation.
+
+    Args:
+        prefix (Path): The folder to check.
+
+    Returns:
+        bool: True if the folder is a Conda environment containing the
+            `conda` package or the `condabin` folder.
+    '''
+    prefix = Path(prefix)
+    if not is_conda_env(prefix):
+        return False
+    if (prefix / 'condabin').is_dir():
+        return True
+    return any((prefix / 'conda-meta').glob('conda-[0-9]*.json'))
+
+
+def find_base_prefix()->Union[Path, None]:
+    '''Find the Conda base installation without starting `conda`.
+
+    The `CONDA_EXE` and `CONDA_PREFIX` environment variables (set by an
+    activated shell) are checked first, followed by the `conda` executable
+    on the PATH and the usual installation folders.
+
+    Returns:
+        Union[Path, None]: The base environment path, or None if no base
+            installation is found.
+    '''
+    candidates = []
+    conda_exe = os.environ.get('CONDA_EXE')
+    if conda_exe:
+        # <root>/bin/conda or <root>\Scripts\conda.exe
+        candidates.append(Path(conda_exe).parent.parent)
+    conda_prefix = os.environ.get('CONDA_PREFIX')
+    if conda_prefix:
+        candidates.append(find_root_prefix(Path(conda_prefix)))
+    conda_command = shutil.which('conda')
+    if conda_command:
+        # <root>/bin/conda, <root>/condabin/conda or <root>\condabin\conda.bat
+        candidates.append(Path(conda_command).resolve().parent.parent)
+    candidates.extend(COMMON_BASE_FOLDERS)
+    for candidate in candidates:
+        if is_base_prefix(candidate):
+            return candidate
+    return None
+
+
+def configured_dirs(key: str, variables: List[str], root_prefix: Path,
+                    subfolder: str)->List[Path]:
+    '''Get a Conda folder list setting together with its default folders.
+
+    Args:
+        key (str): The configuration setting, e.g. 'envs_dirs'.
+        variables (List[str]): Environment variables that override the
+            configuration files, e.g. ['CONDA_ENVS_DIRS'].
+        root_prefix (Path): The base environment path.
+        subfolder (str): The default folder name below the base installation
+            and `~/.conda`, e.g. 'envs'.
+
+    Returns:
+        List[Path]: The configured folders followed by the default folders,
+            without duplicates.
+    '''
+    configured = []
+    for variable in variables:
+        if os.environ.get(variable):
+            configured = os.environ[variable].split(os.pathsep)
+            break
+    else:
+        configured = read_config_setting(key, root_prefix)
+    folders = [expand_path(folder) for folder in configured if folder.strip()]
+    root_folder = Path(root_prefix) / subfolder
+    user_folder = Path.home() / '.conda' / subfolder
+    # Conda prefers the user folder when the base installation is read only.
+    if os.access(root_prefix, os.W_OK):
+        folders.extend([root_folder, user_folder])
+    else:
+        folders.extend([user_folder, root_folder])
+    if sys.platform.startswith('win') and os.environ.get('LOCALAPPDATA'):
+        folders.append(Path(os.environ['LOCALAPPDATA']) / 'conda' / 'conda' /
+                       subfolder)
+    unique = {}
+    for folder in folders:
+        unique.setdefault(path_key(folder), folder)
+    return list(unique.values())
+
+
+def read_envs_dirs(root_prefix: Path)->List[Path]:
+    '''Get the folders searched for named Conda environments.
+
+    Args:
+        root_prefix (Path): The base environment path.
+
+    Returns:
+        List[Path]: The *envs_dirs* folders in order of precedence.
+    '''
+    return configured_dirs('envs_dirs', ['CONDA_ENVS_DIRS', 'CONDA_ENVS_PATH'],
+                           root_prefix, 'envs')
+
+
+def read_pkgs_dirs(root_prefix: Path)->List[Path]:
+    '''Get the Conda package cache folders.
+
+    Args:
+        root_prefix (Path): The base environment path.
+
+    Returns:
+        List[Path]: The *pkgs_dirs* folders in order of precedence.
+    '''
+    return configured_dirs('pkgs_dirs', ['CONDA_PKGS_DIRS'], root_prefix,
+                           'pkgs')
+
+
+def read_environments_file(environments_file: Path = ENVIRONMENTS_FILE
+                           )->List[Path]:
+    '''Read the environment paths registered in `~/.conda/environments.txt`.
+
+    Args:
+        environments_file (Path, optional): The registration file.  Defaults
+            to ENVIRONMENTS_FILE.
+
+    Returns:
+        List[Path]: The registered paths.  Paths of removed environments may
+            be included.
+    '''
+    if not environments_file.is_file():
+        return []
+    lines = environments_file.read_text(encoding='utf-8',
+                                        errors='replace').splitlines()
+    return [Path(line.strip()) for line in lines
+            if line.strip() and not line.lstrip().startswith('#')]
+
+
+def discover_environments(root_prefix: Path = None)->List[Tuple[str, Path]]:
+    '''List the Conda environments without starting `conda`.
+
+    The base installation, the sub-folders of each *envs_dirs* folder and the
+    paths in `~/.conda/environments.txt` are checked, and every folder that
+    is a Conda environment (see is_conda_env) is reported.  An environment
+    is named after its folder if it is in one of the *envs_dirs* folders.
+    As with `conda env list`, environments elsewhere have no name; since
+    they cannot be activated by name they are not included.
+
+    Args:
+        root_prefix (Path, optional): The base environment path.  If None,
+            the base installation is found with find_base_prefix.
+
+    Raises:
+        FileNotFoundError: No Conda base installation was found.
+
+    Returns:
+        List[Tuple[str, Path]]: The name and path of each environment, with
+            *base* first and the others sorted by name.
+    '''
+    if root_prefix is None:
+        root_prefix = find_base_prefix()
+        if root_prefix is None:
+            raise FileNotFoundError('No Conda base installation found')
+    root_prefix = Path(root_prefix)
+    envs_dirs = read_envs_dirs(root_prefix)
+    envs_dir_keys = {path_key(folder) for folder in envs_dirs}
+    # Paths are handled as strings here since Path operations dominate the
+    # time taken for hundreds of environments.  Earlier envs_dirs take
+    # precedence for duplicate names, as they do for `conda activate`.
+    candidates = []
+    for envs_dir in envs_dirs:
+        try:
+            with os.scandir(envs_dir) as entries:
+                candidates.extend(sorted(entry.path for entry in entries
+                                         if entry.is_dir()))
+        except OSError:
+            continue
+    candidates.extend(str(env_path) for env_path in read_environments_file())
+    root_key = path_key(root_prefix)
+    environments = {}
+    names = {'base'}
+    for env_path in candidates:
+        key = path_key(env_path)
+        if key in environments or key == root_key:
+            continue
+        parent, env_name = os.path.split(os.path.normpath(env_path))
+        if path_key(parent) not in envs_dir_keys:
+            continue
+        if env_name in names or not is_conda_env(env_path):
+            continue
+        names.add(env_name)
+        environments[key] = (env_name, Path(env_path))
+    others = sorted(environments.values(), key=lambda env: env[0].lower())
+    return [('base', root_prefix)] + others
+
+
+def find_package_record(env_path: Path, package_name: str)->PackageRecord:
+    '''Read the package record for one installed Conda package.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+        package_name (str): The package name, e.g. 'python'.
+
+    Returns:
+        PackageRecord: The parsed `conda-meta` record, or an empty dictionary
+            if the package is not installed.
+    '''
+    pattern = f'{package_name}-[0-9]*.json'
+    for record_file in meta_folder(env_path).glob(pattern):
+        with record_file.open(encoding='utf-8') as file:
+            record = json.load(file)
+        if record.get('name') == package_name:
+            return record
+    return {}
+
+
+def read_conda_info(env_path: Path = None,
+                    root_prefix: Path = None)->dict:
+    '''Build the main `conda info --envs --json` settings without starting
+    `conda`.
+
+    Channels are reported as configured rather than expanded to URLs.
+
+    Args:
+        env_path (Path, optional): The path to the active Conda environment.
+            If None, the base environment is active.
+        root_prefix (Path, optional): The base environment path.  If None,
+            the base installation is found with find_base_prefix.
+
+    Raises:
+        FileNotFoundError: No Conda base installation was found.
+
+    Returns:
+        dict: The Conda settings, using the `conda info --json` keys.
+    '''
+    if root_prefix is None:
+        root_prefix = find_base_prefix()
+        if root_prefix is None:
+            raise FileNotFoundError('No Conda base installation found')
+    root_prefix = Path(root_prefix)
+    environments = discover_environments(root_prefix)
+    active_prefix = Path(env_path) if env_path else root_prefix
+    env_names = {path_key(path): name for name, path in environments}
+    conda_record = find_package_record(root_prefix, 'conda')
+    python_record = find_package_record(root_prefix, 'python')
+    return {
+        'active_prefix': str(active_prefix),
+        'active_prefix_name': env_names.get(path_key(active_prefix),
+                                            str(active_prefix)),
+        'channels': read_channels(root_prefix, active_prefix),
+        'conda_prefix': str(root_prefix),
+        'conda_version': conda_record.get('version', ''),
+        'config_files': [str(file) for file
+                         in config_files(root_prefix, active_prefix)],
+        'default_prefix': str(active_prefix),
+        'envs': [str(path) for _, path in environments],
+        'envs_dirs': [str(folder) for folder in read_envs_dirs(root_prefix)],
+        'pkgs_dirs': [str(folder) for folder in read_pkgs_dirs(root_prefix)],
+        'platform': record_platform([python_record] if python_record else []),
+        'python_version': python_record.get('version', ''),
+        'root_prefix': str(root_prefix),
+        'root_writable': os.access(root_prefix, os.W_OK)
+        }
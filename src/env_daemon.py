@@ -0,0 +1,511 @@
+'''Environment Information Service.
+
+ An optional long-running service that keeps the environment registry,
+ `conda info` output, package lists, import indexes and snapshot manifests
+ in memory and answers queries over a local Unix socket.  Each
+ environment's `conda-meta` folder and site-packages distributions are
+ polled, and the cached information for an environment is dropped as soon
+ as they change.
+
+ Start the service with:
+    python env_daemon.py serve
+
+ Scripts use `EnvClient`, which sends queries to the service when it is
+ running and otherwise answers them directly:
+    client = EnvClient()
+    client.list_environments()
+    client.packages('Standard')
+ '''
+
+# %%  Imports
+from typing import Any, Dict, List, Tuple
+from pathlib import Path
+import os
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+from env_tools import ProjectException, MissingEnvironment
+from env_tools import EnvironmentRegistry, FullEnvRef, get_conda_info
+from env_tools import read_snapshot_manifest, configure_logging
+from conda_meta import read_package_records, read_pip_packages
+from conda_meta import find_site_packages, DIST_SUFFIXES, ENVIRONMENTS_FILE
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+DEFAULT_SOCKET = Path.home() / '.cache' / 'env_tools' / 'env_tools.sock'
+
+# Seconds between checks for changed environments.
+POLL_INTERVAL = 2.0
+
+# Seconds the client waits for the service.
+CLIENT_TIMEOUT = 30.0
+
+# The package record fields returned by `packages`.
+PACKAGE_FIELDS = ('name', 'version', 'build', 'channel')
+
+
+# %% Cached state
+def meta_signature(env_path: Path)->Tuple:
+    '''Get a cheap signature that changes when an environment is modified.
+
+    Conda adds or removes `conda-meta` records and appends to
+    `conda-meta/history` on every change.  pip does not update `conda-meta`,
+    so the *.dist-info* and *.egg-info* entries in site-packages are
+    included as well.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        Tuple: The modification times of `conda-meta` and the history file,
+            the size of the history file and the name and modification time
+            of each site-packages distribution entry.  Empty if the
+            environment does not exist.
+    '''
+    meta_path = Path(env_path) / 'conda-meta'
+    try:
+        meta_stat = meta_path.stat()
+    except OSError:
+        return ()
+    try:
+        history_stat = (meta_path / 'history').stat()
+        signature = (meta_stat.st_mtime_ns, history_stat.st_mtime_ns,
+                     history_stat.st_size)
+    except OSError:
+        signature = (meta_stat.st_mtime_ns,)
+    for site_packages in find_site_packages(env_path):
+        try:
+            with os.scandir(site_packages) as entries:
+                signature += tuple(sorted(
+                    (entry.name, entry.stat().st_mtime_ns)
+                    for entry in entries
+                    if entry.name.endswith(DIST_SUFFIXES)))
+        except OSError:
+            continue
+    return signature
+
+
+def path_signature(path: Path)->Tuple:
+    '''Get the modification time and size of a file or folder.'''
+    try:
+        path_stat = Path(path).stat()
+    except OSError:
+        return ()
+    return (path_stat.st_mtime_ns, path_stat.st_size)
+
+
+class EnvironmentState():
+    '''Cached answers to environment queries.
+
+    Used by the service to keep answers in memory, and by `EnvClient` to
+    answer queries directly when the service is not running.
+
+    Attributes:
+        registry (EnvironmentRegistry): The environment list.  It does not
+            expire; it is invalidated when an environment is added or
+            removed.
+        cache (Dict[Tuple[str, str], Any]): Cached answers by query and
+            environment path.
+        signatures (Dict[str, Tuple]): The `conda-meta` signature of each
+            environment when its answers were cached.
+    '''
+    def __init__(self):
+        self.registry = EnvironmentRegistry(ttl=None)
+        self.cache: Dict[Tuple[str, str], Any] = dict()
+        self.signatures: Dict[str, Tuple] = dict()
+        self.list_signature: Tuple = ()
+        self.lock = threading.RLock()
+        self.import_index = None
+
+    # Invalidation
+    def environment_folders(self)->List[Path]:
+        '''The folders whose contents change when environments are added.'''
+        folders = {Path(env_path).parent
+                   for _, env_path in self.registry.env_list}
+        return sorted(folders) + [ENVIRONMENTS_FILE]
+
+    def invalidate(self, env_path: str = None):
+        '''Drop cached answers.
+
+        Args:
+            env_path (str, optional): Drop only the answers for this
+                environment.  If None, drop everything.
+        '''
+        with self.lock:
+            if env_path is None:
+                self.registry.invalidate()
+                self.cache.clear()
+                self.signatures.clear()
+                return
+            env_path = str(env_path)
+            for key in [key for key in self.cache if key[1] == env_path]:
+                del self.cache[key]
+            self.signatures.pop(env_path, None)
+
+    def check_for_changes(self)->List[str]:
+        '''Drop the answers for environments that have changed.
+
+        Returns:
+            List[str]: The paths of the changed environments.
+        '''
+        changed = list()
+        with self.lock:
+            list_signature = tuple(path_signature(folder)
+                                   for folder in self.environment_folders())
+            if list_signature != self.list_signature:
+                if self.list_signature:
+                    logger.info('Environment list changed')
+                    self.registry.invalidate()
+                self.list_signature = list_signature
+            for env_path, signature in list(self.signatures.items()):
+                if meta_signature(env_path) != signature:
+                    logger.info('Environment %s changed', env_path)
+                    self.invalidate(env_path)
+                    changed.append(env_path)
+        return changed
+
+    def cached(self, query: str, env_path: Path, build)->Any:
+        '''Get a cached answer, building it if necessary.
+
+        Args:
+            query (str): The query name.
+            env_path (Path): The environment the answer is for.
+            build (Callable[[], Any]): Builds the answer.
+
+        Returns:
+            Any: The answer.
+        '''
+        key = (query, str(env_path))
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+            signature = meta_signature(env_path)
+        answer = build()
+        with self.lock:
+            self.cache[key] = answer
+            self.signatures.setdefault(str(env_path), signature)
+        return answer
+
+    # Queries
+    def list_environments(self, refresh: bool = False)->List[List[str]]:
+        '''The name and path of each environment.'''
+        return [[env_name, str(env_path)] for env_name, env_path
+                in self.registry.environments(refresh)]
+
+    def lookup(self, env: str)->FullEnvRef:
+        '''Find an environment by name or path.'''
+        return self.registry.lookup(env)
+
+    def info(self, env: str = None)->Dict[str, Any]:
+        '''The `conda info` output for an environment (default *base*).'''
+        # None is looked up as 'base', so both share one cached answer.
+        env_name, env_path = self.lookup(env or 'base')
+        return self.cached('info', env_path,
+                           lambda: get_conda_info(env_name))
+
+    def packages(self, env: str)->Dict[str, Any]:
+        '''The Conda and pip packages installed in an environment.'''
+        env_path = self.lookup(env)[1]
+
+        def build_packages():
+            records = read_package_records(env_path)
+            conda_packages = sorted(
+                ({field: record.get(field, '') for field in PACKAGE_FIELDS}
+                 for record in records), key=lambda package: package['name'])
+            return {'conda': conda_packages,
+                    'pip': read_pip_packages(env_path, records)}
+
+        return self.cached('packages', env_path, build_packages)
+
+    def imports(self, env: str)->Dict[str, List[List[str]]]:
+        '''The distributions providing each import name in an environment.'''
+        env_path = self.lookup(env)[1]
+        with self.lock:
+            if self.import_index is None:
+                # Imported here to keep the client start-up time short.
+                from import_index import ImportIndex  # pylint: disable=import-outside-toplevel
+                self.import_index = ImportIndex()
+        return self.cached(
+            'imports', env_path,
+            lambda: {name: [list(provider) for provider in providers]
+                     for name, providers in
+                     self.import_index.env_index(env_path).items()})
+
+    def manifest(self, manifest_file: str)->Dict[str, Any]:
+        '''A snapshot manifest, cached until the file changes.'''
+        manifest_path = Path(manifest_file)
+        key = ('manifest', str(manifest_path))
+        signature = path_signature(manifest_path)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        manifest = read_snapshot_manifest(manifest_path)
+        with self.lock:
+            self.cache[key] = (signature, manifest)
+        return manifest
+
+    def stats(self)->Dict[str, Any]:
+        '''Describe the cached answers.'''
+        with self.lock:
+            queries = dict()
+            for query, _ in self.cache:
+                queries[query] = queries.get(query, 0) + 1
+            return {'environments': len(self.registry.env_list),
+                    'cached': queries, 'watched': len(self.signatures),
+                    'pid': os.getpid()}
+
+    def handle(self, method: str, params: Dict[str, Any])->Any:
+        '''Answer a query.
+
+        Args:
+            method (str): The query name.
+            params (Dict[str, Any]): The query arguments.
+
+        Raises:
+            ValueError: The query name is not known.
+
+        Returns:
+            Any: The answer.
+        '''
+        queries = {'list': self.list_environments, 'lookup': self.lookup,
+                   'info': self.info, 'packages': self.packages,
+                   'imports': self.imports, 'manifest': self.manifest,
+                   'invalidate': self.invalidate, 'stats': self.stats,
+                   'ping': lambda: 'pong'}
+        if method not in queries:
+            raise ValueError(f'Unknown query: {method}')
+        return queries[method](**params)
+
+
+# %% Service
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''Answer newline delimited JSON queries on one connection.'''
+    def handle(self):
+        state: EnvironmentState = self.server.state
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                method = request.get('method', '')
+                if method == 'shutdown':
+                    response = {'ok': True, 'result': None}
+                    threading.Thread(target=self.server.shutdown,
+                                     daemon=True).start()
+                else:
+                    result = state.handle(method, request.get('params', {}))
+                    response = {'ok': True, 'result': result}
+            except (ProjectException, ValueError, TypeError, OSError) as err:
+                response = {'ok': False, 'error': str(err),
+                            'type': type(err).__name__}
+            self.wfile.write(json.dumps(response, default=str).encode('utf-8')
+                             + b'\n')
+            self.wfile.flush()
+
+
+def watch_environments(state: EnvironmentState, stop: threading.Event,
+                       poll_interval: float = POLL_INTERVAL):
+    '''Poll the environments for changes until stopped.'''
+    while not stop.wait(poll_interval):
+        try:
+            state.check_for_changes()
+        except OSError as err:
+            logger.warning('Unable to check environments: %s', err)
+
+
+def serve(socket_path: Path = DEFAULT_SOCKET,
+          poll_interval: float = POLL_INTERVAL):
+    '''Run the service until it is shut down.
+
+    Args:
+        socket_path (Path, optional): The Unix socket to listen on.
+            Defaults to DEFAULT_SOCKET.
+        poll_interval (float, optional): Seconds between checks for changed
+            environments.  Defaults to POLL_INTERVAL.
+
+    Raises:
+        OSError: Unix sockets are not supported, or the service is already
+            running.
+    '''
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('Unix sockets are not supported on this platform.')
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if EnvClient(socket_path, fallback=False).available():
+            raise OSError(f'The service is already running on {socket_path}')
+        socket_path.unlink()
+    state = EnvironmentState()
+    state.list_environments()
+    state.check_for_changes()
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_environments,
+                               args=(state, stop, poll_interval),
+                               name='environment watcher', daemon=True)
+    server = socketserver.ThreadingUnixStreamServer(str(socket_path),
+                                                    RequestHandler)
+    server.daemon_threads = True
+    server.state = state
+    os.chmod(socket_path, 0o600)
+    watcher.start()
+    logger.info('Serving environment queries on %s', socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+        if socket_path.exists():
+            socket_path.unlink()
+        logger.info('Environment service stopped')
+
+
+# %% Client
+class ServiceError(ProjectException):
+    '''The service was unable to answer a query.'''
+
+
+class EnvClient():
+    '''Send environment queries to the service, or answer them directly.
+
+    Attributes:
+        socket_path (Path): The service's Unix socket.
+        fallback (bool): If True, queries are answered directly when the
+            service is not running.
+        local_state (EnvironmentState): Used for direct answers.
+    '''
+    def __init__(self, socket_path: Path = DEFAULT_SOCKET,
+                 fallback: bool = True, timeout: float = CLIENT_TIMEOUT):
+        self.socket_path = Path(socket_path)
+        self.fallback = fallback
+        self.timeout = timeout
+        self.local_state: EnvironmentState = None
+
+    def send(self, method: str, **params)->Any:
+        '''Send a query to the service.
+
+        Raises:
+            OSError: The service is not running.
+            ServiceError: The service could not answer the query.
+
+        Returns:
+            Any: The answer.
+        '''
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Unix sockets are not supported on this platform.')
+        request = json.dumps({'method': method, 'params': params})
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.timeout)
+            connection.connect(str(self.socket_path))
+            connection.sendall(request.encode('utf-8') + b'\n')
+            with connection.makefile('rb') as reply:
+                line = reply.readline()
+        if not line:
+            raise OSError('The service closed the connection.')
+        response = json.loads(line)
+        if not response['ok']:
+            if response.get('type') == 'MissingEnvironment':
+                raise MissingEnvironment(response['error'])
+            raise ServiceError(response['error'])
+        return response['result']
+
+    def call(self, method: str, **params)->Any:
+        '''Answer a query with the service, or directly if it is not running.
+
+        Returns:
+            Any: The answer, in the same form the service returns.
+        '''
+        try:
+            return self.send(method, **params)
+        except OSError:
+            if not self.fallback:
+                raise
+        if self.local_state is None:
+            self.local_state = EnvironmentState()
+        result = self.local_state.handle(method, params)
+        # Match the form of the service's JSON answers.
+        return json.loads(json.dumps(result, default=str))
+
+    def available(self)->bool:
+        '''Test whether the service is running.'''
+        try:
+            return self.send('ping') == 'pong'
+        except (OSError, ValueError, ServiceError):
+            return False
+
+    def list_environments(self, refresh: bool = False)->List[FullEnvRef]:
+        '''Get the name and path of each environment.'''
+        return [(env_name, Path(env_path)) for env_name, env_path
+                in self.call('list', refresh=refresh)]
+
+    def lookup(self, env: str)->FullEnvRef:
+        '''Find an environment by name or path.'''
+        env_name, env_path = self.call('lookup', env=str(env))
+        return env_name, Path(env_path)
+
+    def info(self, env: str = None)->Dict[str, Any]:
+        '''Get the `conda info` output for an environment.'''
+        return self.call('info', env=None if env is None else str(env))
+
+    def packages(self, env: str)->Dict[str, Any]:
+        '''Get the Conda ('conda') and pip ('pip') packages in an
+        environment.'''
+        return self.call('packages', env=str(env))
+
+    def imports(self, env: str)->Dict[str, List[List[str]]]:
+        '''Get the distributions providing each import name.'''
+        return self.call('imports', env=str(env))
+
+    def manifest(self, manifest_file: Path)->Dict[str, Any]:
+        '''Read a snapshot manifest.'''
+        return self.call('manifest', manifest_file=str(manifest_file))
+
+    def invalidate(self, env_path: Path = None):
+        '''Drop cached answers for one environment, or all of them.'''
+        self.call('invalidate',
+                  env_path=None if env_path is None else str(env_path))
+
+    def shutdown(self):
+        '''Stop the service.'''
+        self.send('shutdown')
+
+
+# %% Main
+def main(args: List[str] = None)->int:
+    '''Run, stop or check the environment service.'''
+    parser = argparse.ArgumentParser(
+        description='Serve environment queries from memory.')
+    parser.add_argument('command', choices=('serve', 'stop', 'status'),
+                        help='Start the service, stop it, or show its '
+                        'status.')
+    parser.add_argument('--socket', type=Path, default=DEFAULT_SOCKET,
+                        help='The Unix socket used by the service.')
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL,
+                        help='Seconds between checks for changed '
+                        'environments.')
+    options = parser.parse_args(args)
+    configure_logging()
+    client = EnvClient(options.socket, fallback=False)
+    if options.command == 'serve':
+        serve(options.socket, options.poll)
+        return 0
+    if not client.available():
+        print('The environment service is not running.')
+        return 1
+    if options.command == 'stop':
+        client.shutdown()
+        print('The environment service has been stopped.')
+    else:
+        print(json.dumps(client.send('stats'), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
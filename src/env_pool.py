@@ -0,0 +1,397 @@
+'''Pre-built Environment Pool.
+
+ Keep a number of idle Conda environments built from a common base
+ definition, so that a new project environment can be created by renaming
+ one of them and installing only the project-specific packages.
+ '''
+
+# %%  Imports
+from typing import List, Dict, Set, Union
+from pathlib import Path
+import os
+import json
+import time
+import threading
+
+from env_tools import ProjectException, AnacondaException
+from env_tools import FullEnvRef, OutputCallback
+from env_tools import console_command, env_registry, list_environments
+from env_tools import remove_environment, install_packages
+from env_tools import pip_install_packages, traced_operation
+from env_session import EnvironmentSession
+from solve_cache import SolveCache, SolveRequest, normalize_package
+from solve_cache import build_locked_environment
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+# Written to a pool environment once it is completely built.
+POOL_MARKER = 'env_pool.json'
+# Created (exclusively) in a pool environment when it is claimed.
+CLAIM_MARKER = 'env_pool.claim'
+
+
+# %% Pool class
+class EnvironmentPool():
+    '''A pool of idle environments built from the same base definition.
+
+    Pool environments are named `_pool_<base_name>_<n>`.  Each one holds a
+    marker file recording the base definition it was built from, so pool
+    environments built from an older definition are never claimed and are
+    removed by the next refill.  Pool environments without a marker that
+    are not being built (e.g. left by a failed build) are also removed.
+
+    Example:
+        pool = EnvironmentPool('Standard', standard_packages, '3.11',
+                               standard_pip_packages, size=2)
+        pool.refill()
+        ...
+        pool.create_project_environment('TestProject', project_packages)
+
+    Attributes:
+        base_name (str): The name of the base definition.
+        package_list (List[str]): The Conda packages in every pool
+            environment.
+        python_version (str): The python version of the pool environments.
+        pip_package_list (List[str]): The pip packages in every pool
+            environment.
+        size (int): The number of idle environments to keep.
+        solve_cache (SolveCache): The cache used to skip the solver when
+            building pool environments.
+        wheelhouse (Path): A folder of wheels shared by the pip installs.
+    '''
+    def __init__(self, base_name: str, package_list: List[str],
+                 python_version: str = '3.10',
+                 pip_package_list: List[str] = None, size: int = 2,
+                 solve_cache: SolveCache = None, wheelhouse: Path = None):
+        self.base_name = base_name
+        self.package_list = list(package_list)
+        self.python_version = str(python_version)
+        self.pip_package_list = list(pip_package_list or [])
+        self.size = size
+        self.solve_cache = solve_cache
+        self.wheelhouse = wheelhouse
+        self.lock = threading.Lock()
+        self.refill_lock = threading.Lock()
+        self.building: Set[str] = set()
+        self.refill_thread: threading.Thread = None
+
+    @property
+    def name_prefix(self)->str:
+        '''The prefix of the pool environment names.'''
+        return f'_pool_{self.base_name}_'
+
+    @property
+    def definition_key(self)->str:
+        '''A key identifying the base definition.'''
+        request = SolveRequest.build(
+            self.package_list + [f'pip:{package}'
+                                 for package in self.pip_package_list],
+            self.python_version, channels=[])
+        return request.key
+
+    # Pool inspection
+    def pool_environments(self)->List[FullEnvRef]:
+        '''List the pool environments, whether ready or not.'''
+        return [(env_name, env_path)
+                for env_name, env_path in list_environments(force_refresh=True)
+                if env_name.startswith(self.name_prefix)]
+
+    def is_ready(self, env_path: Path)->bool:
+        '''Test whether a pool environment can be claimed.
+
+        Args:
+            env_path (Path): The path to the pool environment.
+
+        Returns:
+            bool: True if the environment was completely built from the
+                current base definition and has not been claimed.
+        '''
+        marker = Path(env_path) / POOL_MARKER
+        if not marker.exists() or (Path(env_path) / CLAIM_MARKER).exists():
+            return False
+        try:
+            record = json.loads(marker.read_text(encoding='utf-8'))
+        except ValueError:
+            return False
+        return record.get('definition') == self.definition_key
+
+    def ready_environments(self)->List[FullEnvRef]:
+        '''List the pool environments that can be claimed.'''
+        return [(env_name, env_path)
+                for env_name, env_path in self.pool_environments()
+                if self.is_ready(env_path)]
+
+    # Building
+    def next_name(self)->str:
+        '''Choose an unused pool environment name.
+
+        Must be called with the lock held; names of environments being built
+        are reserved in `building`.
+        '''
+        used = {env_name for env_name, _ in self.pool_environments()}
+        used.update(self.building)
+        number = 1
+        while f'{self.name_prefix}{number}' in used:
+            number += 1
+        return f'{self.name_prefix}{number}'
+
+    def build_one(self)->str:
+        '''Build one pool environment.
+
+        Returns:
+            str: The name of the new pool environment.
+        '''
+        with self.lock:
+            env_name = self.next_name()
+            self.building.add(env_name)
+        logger.info('Building pool environment %s', env_name)
+        start = time.perf_counter()
+        try:
+            build_output = build_locked_environment(
+                env_name, self.package_list, self.python_version,
+                cache=self.solve_cache)
+            env_path = env_registry.lookup(env_name, force_refresh=True)[1]
+            if self.pip_package_list:
+                with EnvironmentSession(env_name) as session:
+                    pip_install_packages(env_path, self.pip_package_list,
+                                         session=session, batch=True,
+                                         wheelhouse=self.wheelhouse)
+            record = {'base': self.base_name,
+                      'definition': self.definition_key,
+                      'solve': build_output['key'],
+                      'built': time.strftime('%Y-%m-%d %H:%M:%S'),
+                      'duration': round(time.perf_counter() - start, 1)}
+            (Path(env_path) / POOL_MARKER).write_text(
+                json.dumps(record, indent=2), encoding='utf-8')
+        except ProjectException:
+            self.remove_incomplete(env_name)
+            raise
+        finally:
+            with self.lock:
+                self.building.discard(env_name)
+        return env_name
+
+    def remove_incomplete(self, env_name: str):
+        '''Remove a pool environment whose build failed, if it exists.'''
+        try:
+            env_registry.environments(force_refresh=True)
+            if env_registry.find(env_name) is not None:
+                remove_environment(env_name)
+        except ProjectException as err:
+            # The next refill removes it, since it has no pool marker.
+            logger.warning('Unable to remove incomplete pool environment '
+                           '%s: %s', env_name, err)
+
+    @traced_operation
+    def refill(self)->List[str]:
+        '''Remove outdated pool environments and build new ones until the
+        pool is full.
+
+        Only one refill runs at a time, so concurrent refills do not build
+        more environments than the pool size.
+
+        Returns:
+            List[str]: The names of the pool environments built.
+        '''
+        with self.refill_lock:
+            with self.lock:
+                building = set(self.building)
+            for env_name, env_path in self.pool_environments():
+                if env_name in building:
+                    continue
+                if not (Path(env_path) / POOL_MARKER).exists():
+                    logger.info('Removing incomplete pool environment %s',
+                                env_name)
+                    remove_environment(env_path)
+                elif (not self.is_ready(env_path)
+                      and not (Path(env_path) / CLAIM_MARKER).exists()):
+                    logger.info('Removing outdated pool environment %s',
+                                env_name)
+                    remove_environment(env_path)
+            built = list()
+            while len(self.ready_environments()) < self.size:
+                built.append(self.build_one())
+            return built
+
+    def refill_in_background(self)->threading.Thread:
+        '''Start refilling the pool on a background thread.
+
+        Only one refill runs at a time; if one is already running it is
+        returned instead.
+
+        Returns:
+            threading.Thread: The refill thread.
+        '''
+        if self.refill_thread is not None and self.refill_thread.is_alive():
+            return self.refill_thread
+
+        def run_refill():
+            try:
+                self.refill()
+            except ProjectException as err:
+                logger.warning('Unable to refill the %s pool: %s',
+                               self.base_name, err)
+
+        self.refill_thread = threading.Thread(
+            target=run_refill, name=f'refill {self.base_name} pool',
+            daemon=True)
+        self.refill_thread.start()
+        return self.refill_thread
+
+    # Claiming
+    def claim(self, new_env: str)->FullEnvRef:
+        '''Rename a ready pool environment to a new environment name.
+
+        The claim marker is created exclusively, so two processes cannot
+        claim the same pool environment.  `conda rename` is used if it is
+        available; otherwise the pool environment is cloned (Conda clones
+        with hard links) and then removed.
+
+        Args:
+            new_env (str): The name for the new environment.
+
+        Returns:
+            FullEnvRef: The name and path of the new environment, or None if
+                no pool environment is ready.
+        '''
+        for env_name, env_path in self.ready_environments():
+            try:
+                claim_file = os.open(Path(env_path) / CLAIM_MARKER,
+                                     os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            os.close(claim_file)
+            logger.info('Claiming pool environment %s for %s', env_name,
+                        new_env)
+            try:
+                self.rename(env_name, env_path, new_env)
+            except ProjectException:
+                # Release the pool environment so it can be claimed again.
+                (Path(env_path) / CLAIM_MARKER).unlink()
+                raise
+            env_registry.invalidate()
+            new_env_path = env_registry.lookup(new_env)[1]
+            for marker in (POOL_MARKER, CLAIM_MARKER):
+                marker_path = Path(new_env_path) / marker
+                if marker_path.exists():
+                    marker_path.unlink()
+            return new_env, new_env_path
+        return None
+
+    @staticmethod
+    def rename(env_name: str, env_path: Path, new_env: str):
+        '''Rename a pool environment, cloning it if `conda rename` fails.
+
+        Args:
+            env_name (str): The pool environment name.
+            env_path (Path): The path to the pool environment.
+            new_env (str): The name for the new environment.
+
+        Raises:
+            AnacondaException: The environment could not be renamed or
+                cloned.
+        '''
+        try:
+            console_command(f'conda rename --name {env_name} {new_env}',
+                            AnacondaException,
+                            f'Unable to rename {env_name} to {new_env}')
+            return
+        except AnacondaException:
+            console_command(
+                f'conda create -y --quiet --clone {env_name} '
+                f'--name {new_env}', AnacondaException,
+                f'Unable to clone {env_name} to {new_env}')
+        try:
+            remove_environment(env_name)
+        except ProjectException as err:
+            # Without its pool marker it is removed by the next refill.
+            logger.warning('Unable to remove cloned pool environment %s: %s',
+                           env_name, err)
+            pool_marker = Path(env_path) / POOL_MARKER
+            if pool_marker.exists():
+                pool_marker.unlink()
+
+    def project_delta(self, package_list: List[str]
+                      )->List[str]:
+        '''Find the requested packages that are not in the base definition.
+
+        Args:
+            package_list (List[str]): The packages for the project.
+
+        Returns:
+            List[str]: The packages to install after claiming.
+        '''
+        base = {normalize_package(package) for package in self.package_list}
+        return [package for package in package_list
+                if normalize_package(package) not in base]
+
+    @traced_operation
+    def create_project_environment(self, new_env: str,
+                                   package_list: List[str] = None,
+                                   pip_package_list: List[str] = None,
+                                   progress: OutputCallback = None,
+                                   refill: bool = True
+                                   )->Dict[str, Union[bool, str, dict, list]]:
+        '''Create a project environment from the pool.
+
+        If no pool environment is ready, the base definition is built
+        directly for the project.
+
+        Args:
+            new_env (str): The name for the new environment.
+            package_list (List[str], optional): The Conda packages for the
+                project.  Packages in the base definition are skipped.
+            pip_package_list (List[str], optional): The pip packages for the
+                project.  Packages in the base definition are skipped.
+            progress (OutputCallback, optional): A function called with each
+                `conda --json` progress record while installing packages.
+            refill (bool, optional): If True, start a background refill
+                afterwards.  Defaults to True.
+
+        Returns:
+            Dict[str, Union[bool, str, dict, list]]: 'pooled' (True if a
+                pool environment was claimed), 'prefix' and the conda output
+                for 'install' and 'pip install'.
+        '''
+        extra_packages = self.project_delta(package_list or [])
+        extra_pip = [package for package in pip_package_list or []
+                     if package not in self.pip_package_list]
+        claimed = self.claim(new_env)
+        pooled = claimed is not None
+        if not pooled:
+            logger.info('No pool environment is ready for %s; building.',
+                        new_env)
+            build_locked_environment(new_env, self.package_list,
+                                     self.python_version,
+                                     cache=self.solve_cache,
+                                     progress=progress)
+            extra_pip = self.pip_package_list + extra_pip
+        env_path = env_registry.lookup(new_env, force_refresh=True)[1]
+        result = {'pooled': pooled, 'prefix': str(env_path), 'install': {},
+                  'pip install': []}
+        if extra_packages:
+            result['install'] = install_packages(new_env, extra_packages,
+                                                 progress)
+        if extra_pip:
+            with EnvironmentSession(new_env) as session:
+                result['pip install'] = pip_install_packages(
+                    env_path, extra_pip, session=session, batch=True,
+                    wheelhouse=self.wheelhouse)
+        if refill:
+            self.refill_in_background()
+        return result
+
+    def drain(self):
+        '''Remove all unclaimed pool environments that are not being built.'''
+        with self.lock:
+            building = set(self.building)
+        for env_name, env_path in self.pool_environments():
+            if env_name in building:
+                continue
+            if not (Path(env_path) / CLAIM_MARKER).exists():
+                logger.info('Removing pool environment %s', env_name)
+                remove_environment(env_name)
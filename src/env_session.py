@@ -0,0 +1,366 @@
+'''Persistent Conda Environment Sessions.
+
+ Run many commands in one long-lived shell with an activated Conda
+ environment, so that the activation cost is paid once per environment
+ rather than once per command.
+ '''
+
+# %%  Imports
+from typing import List, Tuple, Union
+import os
+import time
+import uuid
+import signal
+import queue
+import threading
+import subprocess
+
+from env_tools import AnacondaException, AbortedCmdException
+from env_tools import CmdType
+from env_tools import command_hooks, record_command
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+# The Anaconda base installation used to activate environments on Windows.
+WINDOWS_ANACONDA_ROOT = r'C:\ProgramData\Anaconda3'
+
+
+# %% Shell definitions
+def shell_command()->List[str]:
+    '''The command that starts the session shell.
+
+    Returns:
+        List[str]: `cmd` with echo turned off on Windows, otherwise `bash`.
+    '''
+    if os.name == 'nt':
+        return ['cmd', '/Q', '/K', 'prompt $S']
+    return ['bash', '--noprofile', '--norc']
+
+
+def activation_command(env_name: str)->str:
+    '''Generate the command that activates a Conda environment in the shell.
+
+    Unlike `env_tools.activate_environment`, this is a complete command
+    rather than a prefix, since it is only run once for the session.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+
+    Returns:
+        str: The activation command.
+    '''
+    if os.name == 'nt':
+        return ''.join([
+            rf'CALL {WINDOWS_ANACONDA_ROOT}\Scripts\activate.bat ',
+            WINDOWS_ANACONDA_ROOT,
+            f'&&conda activate {env_name}'
+            ])
+    return f'eval "$(conda shell.bash hook)" && conda activate {env_name}'
+
+
+def marker_commands(marker: str)->Tuple[str, str]:
+    '''Generate the commands that mark the end of a command's output.
+
+    Args:
+        marker (str): The unique end of output marker.
+
+    Returns:
+        Tuple[str, str]: The command that writes the marker and exit code to
+            stdout and the command that writes the marker to stderr.
+    '''
+    if os.name == 'nt':
+        return (f'echo {marker} %errorlevel%', f'echo {marker} 1>&2')
+    return (f'echo "{marker} $?"', f'echo "{marker}" 1>&2')
+
+
+def parse_exit_code(status_line: str)->Union[int, None]:
+    '''Read the exit code from a marker line.
+
+    Args:
+        status_line (str): The marker line, e.g. '__env_session_<id>__ 0'.
+
+    Returns:
+        Union[int, None]: The exit code, or None if the line does not
+            contain one.
+    '''
+    parts = status_line.split()
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[1])
+    except ValueError:
+        return None
+
+
+# %% Session class
+class EnvironmentSession():
+    '''A long-lived shell with an activated Conda environment.
+
+    Use the session as a context manager to make sure the shell is closed:
+        with EnvironmentSession('Standard') as session:
+            session.run('pip install units --quiet --report -')
+            session.run('python -m ipykernel install --user --name Standard')
+
+    Each command's output is delimited by a unique marker line, which also
+    carries the command's exit code.  Commands should not read from stdin,
+    since stdin is used to send commands to the shell.
+
+    If a command times out, the shell is killed and a new shell is started
+    (and the environment re-activated) for the next command.
+
+    Attributes:
+        env_name (str): The name of the Conda environment.
+        activate (bool): If False, the shell is started without activating
+            the environment.  Used for commands that only need `conda`.
+        process (subprocess.Popen): The running shell, or None if the shell
+            is not running.
+    '''
+    def __init__(self, env_name: str, activate: bool = True):
+        self.env_name = env_name
+        self.activate = activate
+        self.process: subprocess.Popen = None
+        self.stdout_lines: queue.Queue = None
+        self.stderr_lines: queue.Queue = None
+        self.lock = threading.Lock()
+        self.last_exit_code: int = None
+        self.last_output_bytes = (0, 0)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_running(self)->bool:
+        '''True if the session shell is running.'''
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        '''Start the shell and activate the environment.
+
+        Raises:
+            AnacondaException: The environment could not be activated.
+        '''
+        if self.is_running:
+            return
+        logger.debug('Starting session shell for %s', self.env_name)
+        self.process = subprocess.Popen(
+            shell_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=True, encoding='utf-8',
+            errors='replace', bufsize=1, start_new_session=os.name != 'nt')
+        self.stdout_lines = queue.Queue()
+        self.stderr_lines = queue.Queue()
+        for stream, lines in ((self.process.stdout, self.stdout_lines),
+                              (self.process.stderr, self.stderr_lines)):
+            reader = threading.Thread(target=self.read_stream,
+                                      args=(stream, lines), daemon=True)
+            reader.start()
+        if self.activate:
+            self.execute(activation_command(self.env_name), AnacondaException,
+                         f'Unable to activate environment {self.env_name}',
+                         None)
+
+    @staticmethod
+    def read_stream(stream, lines: queue.Queue):
+        '''Pass lines from a shell output stream to a queue.
+
+        Runs on a background thread for the life of the shell.  A None item
+        is added when the stream closes.
+
+        Args:
+            stream (TextIO): The shell's stdout or stderr.
+            lines (queue.Queue): The queue to receive the lines.
+        '''
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+
+    def run(self, cmd_str: CmdType,
+            error_type: Exception = AnacondaException,
+            error_msg: str = 'A session command error occurred!',
+            abort_after: int = None)->str:
+        '''Run a command in the activated environment.
+
+        The arguments match `env_tools.console_command`, so a session can be
+        used wherever a command would otherwise be prefixed by
+        `activate_environment`.
+
+        Args:
+            cmd_str (CmdType): The command to execute. A list of strings is
+                joined with spaces.
+            error_type (Exception, Optional): The type of exception to raise
+                if the command returns a non-zero exit code.
+                Default is AnacondaException.
+            error_msg (str, Optional): The Error message to include if
+                required.
+            abort_after (int, Optional): Abort the command after the given
+                number of seconds.  If None, do not time-out the command.
+                Default is None.
+
+        Raises:
+            error_type: The command returned a non-zero exit code.
+            AbortedCmdException: The command timed out.
+
+        Returns:
+            str: The stdout output from running the command.
+        '''
+        if not isinstance(cmd_str, str):
+            cmd_str = ' '.join(str(part) for part in cmd_str)
+        with self.lock:
+            self.start()
+            if not command_hooks:
+                return self.execute(cmd_str, error_type, error_msg,
+                                    abort_after)
+            start, wall_start = time.time(), time.perf_counter()
+            try:
+                return self.execute(cmd_str, error_type, error_msg,
+                                    abort_after)
+            finally:
+                # Child CPU time is not available while the shell is running.
+                record_command(cmd_str, start, wall_start, None,
+                               self.last_exit_code, *self.last_output_bytes)
+
+    def execute(self, cmd_str: str, error_type: Exception, error_msg: str,
+                abort_after: int)->str:
+        '''Send a command to the shell and collect its output.
+
+        Args:
+            cmd_str (str): The command to execute.
+            error_type (Exception): The type of exception to raise if the
+                command returns a non-zero exit code.
+            error_msg (str): The Error message to include if required.
+            abort_after (int): Abort the command after the given number of
+                seconds.  If None, do not time-out the command.
+
+        Raises:
+            error_type: The command returned a non-zero exit code.
+            AbortedCmdException: The command timed out or the shell exited.
+
+        Returns:
+            str: The stdout output from running the command.
+        '''
+        marker = f'__env_session_{uuid.uuid4().hex}__'
+        self.last_exit_code = None
+        self.last_output_bytes = (0, 0)
+        stdout_marker, stderr_marker = marker_commands(marker)
+        if os.name != 'nt':
+            # Keep the command from reading the session's command stream.
+            cmd_str = f'{{ {cmd_str}\n}} < /dev/null'
+        script = '\n'.join([cmd_str, stdout_marker, stderr_marker, ''])
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except OSError as err:
+            self.kill()
+            raise AbortedCmdException(
+                f'Session shell for {self.env_name} has exited.') from err
+        try:
+            deadline = None
+            if abort_after is not None:
+                deadline = threading.Event()
+                timer = threading.Timer(abort_after, deadline.set)
+                timer.daemon = True
+                timer.start()
+            stdout, status_line = self.collect(self.stdout_lines, marker,
+                                               deadline)
+            stderr, _ = self.collect(self.stderr_lines, marker, deadline)
+        except TimeoutError as err:
+            self.kill()
+            msg = '\n'.join([f'Command timed out after {abort_after} seconds!',
+                             error_msg])
+            raise AbortedCmdException(msg) from err
+        finally:
+            if abort_after is not None:
+                timer.cancel()
+        self.last_output_bytes = (len(stdout.encode('utf-8')),
+                                  len(stderr.encode('utf-8')))
+        if status_line is None:
+            self.kill()
+            msg = '\n'.join([f'Session shell for {self.env_name} exited.',
+                             error_msg, stderr])
+            raise error_type(msg)
+        exit_code = parse_exit_code(status_line)
+        if exit_code is None:
+            msg = '\n'.join([f'Unreadable command status: {status_line}',
+                             error_msg, stderr])
+            raise error_type(msg)
+        self.last_exit_code = exit_code
+        if exit_code != 0:
+            msg = '\n'.join([error_msg, stderr])
+            raise error_type(msg)
+        return stdout
+
+    @staticmethod
+    def collect(lines: queue.Queue, marker: str,
+                deadline: threading.Event = None)->Tuple[str, str]:
+        '''Collect output lines until the end of output marker is reached.
+
+        Args:
+            lines (queue.Queue): The stdout or stderr line queue.
+            marker (str): The end of output marker.
+            deadline (threading.Event, Optional): Set when the command has
+                timed out.  If None, wait indefinitely.
+
+        Raises:
+            TimeoutError: The deadline passed before the marker was found.
+
+        Returns:
+            Tuple[str, str]: The output text and the marker line, starting
+                at the marker.  The marker line is None if the stream closed
+                before the marker was found.
+        '''
+        output = []
+        while True:
+            # Checked on every line, so that a command that keeps writing
+            # output still times out.
+            if deadline is not None and deadline.is_set():
+                raise TimeoutError(marker)
+            try:
+                line = lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if line is None:
+                return ''.join(output), None
+            position = line.find(marker)
+            if position >= 0:
+                # Output without a final newline shares the marker's line.
+                output.append(line[:position])
+                return ''.join(output), line[position:].strip()
+            output.append(line)
+
+    def kill(self):
+        '''Terminate the shell immediately.'''
+        if self.process is not None:
+            if self.process.poll() is None:
+                if os.name != 'nt':
+                    # Also stop any command still running in the shell.
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                else:
+                    self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def close(self, timeout: float = 10.0):
+        '''Exit the shell.
+
+        Args:
+            timeout (float, Optional): The number of seconds to wait for the
+                shell to exit before killing it. Default is 10.
+        '''
+        if self.process is None:
+            return
+        logger.debug('Closing session shell for %s', self.env_name)
+        try:
+            self.process.stdin.write('exit\n')
+            self.process.stdin.flush()
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
@@ -0,0 +1,396 @@
+'''Archived Environment Snapshots.
+
+ Load the environment export files saved by `env_tools.log_all_envs`
+ (`<env>_spec.txt` and `<env>.yml`) from a snapshot folder into a single
+ package table that can be queried across environments.
+ '''
+
+# %%  Imports
+from typing import List, Dict, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import re
+
+import pandas as pd
+
+from conda_meta import canonical_channel
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Type Definitions
+# PackageEntry is one installed package in one environment.
+PackageEntry = Dict[str, Union[str, bool]]
+
+
+# %% Constants
+PACKAGE_COLUMNS = ['Environment', 'Package', 'Version', 'Build', 'Channel',
+                   'Pip']
+CATEGORY_COLUMNS = ['Environment', 'Package', 'Version', 'Build', 'Channel']
+
+SPEC_SUFFIX = '_spec.txt'
+YML_SUFFIX = '.yml'
+
+# The channel reported for packages installed with pip.
+PIP_CHANNEL = 'pypi'
+
+# Splits a version string into its numeric and text parts.
+VERSION_PART_PATTERN = re.compile(r'(\d+|[a-z]+)')
+
+
+# %% File readers
+def read_spec_packages(spec_file: Path)->Dict[str, PackageEntry]:
+    '''Read the packages listed in an explicit spec file.
+
+    Each line of the spec file is a package URL, e.g.
+    `https://conda.anaconda.org/conda-forge/win-64/numpy-1.26.0-py310hf667824_0.conda`
+
+    Args:
+        spec_file (Path): The `<env>_spec.txt` file.
+
+    Returns:
+        Dict[str, PackageEntry]: The Package, Version, Build and Channel of
+            each package, indexed by package name.
+    '''
+    packages = dict()
+    for line in Path(spec_file).read_text(encoding='utf-8').splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', '@')):
+            continue
+        url = line.split('#', 1)[0]
+        channel_url, _, file_name = url.rpartition('/')
+        for extension in ('.conda', '.tar.bz2'):
+            if file_name.endswith(extension):
+                file_name = file_name[:-len(extension)]
+        try:
+            name, version, build = file_name.rsplit('-', 2)
+        except ValueError:
+            logger.warning('Unrecognized spec line in %s: %s', spec_file,
+                           line)
+            continue
+        packages[name] = {'Package': name, 'Version': version, 'Build': build,
+                          'Channel': canonical_channel(channel_url),
+                          'Pip': False}
+    return packages
+
+
+def read_yml_packages(yml_file: Path)->Tuple[str, List[PackageEntry]]:
+    '''Read the packages listed in a `conda env export` *.yml* file.
+
+    Only the `name`, `dependencies` and nested `pip` sections are read, so
+    a YAML library is not needed.
+
+    Args:
+        yml_file (Path): The `<env>.yml` file.
+
+    Returns:
+        Tuple[str, List[PackageEntry]]: The environment name and the
+            Package, Version, Build and Pip flag of each package.  Channel is
+            only set for pip packages.
+    '''
+    env_name = Path(yml_file).stem
+    packages = list()
+    section = None
+    pip_indent = None
+    for line in Path(yml_file).read_text(encoding='utf-8').splitlines():
+        text = line.strip()
+        if not text or text.startswith('#'):
+            continue
+        if not line.startswith((' ', '-')):
+            key, _, value = text.partition(':')
+            section = key
+            if key == 'name' and value.strip():
+                env_name = value.strip().strip('\'"')
+            continue
+        if section != 'dependencies' or not text.startswith('-'):
+            continue
+        item = text[1:].strip().strip('\'"')
+        indent = len(line) - len(line.lstrip())
+        if item == 'pip:':
+            pip_indent = indent
+            continue
+        # Pip packages are indented below the `- pip:` item.
+        if pip_indent is not None and indent > pip_indent:
+            name, _, version = item.partition('==')
+            packages.append({'Package': name, 'Version': version,
+                             'Build': None, 'Channel': PIP_CHANNEL,
+                             'Pip': True})
+            continue
+        parts = item.split('=')
+        packages.append({'Package': parts[0],
+                         'Version': parts[1] if len(parts) > 1 else None,
+                         'Build': parts[2] if len(parts) > 2 else None,
+                         'Channel': None,
+                         'Pip': False})
+    return env_name, packages
+
+
+def read_env_packages(env_name: str, spec_file: Path = None,
+                      yml_file: Path = None)->List[PackageEntry]:
+    '''Combine the packages listed in an environment's spec and yml files.
+
+    The spec file gives the channel of each Conda package; the *.yml* file
+    adds the packages installed with pip.  Either file may be missing.
+
+    Args:
+        env_name (str): The name of the environment.
+        spec_file (Path, optional): The `<env>_spec.txt` file.
+        yml_file (Path, optional): The `<env>.yml` file.
+
+    Returns:
+        List[PackageEntry]: One entry for each package in the environment.
+    '''
+    spec_packages = dict()
+    if spec_file is not None:
+        spec_packages = read_spec_packages(spec_file)
+    yml_packages = list()
+    if yml_file is not None:
+        # The file name is used, since the yml name of the base environment
+        # is always 'base'.
+        _, yml_packages = read_yml_packages(yml_file)
+    packages = list()
+    for package in yml_packages:
+        spec_package = spec_packages.pop(package['Package'], None)
+        if spec_package is not None and not package['Pip']:
+            package = spec_package
+        packages.append(package)
+    packages.extend(spec_packages.values())
+    for package in packages:
+        package['Environment'] = env_name
+    return packages
+
+
+def find_snapshot_files(snapshot_folder: Path
+                        )->Dict[str, Dict[str, Path]]:
+    '''Find the spec and yml files for each environment in a snapshot folder.
+
+    Args:
+        snapshot_folder (Path): The folder containing the export files.
+
+    Returns:
+        Dict[str, Dict[str, Path]]: The 'spec_file' and 'yml_file' for each
+            environment, indexed by environment name (from the file names).
+    '''
+    env_files = dict()
+    for file in sorted(Path(snapshot_folder).iterdir()):
+        if file.name.endswith(SPEC_SUFFIX):
+            env_name = file.name[:-len(SPEC_SUFFIX)]
+            env_files.setdefault(env_name, {})['spec_file'] = file
+        elif file.suffix == YML_SUFFIX:
+            env_files.setdefault(file.stem, {})['yml_file'] = file
+    return env_files
+
+
+# %% Version comparison
+def version_key(version: str)->tuple:
+    '''Build a sort key that orders version strings numerically.
+
+    e.g. '1.9.3' < '1.24.0' and '1.24' == '1.24.0'.  Development releases
+    sort first, then pre-releases, then the release and then post-releases:
+    '1.24.dev0' < '1.24.0rc1' < '1.24' < '1.24.post1' < '1.24.1'.  This is
+    an approximation of Conda's version ordering that is sufficient for
+    comparing released package versions.
+
+    Args:
+        version (str): The version string.
+
+    Returns:
+        tuple: The comparison key.
+    '''
+    key = list()
+    zeros = list()
+    for part in VERSION_PART_PATTERN.findall(str(version).lower()):
+        if part == '0' * len(part):
+            # Zeros are only kept if a non-zero number follows, so that
+            # '1.24' == '1.24.0' and '1.24.0rc1' < '1.24'.
+            zeros.append((1, 0, ''))
+        elif part.isdigit():
+            key.extend(zeros)
+            zeros = list()
+            key.append((1, int(part), ''))
+        elif part == 'post':
+            # Post-releases sort after the release, before the next number.
+            zeros = list()
+            key.append((0, 1, part))
+        elif part == 'dev':
+            # Development releases sort before any pre-release.
+            zeros = list()
+            key.append((-2, 0, part))
+        else:
+            # Pre-release tags sort before the release.
+            zeros = list()
+            key.append((-1, 0, part))
+    # A release sorts after any of its pre-releases.
+    key.append((0, 0, ''))
+    return tuple(key)
+
+
+# %% Snapshot table
+class SnapshotTable():
+    '''The packages installed in every environment of one snapshot.
+
+    Use `load_snapshot_folder` to build the table from saved export files:
+        snapshot = load_snapshot_folder(folder)
+        snapshot.find('numpy', below='1.24')
+        snapshot.versions('pandas')
+        snapshot.matrix()
+
+    Attributes:
+        packages (pd.DataFrame): The long package table with columns
+            Environment, Package, Version, Build, Channel and Pip.  All
+            columns except Pip are categorical.
+        by_package (pd.DataFrame): packages indexed and sorted by Package
+            and Environment.
+        by_environment (pd.DataFrame): packages indexed and sorted by
+            Environment and Package.
+        name (str): The snapshot name, usually the snapshot folder name.
+    '''
+    def __init__(self, packages: pd.DataFrame, name: str = ''):
+        self.name = name
+        self.packages = packages.reset_index(drop=True)
+        self.by_package = self.packages.set_index(
+            ['Package', 'Environment']).sort_index()
+        self.by_environment = self.packages.set_index(
+            ['Environment', 'Package']).sort_index()
+
+    @property
+    def environments(self)->List[str]:
+        '''The names of the environments in the snapshot.'''
+        return list(self.packages['Environment'].cat.categories)
+
+    def package(self, package_name: str)->pd.DataFrame:
+        '''All installations of a package.
+
+        Args:
+            package_name (str): The package name.
+
+        Returns:
+            pd.DataFrame: The package entries indexed by Environment.  Empty
+                if no environment has the package.
+        '''
+        try:
+            return self.by_package.xs(package_name, level='Package')
+        except KeyError:
+            return self.by_package.iloc[0:0].droplevel('Package')
+
+    def environment(self, env_name: str)->pd.DataFrame:
+        '''All packages in an environment.
+
+        Args:
+            env_name (str): The environment name.
+
+        Returns:
+            pd.DataFrame: The package entries indexed by Package.  Empty if
+                the environment is not in the snapshot.
+        '''
+        try:
+            return self.by_environment.xs(env_name, level='Environment')
+        except KeyError:
+            return self.by_environment.iloc[0:0].droplevel('Environment')
+
+    def versions(self, package_name: str)->pd.Series:
+        '''The version of a package in each environment that has it.
+
+        Args:
+            package_name (str): The package name.
+
+        Returns:
+            pd.Series: The package version indexed by Environment.
+        '''
+        versions = self.package(package_name)['Version']
+        return versions.astype(str)
+
+    def find(self, package_name: str, below: str = None,
+             at_least: str = None)->pd.Series:
+        '''Find the environments with a package in a version range.
+
+        e.g. `snapshot.find('numpy', below='1.24')` lists the environments
+        with numpy < 1.24.
+
+        Args:
+            package_name (str): The package name.
+            below (str, optional): Only include versions less than this.
+            at_least (str, optional): Only include versions greater than or
+                equal to this.
+
+        Returns:
+            pd.Series: The matching package versions indexed by Environment.
+        '''
+        versions = self.versions(package_name)
+        keys = versions.map(version_key)
+        selected = pd.Series(True, index=versions.index)
+        if below is not None:
+            selected &= keys < version_key(below)
+        if at_least is not None:
+            selected &= keys >= version_key(at_least)
+        return versions[selected]
+
+    def matrix(self, values: str = 'Version')->pd.DataFrame:
+        '''Build an environment × package matrix.
+
+        Args:
+            values (str, optional): The column shown in the matrix cells.
+                Default is 'Version'.
+
+        Returns:
+            pd.DataFrame: One row per environment and one column per
+                package.  Missing packages are NaN.
+        '''
+        matrix = self.packages.pivot_table(
+            index='Environment', columns='Package', values=values,
+            aggfunc='first', observed=True)
+        return matrix
+
+
+# %% Loader
+def build_package_frame(package_entries: List[PackageEntry])->pd.DataFrame:
+    '''Convert package entries to a DataFrame with categorical columns.
+
+    Args:
+        package_entries (List[PackageEntry]): The packages for all
+            environments.
+
+    Returns:
+        pd.DataFrame: The long package table.
+    '''
+    packages = pd.DataFrame(package_entries, columns=PACKAGE_COLUMNS)
+    for column in CATEGORY_COLUMNS:
+        packages[column] = packages[column].astype('category')
+    packages['Pip'] = packages['Pip'].astype(bool)
+    return packages
+
+
+def load_snapshot_folder(snapshot_folder: Path,
+                         max_workers: int = None)->SnapshotTable:
+    '''Read all of the environment export files in a snapshot folder.
+
+    Args:
+        snapshot_folder (Path): The folder containing the `<env>_spec.txt`
+            and `<env>.yml` files.
+        max_workers (int, optional): The number of files read at once.  If
+            None, use the ThreadPoolExecutor default.
+
+    Returns:
+        SnapshotTable: The packages for all environments in the folder.
+    '''
+    snapshot_folder = Path(snapshot_folder)
+    env_files = find_snapshot_files(snapshot_folder)
+
+    def read_files(env_name: str)->List[PackageEntry]:
+        try:
+            return read_env_packages(env_name, **env_files[env_name])
+        except (OSError, UnicodeDecodeError) as err:
+            logger.warning('Unable to read snapshot for %s: %s', env_name,
+                           err)
+            return []
+
+    package_entries = list()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for env_packages in executor.map(read_files, env_files):
+            package_entries.extend(env_packages)
+    logger.debug('Loaded %d packages for %d environments from %s',
+                 len(package_entries), len(env_files), snapshot_folder)
+    return SnapshotTable(build_package_frame(package_entries),
+                         snapshot_folder.name)
@@ -4,22 +4,41 @@
  '''
 
 # %%  Imports
-from typing import Union, List, Tuple, Dict
+from typing import Union, List, Tuple, Dict, Callable, Iterator, Any
+from typing import TYPE_CHECKING
+import os
 import re
 import json
+import time
+import shutil
+import signal
+import functools
+import threading
+import contextvars
+import tempfile
+import argparse
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+from collections import deque
 from collections.abc import Iterable
 
-import pandas as pd
+from conda_meta import export_env_specs, env_fingerprint
+from conda_meta import discover_environments, read_conda_info
+from snapshot_store import SnapshotStore
+
+# pandas takes longer to import than the rest of this module, so it is only
+# imported by the functions that build tables.
+if TYPE_CHECKING:
+    import pandas as pd
 
 # %% Initialize logging
+# Logging is configured by the command line interface (see main), or by the
+# calling script or notebook.
 import logging  # pylint: disable=wrong-import-position wrong-import-order
-logging.basicConfig(level=logging.INFO,
-                    format='%(levelname)-8s %(message)s')
 logger = logging.getLogger(__name__)
-#logger.setLevel(logging.DEBUG)
-logger.setLevel(logging.INFO)
 
 
 # %% Type Definitions
@@ -39,9 +58,30 @@ FileOption = Union[str, Path, bool]
 # as a Tuple containing the name and the path to the environment.
 FullEnvRef = Tuple[str, Path]
 
+# OutputCallback receives each line (str) or, in JSON mode, each parsed
+# progress record (dict) from a streaming console command as it arrives.
+OutputCallback = Callable[[Union[str, Dict[str, Any]]], None]
+
 # FileNameOption is either a string file name or a boolean
 FileNameOption = Union[str, bool]
 
+# SnapshotManifest records, for each environment name, the conda-meta
+# fingerprint, environment path, snapshot folder and exported file names from
+# the last time the environment was stored.
+SnapshotManifest = Dict[str, Dict[str, Union[str, List[str]]]]
+
+
+# %% Constants
+# The number of stderr lines kept for error messages from streaming commands.
+STDERR_BUFFER_LINES = 200
+
+# The number of bytes read at a time from a streaming command's output.
+STREAM_CHUNK_SIZE = 65536
+
+# The snapshot manifest file name.  The manifest is stored in the parent of
+# the snapshot folder so that it is shared by successive snapshots.
+SNAPSHOT_MANIFEST = 'snapshot_manifest.json'
+
 
 # %% Exception Definitions
 class ProjectException(Exception):
@@ -112,6 +152,154 @@ def build_file_string(file_name: FileOption, folder: Path = None,
     return f'"{final_name}"'
 
 
+def quote_specs(package_list: List[str])->str:
+    '''Quote package specifications for a console command.
+
+    Each specification is double quoted so that version comparisons such as
+    `pandas>=2.0` are not read as redirection by the shell.
+
+    Args:
+        package_list (List[str]): Package names, optionally with version
+            restrictions.
+
+    Returns:
+        str: The quoted specifications, separated by spaces.
+    '''
+    return ' '.join(f'"{package}"' for package in package_list)
+
+
+def build_file_path(file_name: FileOption, folder: Path = None,
+                    default_name: str = 'file.txt')->Path:
+    '''Generates a full file path using the same rules as `build_file_string`.
+
+    Args:
+        file_name (FileOption): Either the full path to a file, the name of a
+            file, or a boolean.
+        folder (Path): The folder that is used with file_name to create a full
+            path.
+        default_name (str): A default file name to use if file_name == True.
+
+    Returns:
+        Path: The full path to the file, or None if file_name is False.
+    '''
+    file_string = build_file_string(file_name, folder, default_name)
+    if not file_string:
+        return None
+    return Path(file_string[1:-1])
+
+
+
+# %% Command instrumentation
+@dataclass
+class CommandRecord():
+    '''Measurements for one console command.
+
+    Attributes:
+        operation (str): The env_tools operation that ran the command.
+        command (str): The command that was run.
+        start_time (float): The time the command started (seconds since the
+            epoch).
+        wall_time (float): The elapsed time in seconds.
+        cpu_time (float): The user plus system CPU time used by child
+            processes in seconds, or None if it is not available.  Commands
+            that run at the same time share their CPU time.
+        exit_code (int): The command's exit code, or None if it timed out.
+        stdout_bytes (int): The number of bytes written to stdout.
+        stderr_bytes (int): The number of bytes written to stderr.
+    '''
+    operation: str
+    command: str
+    start_time: float
+    wall_time: float
+    cpu_time: float
+    exit_code: int
+    stdout_bytes: int
+    stderr_bytes: int
+
+
+# Functions called with a CommandRecord after every console command.
+# When the list is empty, commands are not measured.
+command_hooks: List[Callable[[CommandRecord], None]] = []
+
+# The name of the env_tools operation currently running.
+current_operation = contextvars.ContextVar('current_operation',
+                                           default='console_command')
+
+
+@contextmanager
+def operation_context(name: str):
+    '''Label the console commands run in a block with an operation name.
+
+    Args:
+        name (str): The operation name, e.g. 'install_kernel'.
+    '''
+    token = current_operation.set(name)
+    try:
+        yield
+    finally:
+        current_operation.reset(token)
+
+
+def traced_operation(func: Callable)->Callable:
+    '''Decorator that labels console commands with the function name.
+
+    When no command hooks are registered the function is called directly.
+
+    Args:
+        func (Callable): The env_tools operation.
+
+    Returns:
+        Callable: The wrapped function.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not command_hooks:
+            return func(*args, **kwargs)
+        with operation_context(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def child_cpu_time()->float:
+    '''The total CPU time used by finished child processes.
+
+    Returns:
+        float: User plus system time in seconds, or None on Windows where
+            child times are not reported.
+    '''
+    if os.name == 'nt':
+        return None
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def record_command(cmd_str: CmdType, start: float, wall_start: float,
+                   cpu_start: float, exit_code: int, stdout_bytes: int,
+                   stderr_bytes: int):
+    '''Pass the measurements for a finished command to the command hooks.
+
+    Args:
+        cmd_str (CmdType): The command that was run.
+        start (float): The wall clock start time (time.time()).
+        wall_start (float): The performance counter start time.
+        cpu_start (float): The child CPU time before the command started.
+        exit_code (int): The command's exit code, or None if it timed out.
+        stdout_bytes (int): The number of bytes written to stdout.
+        stderr_bytes (int): The number of bytes written to stderr.
+    '''
+    cpu_end = child_cpu_time()
+    cpu_time = None if cpu_start is None else cpu_end - cpu_start
+    if not isinstance(cmd_str, str):
+        cmd_str = ' '.join(str(part) for part in cmd_str)
+    record = CommandRecord(current_operation.get(), cmd_str, start,
+                           time.perf_counter() - wall_start, cpu_time,
+                           exit_code, stdout_bytes, stderr_bytes)
+    for hook in list(command_hooks):
+        try:
+            hook(record)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Command hook %r failed', hook)
+
 
 # %% Console command processing
 def error_check(output: subprocess.CompletedProcess, error_type: Exception,
@@ -133,15 +321,14 @@ def error_check(output: subprocess.CompletedProcess, error_type: Exception,
     except subprocess.CalledProcessError as err:
         msg = '\n'.join([error_msg, output.stderr.decode()])
         raise error_type(msg) from err
-    except subprocess.TimeoutExpired as err:
-        msg = '\n'.join(['Command timed out!', output.stderr.decode()])
-        raise AbortedCmdException(msg) from err
 
 
 def console_command(cmd_str: CmdType,
                     error_type: Exception = subprocess.CalledProcessError,
                     error_msg: str = 'A console_command error occurred!',
-                    abort_after: int = None)->str:
+                    abort_after: int = None,
+                    callback: OutputCallback = None,
+                    json_progress: bool = False)->str:
     '''Run a system console command.
 
     Run the command. Check for errors and raise the appropriate error if
@@ -149,6 +336,10 @@ def console_command(cmd_str: CmdType,
     If no error, return the output from the result of running the console
     command.
 
+    If callback is supplied, the command output is streamed to the callback
+    as it arrives (see `stream_command`) rather than being returned only when
+    the command exits.
+
     Args:
         cmd_str (CmdType): The operating system command to execute. Either a
             single string containing the entire command, or a list of strings,
@@ -160,25 +351,445 @@ def console_command(cmd_str: CmdType,
         abort_after (int, Optional): Abort the command call after the given
             number of seconds.  If None, do not time-out the command call.
             Default is None.
+        callback (OutputCallback, Optional): A function called with each line
+            of output (or each progress record if json_progress is True).
+            If None, the output is captured and returned when the command
+            exits.  Default is None.
+        json_progress (bool, Optional): If True and callback is supplied, the
+            output is treated as NUL separated `conda --json` progress
+            records followed by a final JSON document.  Default is False.
 
     Returns:
         str: The log output from running the console command.
     '''
-    output = subprocess.run(cmd_str, shell=True, capture_output=True,
-                            check=False, timeout=abort_after)
+    if callback is not None:
+        return stream_command(cmd_str, callback, error_type, error_msg,
+                              abort_after, json_progress)
+    measure = bool(command_hooks)
+    if measure:
+        start, wall_start = time.time(), time.perf_counter()
+        cpu_start = child_cpu_time()
+    process = subprocess.Popen(cmd_str, shell=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               start_new_session=new_session(abort_after))
+    try:
+        stdout, stderr = process.communicate(timeout=abort_after)
+    except subprocess.TimeoutExpired as err:
+        kill_process_tree(process)
+        stdout, stderr = process.communicate()
+        if measure:
+            record_command(cmd_str, start, wall_start, cpu_start, None,
+                           len(stdout or b''), len(stderr or b''))
+        msg = '\n'.join([f'Command timed out after {abort_after} seconds!',
+                         error_msg, stderr.decode() if stderr else ''])
+        raise AbortedCmdException(msg) from err
+    except BaseException:
+        # e.g. KeyboardInterrupt; do not leave the command running.
+        kill_process_tree(process)
+        raise
+    output = subprocess.CompletedProcess(cmd_str, process.returncode, stdout,
+                                         stderr)
+    if measure:
+        record_command(cmd_str, start, wall_start, cpu_start,
+                       output.returncode, len(output.stdout),
+                       len(output.stderr))
     # check for errors
     error_check(output, error_type, error_msg)
     cmd_log = output.stdout.decode()
     return cmd_log
 
+
+# %% Streaming console commands
+class OutputSplitter():
+    '''Split streamed command output into lines or JSON progress records.
+
+    In line mode each complete line is returned as a string.  In JSON mode
+    `conda --json` progress records, which are separated by NUL characters,
+    are returned as dictionaries; the final JSON document is kept as the
+    command result.
+
+    Attributes:
+        json_progress (bool): If True, split on NUL characters and parse
+            each record as JSON.
+        max_lines (int): The number of output lines retained for the result
+            in line mode.  If None, all lines are retained.
+    '''
+    def __init__(self, json_progress: bool = False, max_lines: int = None):
+        self.json_progress = json_progress
+        self.buffer = bytearray()
+        self.lines = deque(maxlen=max_lines)
+        self.byte_count = 0
+
+    def feed(self, data: bytes)->List[Union[str, Dict[str, Any]]]:
+        '''Add output data and return any complete lines or records.
+
+        Args:
+            data (bytes): The next chunk of command output.
+
+        Returns:
+            List[Union[str, Dict[str, Any]]]: The complete items.
+        '''
+        self.buffer.extend(data)
+        self.byte_count += len(data)
+        separator = b'\0' if self.json_progress else b'\n'
+        items = []
+        while True:
+            index = self.buffer.find(separator)
+            if index < 0:
+                break
+            segment = bytes(self.buffer[:index + 1])
+            del self.buffer[:index + 1]
+            items.extend(self.convert(segment))
+        return items
+
+    def convert(self, segment: bytes)->List[Union[str, Dict[str, Any]]]:
+        '''Convert a complete output segment to an item.
+
+        Args:
+            segment (bytes): A complete line or NUL terminated record.
+
+        Returns:
+            List[Union[str, Dict[str, Any]]]: The line or parsed record, or an
+                empty list if the record is blank.
+        '''
+        text = segment.decode('utf-8', errors='replace')
+        if not self.json_progress:
+            self.lines.append(text)
+            return [text]
+        text = text.strip('\0').strip()
+        if not text:
+            return []
+        try:
+            return [json.loads(text)]
+        except ValueError:
+            return [text]
+
+    def finish(self)->List[Union[str, Dict[str, Any]]]:
+        '''Return the items remaining when the output ends.
+
+        Returns:
+            List[Union[str, Dict[str, Any]]]: The last partial line, or in
+                JSON mode the final JSON document.
+        '''
+        segment = bytes(self.buffer)
+        self.buffer.clear()
+        if not segment:
+            return []
+        if self.json_progress:
+            # The final JSON document is the command result.
+            self.lines.append(segment.decode('utf-8', errors='replace'))
+        return self.convert(segment)
+
+    @property
+    def result(self)->str:
+        '''The retained output text.'''
+        return ''.join(self.lines)
+
+
+def new_session(abort_after: int = None)->bool:
+    '''Decide whether to start a command in its own session.
+
+    A command that can time out is started in its own session so that the
+    commands the shell started are killed with it.  Otherwise the command
+    stays in the caller's session, so that Ctrl-C also reaches it.
+
+    Args:
+        abort_after (int, Optional): The command time limit in seconds.
+
+    Returns:
+        bool: The `start_new_session` argument for the command.
+    '''
+    return abort_after is not None and os.name != 'nt'
+
+
+def kill_process_tree(process: subprocess.Popen):
+    '''Kill a shell process and any commands it started.
+
+    Args:
+        process (subprocess.Popen): A process started with
+            `start_new_session=True` (posix) or as the root of a process tree
+            (Windows).  On posix, only the process itself is killed if it is
+            not a session leader.  An `asyncio.subprocess.Process` may also be
+            used.
+    '''
+    if isinstance(process, subprocess.Popen):
+        process.poll()
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(f'taskkill /F /T /PID {process.pid}', shell=True,
+                           capture_output=True, check=False)
+        elif os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            # Not started in its own session; only the shell can be killed.
+            process.kill()
+    except OSError:
+        process.kill()
+
+
+def iter_command(cmd_str: CmdType,
+                 error_type: Exception = subprocess.CalledProcessError,
+                 error_msg: str = 'A console_command error occurred!',
+                 abort_after: int = None, json_progress: bool = False,
+                 max_lines: int = None
+                 )->Iterator[Union[str, Dict[str, Any]]]:
+    '''Run a system console command and yield its output as it arrives.
+
+    Only the last STDERR_BUFFER_LINES lines of stderr, and the last max_lines
+    lines of stdout, are held in memory.
+
+    Args:
+        cmd_str (CmdType): The operating system command to execute.
+        error_type (Exception, Optional): The type of exception to raise if
+            the command fails.  Default is subprocess.CalledProcessError.
+        error_msg (str, Optional): The Error message to include if required.
+        abort_after (int, Optional): Kill the command after the given number
+            of seconds.  If None, do not time-out the command.
+            Default is None.
+        json_progress (bool, Optional): If True, yield `conda --json`
+            progress records and then the final JSON document as
+            dictionaries.  Default is False.
+        max_lines (int, Optional): The number of stdout lines retained for
+            the generator's return value.  If None, all lines are retained.
+
+    Raises:
+        error_type: The command returned a non-zero exit code.
+        AbortedCmdException: The command timed out.
+
+    Yields:
+        Union[str, Dict[str, Any]]: Each line of output, or each parsed JSON
+            record.
+
+    Returns:
+        str: The retained output, available as the StopIteration value.
+    '''
+    measure = bool(command_hooks)
+    if measure:
+        start, wall_start = time.time(), time.perf_counter()
+        cpu_start = child_cpu_time()
+    process = subprocess.Popen(cmd_str, shell=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               start_new_session=new_session(abort_after))
+    stderr_lines = deque(maxlen=STDERR_BUFFER_LINES)
+    stderr_count = [0]
+
+    def read_stderr():
+        for line in process.stderr:
+            stderr_count[0] += len(line)
+            stderr_lines.append(line.decode('utf-8', errors='replace'))
+
+    stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+    timer = None
+    if abort_after is not None:
+        def abort():
+            timed_out.set()
+            kill_process_tree(process)
+        timer = threading.Timer(abort_after, abort)
+        timer.daemon = True
+        timer.start()
+    splitter = OutputSplitter(json_progress, max_lines)
+    try:
+        while True:
+            data = process.stdout.read1(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            yield from splitter.feed(data)
+        yield from splitter.finish()
+        process.wait()
+        stderr_reader.join()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # Stop the command if the caller abandons the generator.
+        kill_process_tree(process)
+        process.stdout.close()
+        process.stderr.close()
+        if measure:
+            exit_code = None if timed_out.is_set() else process.returncode
+            record_command(cmd_str, start, wall_start, cpu_start, exit_code,
+                           splitter.byte_count, stderr_count[0])
+    if timed_out.is_set():
+        msg = '\n'.join([f'Command timed out after {abort_after} seconds!',
+                         error_msg, ''.join(stderr_lines)])
+        raise AbortedCmdException(msg)
+    if process.returncode != 0:
+        msg = '\n'.join([error_msg, ''.join(stderr_lines)])
+        if issubclass(error_type, subprocess.CalledProcessError):
+            raise error_type(process.returncode, cmd_str, splitter.result,
+                             ''.join(stderr_lines))
+        raise error_type(msg)
+    return splitter.result
+
+
+def stream_command(cmd_str: CmdType, callback: OutputCallback,
+                   error_type: Exception = subprocess.CalledProcessError,
+                   error_msg: str = 'A console_command error occurred!',
+                   abort_after: int = None, json_progress: bool = False,
+                   max_lines: int = None)->str:
+    '''Run a system console command, passing output to a callback.
+
+    Args:
+        cmd_str (CmdType): The operating system command to execute.
+        callback (OutputCallback): A function called with each line of
+            output, or each parsed JSON record if json_progress is True.
+        error_type (Exception, Optional): The type of exception to raise if
+            the command fails.  Default is subprocess.CalledProcessError.
+        error_msg (str, Optional): The Error message to include if required.
+        abort_after (int, Optional): Kill the command after the given number
+            of seconds.  If None, do not time-out the command.
+            Default is None.
+        json_progress (bool, Optional): If True, the output is treated as
+            `conda --json` progress records followed by a final JSON
+            document.  Default is False.
+        max_lines (int, Optional): The number of stdout lines retained for
+            the returned output.  If None, all lines are retained.
+
+    Raises:
+        error_type: The command returned a non-zero exit code.
+        AbortedCmdException: The command timed out.
+
+    Returns:
+        str: The retained output.  In JSON mode this is the final JSON
+            document, so it can be passed to `json.loads`.
+    '''
+    output = iter_command(cmd_str, error_type, error_msg, abort_after,
+                          json_progress, max_lines)
+    while True:
+        try:
+            item = next(output)
+        except StopIteration as done:
+            return done.value
+        callback(item)
+
+
+async def async_console_command(
+        cmd_str: CmdType,
+        error_type: Exception = subprocess.CalledProcessError,
+        error_msg: str = 'A console_command error occurred!',
+        abort_after: int = None, callback: OutputCallback = None,
+        json_progress: bool = False, max_lines: int = None)->str:
+    '''Run a system console command from an asyncio event loop.
+
+    Many commands can be run concurrently with `asyncio.gather` without
+    using threads.  Output is passed to callback as it arrives.
+
+    Args:
+        cmd_str (CmdType): The operating system command to execute.  A list
+            of strings is joined with spaces.
+        error_type (Exception, Optional): The type of exception to raise if
+            the command fails.  Default is subprocess.CalledProcessError.
+        error_msg (str, Optional): The Error message to include if required.
+        abort_after (int, Optional): Kill the command after the given number
+            of seconds.  If None, do not time-out the command.
+            Default is None.
+        callback (OutputCallback, Optional): A function called with each line
+            of output, or each parsed JSON record if json_progress is True.
+            Default is None.
+        json_progress (bool, Optional): If True, the output is treated as
+            `conda --json` progress records followed by a final JSON
+            document.  Default is False.
+        max_lines (int, Optional): The number of stdout lines retained for
+            the returned output.  If None, all lines are retained.
+
+    Raises:
+        error_type: The command returned a non-zero exit code.
+        AbortedCmdException: The command timed out.
+
+    Returns:
+        str: The retained output.
+    '''
+    # asyncio is already loaded when this runs, but importing it here keeps
+    # it out of the start-up time of scripts that do not use it.
+    import asyncio  # pylint: disable=import-outside-toplevel
+    if not isinstance(cmd_str, str):
+        cmd_str = ' '.join(str(part) for part in cmd_str)
+    measure = bool(command_hooks)
+    if measure:
+        start, wall_start = time.time(), time.perf_counter()
+        cpu_start = child_cpu_time()
+    process = await asyncio.create_subprocess_shell(
+        cmd_str, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=new_session(abort_after))
+    stderr_lines = deque(maxlen=STDERR_BUFFER_LINES)
+    splitter = OutputSplitter(json_progress, max_lines)
+
+    async def read_stdout():
+        while True:
+            data = await process.stdout.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            for item in splitter.feed(data):
+                if callback is not None:
+                    callback(item)
+        for item in splitter.finish():
+            if callback is not None:
+                callback(item)
+
+    stderr_count = 0
+
+    async def read_stderr():
+        nonlocal stderr_count
+        async for line in process.stderr:
+            stderr_count += len(line)
+            stderr_lines.append(line.decode('utf-8', errors='replace'))
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(read_stdout(), read_stderr(), process.wait()),
+            timeout=abort_after)
+    except asyncio.TimeoutError as err:
+        kill_process_tree(process)
+        await process.wait()
+        if measure:
+            record_command(cmd_str, start, wall_start, cpu_start, None,
+                           splitter.byte_count, stderr_count)
+        msg = '\n'.join([f'Command timed out after {abort_after} seconds!',
+                         error_msg, ''.join(stderr_lines)])
+        raise AbortedCmdException(msg) from err
+    except BaseException:
+        kill_process_tree(process)
+        raise
+    if measure:
+        record_command(cmd_str, start, wall_start, cpu_start,
+                       process.returncode, splitter.byte_count, stderr_count)
+    if process.returncode != 0:
+        if issubclass(error_type, subprocess.CalledProcessError):
+            raise error_type(process.returncode, cmd_str, splitter.result,
+                             ''.join(stderr_lines))
+        raise error_type('\n'.join([error_msg, ''.join(stderr_lines)]))
+    return splitter.result
+
+
 # %% Conda Environment Functions
-def list_environments()->List[FullEnvRef]:
-    '''Get list of current Anaconda environments.
+@traced_operation
+def query_environments(native: bool = True)->List[FullEnvRef]:
+    '''Query Anaconda for the list of current environments.
+
+    The environments are read directly from the Conda base installation,
+    `~/.conda/environments.txt` and the configured *envs_dirs* folders.  If
+    no base installation can be found, or native is False, `conda env list`
+    is run instead.  Use `list_environments` to take advantage of the cached
+    environment registry.
+
+    Args:
+        native (bool, optional): If True, find the environments without
+            starting `conda`. Defaults to True.
 
     Returns:
         List[FullEnvRef]: A list containing the references to all current
             Anaconda environments
     '''
+    if native:
+        try:
+            return discover_environments()
+        except FileNotFoundError:
+            logger.debug('No Conda base installation found; '
+                         'using conda env list')
     env_pattern = re.compile(
         r'(?P<name>'  # Start of *name* group.
         r'[a-z0-9_]'  # Name begins with letter, number or _.
@@ -186,7 +797,7 @@ def list_environments()->List[FullEnvRef]:
         r')'          # End of *name* group.
         r'[ *]{2,}'   # 2 or more spaces or * in a row.
         r'(?P<path>'  # Start of *path* group.
-        r'[A-Z]:'     # Drive letter, followed by a :.
+        r'(?:[A-Z]:|/)'  # Drive letter and :, or the posix root.
         r'[^\r\n]*'   # Remaining text before the end of the line.
         r')',         # End of *path* group.
         flags=re.IGNORECASE)
@@ -199,7 +810,156 @@ def list_environments()->List[FullEnvRef]:
     return env_info
 
 
-def build_env_table(env_storage_path: Path = None)->pd.DataFrame:
+class EnvironmentRegistry():
+    '''In-process cache of the current Anaconda environments.
+
+    The registry holds the result of `query_environments` so that a batch of
+    operations only needs to query Anaconda once.  The cached list is
+    refreshed when it is older than `ttl` seconds, when a refresh is forced,
+    or after the registry has been invalidated (e.g. by
+    `create_environment` or `remove_environment`).
+
+    Attributes:
+        ttl (float): The number of seconds that the cached environment list
+            remains valid.  If None, the cache does not expire.  If 0, the
+            environments are queried every time.
+        env_list (List[FullEnvRef]): The cached environment references.
+        names (Dict[str, Path]): Environment paths indexed by environment
+            name.
+        paths (Dict[str, str]): Environment names indexed by the string form
+            of the environment path.
+    '''
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.env_list: List[FullEnvRef] = []
+        self.names: Dict[str, Path] = {}
+        self.paths: Dict[str, str] = {}
+        self.last_refresh: float = None
+        self.lock = threading.RLock()
+
+    def is_stale(self)->bool:
+        '''Indicate whether the cached environment list must be refreshed.
+
+        Returns:
+            bool: True if the environments have never been queried, have been
+                invalidated, or are older than the ttl.
+        '''
+        if self.last_refresh is None:
+            return True
+        if self.ttl is None:
+            return False
+        age = time.monotonic() - self.last_refresh
+        return age >= self.ttl
+
+    def refresh(self)->List[FullEnvRef]:
+        '''Query Anaconda and rebuild the environment lookup tables.
+
+        Returns:
+            List[FullEnvRef]: A list containing the references to all current
+                Anaconda environments
+        '''
+        with self.lock:
+            env_list = query_environments()
+            self.env_list = env_list
+            self.names = {name: path for name, path in env_list}
+            self.paths = {str(path): name for name, path in env_list}
+            self.last_refresh = time.monotonic()
+            logger.debug('Environment registry refreshed with %d environments',
+                         len(env_list))
+            return list(env_list)
+
+    def invalidate(self):
+        '''Mark the cached environment list as out of date.'''
+        with self.lock:
+            self.last_refresh = None
+
+    def environments(self, force_refresh: bool = False)->List[FullEnvRef]:
+        '''Get the current Anaconda environments.
+
+        Args:
+            force_refresh (bool, optional): If True, query Anaconda even if the
+                cached list is still valid. Defaults to False.
+
+        Returns:
+            List[FullEnvRef]: A list containing the references to all current
+                Anaconda environments
+        '''
+        with self.lock:
+            if force_refresh or self.is_stale():
+                return self.refresh()
+            return list(self.env_list)
+
+    def lookup(self, env_ref: EnvRef, force_refresh: bool = False)->FullEnvRef:
+        '''Find the environment matching an environment name or path.
+
+        If env_ref is not found in a cached list, the list is refreshed once
+        in case the environment was created outside of this process.
+
+        Args:
+            env_ref (EnvRef): A reference to the Conda environment either by
+                it's name or by the path to the environment.
+            force_refresh (bool, optional): If True, query Anaconda even if the
+                cached list is still valid. Defaults to False.
+
+        Raises:
+            MissingEnvironment: env_ref does not correspond with a current
+                Anaconda environment.
+
+        Returns:
+            FullEnvRef: The name and path of the environment.
+        '''
+        with self.lock:
+            refreshed = force_refresh or self.is_stale()
+            self.environments(force_refresh)
+            env_def = self.find(env_ref)
+            if env_def is None and not refreshed:
+                self.refresh()
+                env_def = self.find(env_ref)
+        if env_def is None:
+            raise MissingEnvironment(f'Environment {env_ref} does not exist')
+        return env_def
+
+    def find(self, env_ref: EnvRef)->FullEnvRef:
+        '''Search the cached environments for an environment name or path.
+
+        Args:
+            env_ref (EnvRef): A reference to the Conda environment either by
+                it's name or by the path to the environment.
+
+        Returns:
+            FullEnvRef: The name and path of the environment, or None if
+                env_ref is not in the cached environments.
+        '''
+        if env_ref in self.names:
+            return (env_ref, self.names[env_ref])
+        if str(env_ref) in self.paths:
+            return (self.paths[str(env_ref)], Path(env_ref))
+        return None
+
+
+# The environment registry shared by the functions in this module.
+env_registry = EnvironmentRegistry()
+
+
+def list_environments(force_refresh: bool = False)->List[FullEnvRef]:
+    '''Get list of current Anaconda environments.
+
+    The list is taken from the environment registry, so `conda env list` is
+    only run when the cached list has expired or been invalidated.
+
+    Args:
+        force_refresh (bool, optional): If True, query Anaconda even if the
+            cached list is still valid. Defaults to False.
+
+    Returns:
+        List[FullEnvRef]: A list containing the references to all current
+            Anaconda environments
+    '''
+    return env_registry.environments(force_refresh)
+
+
+@traced_operation
+def build_env_table(env_storage_path: Path = None)->'pd.DataFrame':
     '''Save a spreadsheet table with environments and their paths.
 
     Args:
@@ -211,12 +971,15 @@ def build_env_table(env_storage_path: Path = None)->pd.DataFrame:
     Returns:
         pd.DataFrame: A table with environments and their paths.
     '''
+    import pandas as pd  # pylint: disable=import-outside-toplevel
     env_list = list_environments()
     env_data = pd.DataFrame(env_list)
     env_data.columns = ['Environment', 'Environment Path']
     if env_storage_path:
         if env_storage_path.is_dir():
             env_table_file = env_storage_path / 'Conda Environments.xlsx'
+        else:
+            env_table_file = env_storage_path
         env_data.to_excel(env_table_file)
     return env_data
 
@@ -247,6 +1010,46 @@ def activate_environment(env_name: str)->str:
     return cmd_str
 
 
+def run_in_environment(env_name: str, cmd_str: str,
+                       error_type: Exception = AnacondaException,
+                       error_msg: str = 'A console_command error occurred!',
+                       abort_after: int = None, session=None)->str:
+    '''Run a command in an activated Conda environment.
+
+    If a session is supplied, the command is run in the session's
+    already-activated shell.  Otherwise the command is prefixed by
+    `activate_environment` and run with `console_command`.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+        cmd_str (str): The command to run in the activated environment.
+        error_type (Exception, Optional): The type of exception to raise if an
+            error occurs.  Default is AnacondaException.
+        error_msg (str, Optional): The Error message to include if required.
+            Default is 'A console_command error occurred!'.
+        abort_after (int, Optional): Abort the command call after the given
+            number of seconds.  If None, do not time-out the command call.
+            Default is None.
+        session (env_session.EnvironmentSession, Optional): An activated shell
+            session for env_name.  If None, activate the environment for this
+            command only. Default is None.
+
+    Raises:
+        ValueError: The session is for a different environment.
+
+    Returns:
+        str: The log output from running the command.
+    '''
+    if session is None:
+        activated_cmd = activate_environment(env_name) + cmd_str
+        return console_command(activated_cmd, error_type, error_msg,
+                               abort_after)
+    if session.env_name != env_name:
+        raise ValueError(f'Session is for environment {session.env_name}, '
+                         f'not {env_name}.')
+    return session.run(cmd_str, error_type, error_msg, abort_after)
+
+
 def set_env_ref(env_ref: EnvRef)->str:
     '''Create a string environment reference for use in Conda commands.
 
@@ -269,31 +1072,29 @@ def set_env_ref(env_ref: EnvRef)->str:
             name. The second is a Conda command segment referencing the
             desired environment.
     '''
-    # Build list of current environment names and paths
-    env_list = list_environments()
-    env_names = {env[0] for env in env_list}
-    env_paths = {str(env[1]) for env in env_list}
-
+    # Look up the environment in the cached environment registry.
+    env_registry.lookup(env_ref)
     # Check for environment name
-    if env_ref in env_names:
+    if env_ref in env_registry.names:
         # env_ref is an environment name
         env_name = env_ref
         env_cmd_ref = f'--name {env_ref}'
-    # Check for environment path
-    elif str(env_ref) in env_paths:
+    else:
         # env_ref is a path reference.
         # The environment name is the name of the env folder.
         env_name = Path(env_ref).name
         env_cmd_ref = f'-p {str(env_ref)}'
-    else:
-        raise MissingEnvironment(f'Environment {env_ref} does not exist')
     return (env_name, env_cmd_ref)
 
 
+@traced_operation
 def save_env_specs(env_ref: EnvRef, save_folder: Path,
                    spec_file: FileNameOption = True,
                    yml_file: FileNameOption = True,
-                   history_json: FileNameOption = True):
+                   history_json: FileNameOption = True,
+                   abort_after: int = None, parallel: bool = False,
+                   native: bool = True,
+                   store: SnapshotStore = None)->Dict[str, str]:
     '''Store *spec*, *.yml* and *.json* history files for the environment.
 
     Default spec file names will have the form: {env_name}_spec.txt'
@@ -315,17 +1116,48 @@ def save_env_specs(env_ref: EnvRef, save_folder: Path,
             file containing the packages explicitly installed to create the
             environment.  If True, use the default file name pattern.
             Default is True.
-    '''
+        abort_after (int, Optional): Abort the exports if they have not all
+            finished after the given number of seconds.  If None, do not
+            time-out the exports.  Default is None.
+        parallel (bool, Optional): If True, run the spec, yml and history
+            exports at the same time.  Default is False.
+        native (bool, Optional): If True, build the exports directly from the
+            environment's `conda-meta` folder instead of calling `conda`.  If
+            the `conda-meta` files cannot be read, the `conda` commands are
+            used instead.  Default is True.
+        store (SnapshotStore, Optional): If given, add the files to this
+            deduplicated snapshot store instead of saving them in
+            save_folder.  Default is None.
+
+    Raises:
+        AnacondaException: An export command failed.
+        AbortedCmdException: An export command timed out.
 
+    Returns:
+        Dict[str, str]: If store is given, the content hash of each stored
+            file, indexed by file name.  Otherwise, an empty dictionary.
+    '''
+    if store is not None:
+        return store_env_specs(env_ref, store, spec_file, yml_file,
+                               history_json, abort_after, parallel, native)
     env_name, env_cmd_ref = set_env_ref(env_ref)
+    if native:
+        try:
+            save_native_env_specs(env_ref, env_name, save_folder, spec_file,
+                                  yml_file, history_json)
+            return {}
+        except (OSError, ValueError, KeyError) as err:
+            logger.debug('Native export failed for %s (%s); using conda.',
+                         env_name, err)
+    export_cmds = []
     default_name = f'{env_name}_spec.txt'
     full_spec_file = build_file_string(spec_file, save_folder, default_name)
     if full_spec_file:
         # Generate a conda environment spec file
         save_spec_cmd  = f'conda list --explicit {env_cmd_ref} '
         save_spec_cmd += f'> {full_spec_file}'
-        console_command(save_spec_cmd, AnacondaException,
-                        f'Error saving {env_name} environment spec file.')
+        export_cmds.append((save_spec_cmd,
+                            f'Error saving {env_name} environment spec file.'))
 
     default_name = f'{env_name}.yml'
     full_yml_file = build_file_string(yml_file, save_folder, default_name)
@@ -333,21 +1165,141 @@ def save_env_specs(env_ref: EnvRef, save_folder: Path,
         # Generate a conda environment .yml file
         save_yml_cmd  = f'conda env export {env_cmd_ref} '
         save_yml_cmd += f'--file {full_yml_file}'
-        console_command(save_yml_cmd, AnacondaException,
-                        f'Error saving {env_name}.yml file.')
+        export_cmds.append((save_yml_cmd, f'Error saving {env_name}.yml file.'))
 
     default_name = f'{env_name}.json'
     full_history_json_file = build_file_string(history_json, save_folder,
                                                default_name)
-    if history_json:
+    if full_history_json_file:
         # Generate a conda environment history .json file
         save_history_cmd  = r'conda env export --from-history --json '
         save_history_cmd += f'{env_cmd_ref} > {full_history_json_file}'
-        console_command(save_history_cmd, AnacondaException,
-                        f'Error saving {env_name}.json file.')
+        export_cmds.append((save_history_cmd,
+                            f'Error saving {env_name}.json file.'))
+
+    if parallel and len(export_cmds) > 1:
+        # The exports are independent, so run them at the same time.  Each
+        # runs in a copy of this context so that its commands are recorded
+        # under the current operation.
+        with ThreadPoolExecutor(max_workers=len(export_cmds)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run,
+                                       console_command, cmd, AnacondaException,
+                                       msg, abort_after)
+                       for cmd, msg in export_cmds]
+            # Calling result() re-raises any error from the export.
+            for future in futures:
+                future.result()
+    else:
+        # The time limit applies to all of the exports together.
+        deadline = None
+        if abort_after is not None:
+            deadline = time.monotonic() + abort_after
+        for cmd, msg in export_cmds:
+            time_left = None
+            if deadline is not None:
+                time_left = deadline - time.monotonic()
+                if time_left <= 0:
+                    raise AbortedCmdException(
+                        f'Exports timed out after {abort_after} seconds!\n'
+                        f'{msg}')
+            console_command(cmd, AnacondaException, msg, time_left)
+    return {}
+
+
+def save_native_env_specs(env_ref: EnvRef, env_name: str, save_folder: Path,
+                          spec_file: FileNameOption = True,
+                          yml_file: FileNameOption = True,
+                          history_json: FileNameOption = True):
+    '''Store environment export files built from the `conda-meta` folder.
+
+    The files match those created by `conda list --explicit`,
+    `conda env export` and `conda env export --from-history --json`.
 
+    Args:
+        env_ref (EnvRef): A reference to the Conda environment either by it's
+            name or by the path to the environment.
+        env_name (str): The environment name used for default file names.
+        save_folder (str): Path to the folder where the information is to be
+            saved.
+        spec_file (FileNameOption): The spec file name, or True for the default
+            name.  If False, do not save a spec file.  Default is True.
+        yml_file (FileNameOption): The *.yml* file name, or True for the
+            default name.  If False, do not save a *.yml* file.
+            Default is True.
+        history_json (FileNameOption): The history *.json* file name, or True
+            for the default name.  If False, do not save a *.json* file.
+            Default is True.
 
-def get_conda_info(env_ref: EnvRef = None, info_storage_path: Path = None)->dict:
+    Raises:
+        FileNotFoundError: The environment does not contain a `conda-meta`
+            folder.
+    '''
+    conda_name, env_path = env_registry.lookup(env_ref)
+    export_files = {
+        'spec': build_file_path(spec_file, save_folder,
+                                f'{env_name}_spec.txt'),
+        'yml': build_file_path(yml_file, save_folder, f'{env_name}.yml'),
+        'history': build_file_path(history_json, save_folder,
+                                   f'{env_name}.json')
+        }
+    exports = export_env_specs(conda_name, env_path,
+                               **{key: file_path is not None
+                                  for key, file_path in export_files.items()})
+    for key, export_text in exports.items():
+        export_files[key].write_text(export_text, encoding='utf-8')
+
+
+def store_env_specs(env_ref: EnvRef, store: SnapshotStore,
+                    spec_file: FileNameOption = True,
+                    yml_file: FileNameOption = True,
+                    history_json: FileNameOption = True,
+                    abort_after: int = None, parallel: bool = False,
+                    native: bool = True)->Dict[str, str]:
+    '''Add *spec*, *.yml* and *.json* history files to a snapshot store.
+
+    The native exports are stored directly from memory.  When the `conda`
+    commands are needed, the files are exported to a temporary folder first.
+    The arguments match `save_env_specs`.
+
+    Returns:
+        Dict[str, str]: The content hash of each stored file, indexed by file
+            name.
+    '''
+    env_name, _ = set_env_ref(env_ref)
+    # Only the file names are used, since the files are not saved in a folder.
+    file_paths = {
+        'spec': build_file_path(spec_file, Path(), f'{env_name}_spec.txt'),
+        'yml': build_file_path(yml_file, Path(), f'{env_name}.yml'),
+        'history': build_file_path(history_json, Path(), f'{env_name}.json')
+        }
+    file_names = {key: file_path.name if file_path else False
+                  for key, file_path in file_paths.items()}
+    if native:
+        try:
+            conda_name, env_path = env_registry.lookup(env_ref)
+            exports = export_env_specs(conda_name, env_path,
+                                       **{key: bool(file_name)
+                                          for key, file_name
+                                          in file_names.items()})
+            return {file_names[key]: store.put_file(
+                        export_text.encode('utf-8'))
+                    for key, export_text in exports.items()}
+        except (OSError, ValueError, KeyError) as err:
+            logger.debug('Native export failed for %s (%s); using conda.',
+                         env_name, err)
+    with tempfile.TemporaryDirectory() as export_folder:
+        export_path = Path(export_folder)
+        save_env_specs(env_ref, export_path, file_names['spec'],
+                       file_names['yml'], file_names['history'], abort_after,
+                       parallel, native=False)
+        return {file_name: store.put_file(
+                    (export_path / file_name).read_bytes())
+                for file_name in file_names.values() if file_name}
+
+
+@traced_operation
+def get_conda_info(env_ref: EnvRef = None, info_storage_path: Path = None,
+                   session=None, native: bool = True)->dict:
     '''Get information about the current Conda environment.
 
     If a file path is provided, save the json info to that file.
@@ -361,20 +1313,41 @@ def get_conda_info(env_ref: EnvRef = None, info_storage_path: Path = None)->dict
             json info will be saved in a file named:
             'conda_info_<env_name>.json'.  If None, do not save the data.
             Defaults to None.
+        session (env_session.EnvironmentSession, Optional): An activated shell
+            session for the environment.  If None, activate the environment
+            for this command only. Default is None.
+        native (bool, optional): If True, read the main `conda info` settings
+            from the Conda installation files instead of running
+            `conda info --envs --json`.  `conda` is still run if no base
+            installation is found.  Defaults to True.
 
     Returns:
         dict: Conda environment parameters as nested dictionaries.
     '''
-    if env_ref:
-        env_name  = set_env_ref(env_ref)[0]
-        conda_info_cmd = activate_environment(env_name)
-    else:
-        conda_info_cmd = ''
+    conda_info = None
+    if native:
+        env_path = None
         env_name = 'base'
-
-    conda_info_cmd += r'conda info --envs --json'
-    msg = f'Unable to get Anaconda info for ({env_name})'
-    conda_info = console_command(conda_info_cmd, AnacondaException, msg)
+        if env_ref:
+            env_name = set_env_ref(env_ref)[0]
+            env_path = env_registry.lookup(env_ref)[1]
+        try:
+            conda_info = json.dumps(read_conda_info(env_path), indent=2)
+        except FileNotFoundError:
+            logger.debug('No Conda base installation found; using conda info')
+    if conda_info is None:
+        conda_info_cmd = r'conda info --envs --json'
+        if env_ref:
+            env_name  = set_env_ref(env_ref)[0]
+            msg = f'Unable to get Anaconda info for ({env_name})'
+            conda_info = run_in_environment(env_name, conda_info_cmd,
+                                            AnacondaException, msg,
+                                            session=session)
+        else:
+            env_name = 'base'
+            msg = f'Unable to get Anaconda info for ({env_name})'
+            conda_info = console_command(conda_info_cmd, AnacondaException,
+                                         msg)
 
     # If supplied, save the data to a .json file
     if info_storage_path:
@@ -389,32 +1362,341 @@ def get_conda_info(env_ref: EnvRef = None, info_storage_path: Path = None)->dict
     return conda_info_dict
 
 
-def log_all_envs(env_storage_path: Path):
-    '''Store environment info for each environment.
+@dataclass
+class EnvLogResult():
+    '''The outcome of storing the environment info for one environment.
+
+    Attributes:
+        env_name (str): The name of the Conda environment.
+        env_path (Path): The path to the Conda environment.
+        status (str): One of 'success', 'unchanged', 'failure' or
+            'timed out'.
+        duration (float): The time taken to store the environment info in
+            seconds.
+        message (str): The error message if the environment info could not be
+            stored.
+        fingerprint (str): The conda-meta fingerprint of the environment, or
+            None if it could not be generated.
+        files (List[str]): The names of the environment info files.
+        blobs (Dict[str, str]): When a snapshot store is used, the content
+            hash of each environment info file, indexed by file name.
+    '''
+    env_name: str
+    env_path: Path
+    status: str = 'success'
+    duration: float = 0.0
+    message: str = ''
+    fingerprint: str = None
+    files: List[str] = field(default_factory=list)
+    blobs: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def succeeded(self)->bool:
+        '''True if the environment info was stored or carried forward.'''
+        return self.status in ('success', 'unchanged')
+
+
+def env_info_files(env_path: Path)->List[str]:
+    '''List the default environment info file names for an environment.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        List[str]: The spec, *.yml* and history *.json* file names.
+    '''
+    env_name = Path(env_path).name
+    return [f'{env_name}_spec.txt', f'{env_name}.yml', f'{env_name}.json']
+
+
+def read_snapshot_manifest(manifest_file: Path)->SnapshotManifest:
+    '''Read the snapshot manifest.
+
+    Args:
+        manifest_file (Path): The path to the manifest file.
+
+    Returns:
+        SnapshotManifest: The manifest entries, or an empty dictionary if the
+            manifest does not exist or cannot be read.
+    '''
+    if not manifest_file.exists():
+        return {}
+    try:
+        return json.loads(manifest_file.read_text(encoding='utf-8'))
+    except ValueError:
+        logger.warning('Ignoring unreadable snapshot manifest %s',
+                       manifest_file)
+        return {}
+
+
+def write_snapshot_manifest(manifest_file: Path, manifest: SnapshotManifest):
+    '''Save the snapshot manifest.
+
+    The manifest is written to a temporary file and then moved into place so
+    that an interrupted run does not leave a partial manifest.
+
+    Args:
+        manifest_file (Path): The path to the manifest file.
+        manifest (SnapshotManifest): The manifest entries.
+    '''
+    temp_file = manifest_file.with_suffix('.tmp')
+    temp_file.write_text(json.dumps(manifest, indent=2, sort_keys=True),
+                         encoding='utf-8')
+    os.replace(temp_file, manifest_file)
+
+
+def link_file(source: Path, target: Path):
+    '''Create a hard link to a file, copying it if a link is not possible.
 
     Args:
+        source (Path): The existing file.
+        target (Path): The new file path.
+    '''
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def carry_forward_env(previous: Dict[str, Union[str, List[str]]],
+                      env_storage_path: Path)->List[str]:
+    '''Link the environment info files from an earlier snapshot.
+
+    Args:
+        previous (Dict[str, Union[str, List[str]]]): The manifest entry for
+            the environment.
+        env_storage_path (Path): The current snapshot folder.
+
+    Raises:
+        FileNotFoundError: One of the earlier files no longer exists.
+
+    Returns:
+        List[str]: The names of the linked files.
+    '''
+    source_folder = Path(previous['snapshot'])
+    for file_name in previous['files']:
+        source = source_folder / file_name
+        target = env_storage_path / file_name
+        if not source.exists():
+            raise FileNotFoundError(f'Snapshot file {source} is missing')
+        if source.resolve() != target.resolve():
+            link_file(source, target)
+    return list(previous['files'])
+
+
+def release_links(env_storage_path: Path, file_names: List[str]):
+    '''Remove hard-linked files before they are re-exported.
+
+    Exporting writes into the existing file, which would also change the
+    linked copy in an earlier snapshot.
+
+    Args:
+        env_storage_path (Path): The current snapshot folder.
+        file_names (List[str]): The environment info file names.
+    '''
+    for file_name in file_names:
+        target = env_storage_path / file_name
+        if target.exists() and target.stat().st_nlink > 1:
+            target.unlink()
+
+
+def log_env(env_def: FullEnvRef, env_storage_path: Path,
+            abort_after: int = None, parallel: bool = False,
+            previous: Dict[str, Union[str, List[str]]] = None,
+            store: SnapshotStore = None)->EnvLogResult:
+    '''Store environment info for a single environment.
+
+    If previous is supplied and the environment's conda-meta fingerprint
+    matches the one recorded in it, the earlier files are linked into
+    env_storage_path (or, with a snapshot store, the earlier stored files are
+    referenced) instead of being exported again.
+    Errors are recorded in the returned result rather than raised.
+
+    Args:
+        env_def (FullEnvRef): The name and path of the environment.
         env_storage_path (Path): Path to the folder where the information is to
             be saved.
+        abort_after (int, Optional): Abort the exports for an environment if
+            they have not finished after the given number of seconds.  If
+            None, do not time-out the exports.  Default is None.
+        parallel (bool, Optional): If True, run the spec, yml and history
+            exports at the same time.  Default is False.
+        previous (Dict[str, Union[str, List[str]]], Optional): The snapshot
+            manifest entry for the environment.  If None, always export the
+            environment info.  Default is None.
+        store (SnapshotStore, Optional): If given, add the files to this
+            snapshot store instead of saving them in env_storage_path.
+            Default is None.
+
+    Returns:
+        EnvLogResult: The outcome of storing the environment info.
     '''
-    env_list = list_environments()
-    if not env_storage_path.exists():
-        env_storage_path.mkdir()
-    for env_def in env_list:
-        env_name, env_path = env_def
-        logger.info('Storing environment for %s', env_name)
+    env_name, env_path = env_def
+    result = EnvLogResult(env_name, env_path)
+    start = time.perf_counter()
+    try:
+        result.fingerprint = env_fingerprint(env_path)
+    except OSError:
+        result.fingerprint = None
+    file_names = env_info_files(env_path)
+    unchanged = (previous is not None and result.fingerprint is not None
+                 and previous.get('fingerprint') == result.fingerprint)
+    if unchanged and store is not None:
+        blobs = previous.get('blobs', {})
+        if blobs and all(store.has_file(file_hash)
+                         for file_hash in blobs.values()):
+            result.blobs = dict(blobs)
+            result.files = list(blobs)
+            result.status = 'unchanged'
+            result.duration = time.perf_counter() - start
+            return result
+    elif unchanged:
         try:
-            save_env_specs(env_path, env_storage_path)
-        except AnacondaException:
-            logger.warning('Unable to store environment for %s', env_name)
+            result.files = carry_forward_env(previous, env_storage_path)
+            result.status = 'unchanged'
+            result.duration = time.perf_counter() - start
+            return result
+        except (OSError, KeyError) as err:
+            logger.debug('Unable to carry forward %s (%s); exporting.',
+                         env_name, err)
+    try:
+        if store is not None:
+            result.blobs = save_env_specs(env_path, env_storage_path,
+                                          abort_after=abort_after,
+                                          parallel=parallel, store=store)
+            result.files = list(result.blobs)
+        else:
+            release_links(env_storage_path, file_names)
+            save_env_specs(env_path, env_storage_path,
+                           abort_after=abort_after, parallel=parallel)
+            result.files = file_names
+    except AbortedCmdException as err:
+        result.status = 'timed out'
+        result.message = str(err)
+    except ProjectException as err:
+        result.status = 'failure'
+        result.message = str(err)
+    result.duration = time.perf_counter() - start
+    return result
+
+
+@traced_operation
+def log_all_envs(env_storage_path: Path, max_workers: int = 1,
+                 abort_after: int = None, parallel_exports: bool = False,
+                 incremental: bool = False, full_rescan: bool = False,
+                 manifest_file: Path = None,
+                 store: SnapshotStore = None)->List[EnvLogResult]:
+    '''Store environment info for each environment.
+
+    If max_workers is greater than 1, the environments are stored
+    concurrently on a thread pool.  Results are logged in the order of the
+    environment list regardless of the order in which they complete.
+
+    If incremental is True, a snapshot manifest is kept next to the snapshot
+    folder.  Environments whose conda-meta fingerprint has not changed since
+    they were last stored are linked from the earlier snapshot instead of
+    being exported again.
+
+    If store is given, nothing is written to env_storage_path.  The files
+    are added to the deduplicated snapshot store, and the snapshot is saved
+    in the store under the name of env_storage_path.  Use
+    `SnapshotStore.restore_snapshot` to recreate the snapshot folder.
 
+    Args:
+        env_storage_path (Path): Path to the folder where the information is to
+            be saved.
+        max_workers (int, Optional): The number of environments to store at
+            the same time. Default is 1.
+        abort_after (int, Optional): Abort the exports for an environment if
+            they have not finished after the given number of seconds.  If
+            None, do not time-out the exports.  Default is None.
+        parallel_exports (bool, Optional): If True, run the spec, yml and
+            history exports for an environment at the same time.
+            Default is False.
+        incremental (bool, Optional): If True, skip environments that have not
+            changed since the last snapshot. Default is False.
+        full_rescan (bool, Optional): If True, export every environment even
+            when incremental is True, and rebuild the manifest.
+            Default is False.
+        manifest_file (Path, Optional): The snapshot manifest file.  If None,
+            `SNAPSHOT_MANIFEST` in the parent of env_storage_path (or in the
+            snapshot store folder) is used.  Default is None.
+        store (SnapshotStore, Optional): If given, save the snapshot in this
+            deduplicated snapshot store.  Default is None.
 
-def create_environment(new_env: str, python_version: str = 3.10)->Dict[str,str]:
+    Returns:
+        List[EnvLogResult]: The outcome for each environment, in the order of
+            the environment list.
+    '''
+    env_list = list_environments()
+    if store is not None:
+        snapshot_name = Path(env_storage_path).name
+        if manifest_file is None:
+            manifest_file = store.store_path / SNAPSHOT_MANIFEST
+    elif not env_storage_path.exists():
+        env_storage_path.mkdir()
+    if manifest_file is None:
+        manifest_file = env_storage_path.resolve().parent / SNAPSHOT_MANIFEST
+    manifest = read_snapshot_manifest(manifest_file) if incremental else {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = []
+        for env_name, env_path in env_list:
+            previous = None if full_rescan else manifest.get(env_name)
+            # Run in a copy of this context to keep the current operation.
+            futures.append(executor.submit(contextvars.copy_context().run,
+                                           log_env, (env_name, env_path),
+                                           env_storage_path, abort_after,
+                                           parallel_exports, previous, store))
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if result.status == 'unchanged':
+                logger.info('Environment %s is unchanged', result.env_name)
+            elif result.succeeded:
+                logger.info('Stored environment for %s (%.2f s)',
+                            result.env_name, result.duration)
+            elif result.status == 'timed out':
+                logger.warning('Timed out storing environment for %s',
+                               result.env_name)
+            else:
+                logger.warning('Unable to store environment for %s',
+                               result.env_name)
+    if store is not None:
+        store.save_snapshot(snapshot_name, {result.env_name: result.blobs
+                                            for result in results
+                                            if result.succeeded})
+    if incremental:
+        current = {}
+        for result in results:
+            if result.succeeded and result.fingerprint:
+                current[result.env_name] = {
+                    'fingerprint': result.fingerprint,
+                    'path': str(result.env_path),
+                    'snapshot': (snapshot_name if store is not None
+                                 else str(env_storage_path.resolve())),
+                    'files': result.files
+                    }
+                if store is not None:
+                    current[result.env_name]['blobs'] = result.blobs
+        write_snapshot_manifest(manifest_file, current)
+    return results
+
+
+@traced_operation
+def create_environment(new_env: str, python_version: str = 3.10,
+                       progress: OutputCallback = None)->Dict[str,str]:
     '''Create a ne Conda environment.
 
     Args:
         new_env (str): The name for the new Conda environment.
         python_version (str, optional): The version of python to used for the
             environment. Defaults to 3.10.
+        progress (OutputCallback, optional): A function called with each
+            `conda --json` progress record as the environment is created.
+            If None, conda runs with `--quiet`. Defaults to None.
 
     Returns:
         Dict[str,str]: Output as a dictionary of dictionaries from the
@@ -422,16 +1704,74 @@ def create_environment(new_env: str, python_version: str = 3.10)->Dict[str,str]:
     '''
     logger.info('Creating environment for %s', new_env)
 
-    env_create_cmds = f'conda create -y --json --quiet --name {new_env} '
-    env_create_cmds += f'python={python_version}'
+    quiet = '' if progress else '--quiet '
+    env_create_cmds = f'conda create -y --json {quiet}--name {new_env} '
+    env_create_cmds += quote_specs([f'python={python_version}'])
     err_msg = ' '.join([f'Unable to create new environment "{new_env}"',
                         f'with python={python_version}!'])
     install_output = console_command(env_create_cmds, AnacondaException,
-                                     err_msg)
+                                     err_msg, callback=progress,
+                                     json_progress=True)
+    # The new environment is not in the cached environment list.
+    env_registry.invalidate()
     install_output_dict = json.loads(install_output)
     return install_output_dict
 
 
+@traced_operation
+def create_environment_from_spec(new_env: str, spec_file: Path,
+                                 offline: bool = True,
+                                 progress: OutputCallback = None
+                                 )->Dict[str,str]:
+    '''Create a Conda environment from an explicit spec file.
+
+    An explicit spec lists the exact package files to install, so Conda does
+    not need to run the solver.
+
+    Args:
+        new_env (str): The name for the new Conda environment.
+        spec_file (Path): The explicit spec file, as saved by
+            `conda list --explicit`.
+        offline (bool, optional): If True, first try to install only from the
+            local package cache.  If that fails, the packages are downloaded.
+            Defaults to True.
+        progress (OutputCallback, optional): A function called with each
+            `conda --json` progress record as the environment is created.
+            If None, conda runs with `--quiet`. Defaults to None.
+
+    Returns:
+        Dict[str,str]: Output as a dictionary from the environment creation
+            logs.
+    '''
+    logger.info('Creating environment %s from %s', new_env, spec_file)
+    quiet = '' if progress else '--quiet '
+    create_cmd = f'conda create -y --json {quiet}--name {new_env} '
+    create_cmd += f'--file {build_file_string(Path(spec_file))}'
+    err_msg = f'Unable to create environment "{new_env}" from {spec_file}!'
+    create_output = None
+    if offline:
+        try:
+            create_output = console_command(create_cmd + ' --offline',
+                                            AnacondaException, err_msg,
+                                            callback=progress,
+                                            json_progress=True)
+        except AnacondaException:
+            logger.info('Packages for %s are not all cached; downloading.',
+                        new_env)
+    if create_output is None:
+        create_output = console_command(create_cmd, AnacondaException,
+                                        err_msg, callback=progress,
+                                        json_progress=True)
+    # The new environment is not in the cached environment list.
+    env_registry.invalidate()
+    try:
+        return json.loads(create_output)
+    except ValueError:
+        # Older versions of conda do not report explicit installs as JSON.
+        return {'success': True, 'output': create_output}
+
+
+@traced_operation
 def remove_environment(env_ref: EnvRef)->Dict[str,str]:
     '''Remove an Anaconda environment
 
@@ -452,12 +1792,16 @@ def remove_environment(env_ref: EnvRef)->Dict[str,str]:
     err_msg = f'Unable to delete environment {env_name}'
 
     uninstall_output = console_command(delete_cmd, AnacondaException, err_msg)
+    # The removed environment is still in the cached environment list.
+    env_registry.invalidate()
 
     install_output_dict = json.loads(uninstall_output)
     return install_output_dict
 
 
-def install_packages(env_ref: EnvRef, package_list: List[str])->Dict[str,str]:
+@traced_operation
+def install_packages(env_ref: EnvRef, package_list: List[str],
+                     progress: OutputCallback = None)->Dict[str,str]:
     '''Install Conda packages in an Anaconda environment.
 
     Args:
@@ -466,29 +1810,159 @@ def install_packages(env_ref: EnvRef, package_list: List[str])->Dict[str,str]:
         package_list (List[str]): A list of package names (and optionally
             version restrictions) to install in the Conda environment.  The
             packages must be available from one of the standard Anaconda
-            channels.
+            channels.  They are quoted for the shell, so version
+            restrictions such as 'pandas>=2.0' may be used.
+        progress (OutputCallback, optional): A function called with each
+            `conda --json` progress record as the packages are installed.
+            If None, conda runs with `--quiet`. Defaults to None.
     Returns:
         Dict[str,str]: Log output, as a dictionary of dictionaries, generated
             when installing the packages.
     '''
     env_name, env_cmd_ref = set_env_ref(env_ref)
 
-    packages = ' '.join(package_list)
+    packages = quote_specs(package_list)
 
-    install_cmd = 'conda install -y --json  --quiet '
+    install_cmd = 'conda install -y --json '
+    if not progress:
+        install_cmd += ' --quiet '
     install_cmd += env_cmd_ref
     install_cmd += ' '
     install_cmd += packages
 
     err_msg = f'Unable to install requested packages in "{env_name}"!'
 
-    install_output = console_command(install_cmd, AnacondaException, err_msg)
+    install_output = console_command(install_cmd, AnacondaException, err_msg,
+                                     callback=progress, json_progress=True)
 
     install_output_dict = json.loads(install_output)
     return install_output_dict
 
 
-def pip_install_packages(env_ref: EnvRef, pip_package_list: List[str])->Dict[str,str]:
+def pip_requirement_name(requirement: str)->str:
+    '''Extract the normalized project name from a pip requirement.
+
+    Args:
+        requirement (str): A pip requirement specifier, e.g. 'Foo_Bar>=1.2'.
+
+    Returns:
+        str: The project name normalized as pip does, e.g. 'foo-bar'.
+    '''
+    name_match = re.match(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)', requirement)
+    name = name_match.group(1) if name_match else requirement.strip()
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def split_pip_report(report: Dict[str, Any],
+                     pip_package_list: List[str])->List[Dict[str, Any]]:
+    '''Split the report from a batched pip install into one per package.
+
+    Each report has the same form as the report from installing that
+    package alone, plus a 'requirement' item.  Packages that were installed
+    only as dependencies are listed in a final report whose 'requirement'
+    is None.
+
+    Args:
+        report (Dict[str, Any]): The `pip install --report` output.
+        pip_package_list (List[str]): The requirements that were installed.
+
+    Returns:
+        List[Dict[str, Any]]: The report for each requirement.
+    '''
+    header = {key: value for key, value in report.items() if key != 'install'}
+    requested = dict()
+    dependencies = list()
+    for item in report.get('install', []):
+        if item.get('requested'):
+            requested[pip_requirement_name(item['metadata']['name'])] = item
+        else:
+            dependencies.append(item)
+    reports = list()
+    for pkg_req in pip_package_list:
+        item = requested.get(pip_requirement_name(pkg_req))
+        reports.append({**header, 'requirement': pkg_req,
+                        'install': [item] if item else []})
+    if dependencies:
+        reports.append({**header, 'requirement': None,
+                        'install': dependencies})
+    return reports
+
+
+@traced_operation
+def build_wheels(env_ref: EnvRef, pip_package_list: List[str],
+                 wheelhouse: Path, session=None)->str:
+    '''Build or download wheels for pip packages into a wheelhouse folder.
+
+    Wheels already in the wheelhouse are reused.  The wheels are built in
+    the environment, so that they match its python version and platform.
+
+    Args:
+        env_ref (EnvRef): A reference to the Conda environment either by it's
+            name or by the path to the environment.
+        pip_package_list (List[str]): A list of pip "requirement specifiers".
+        wheelhouse (Path): The folder to hold the wheels.
+        session (env_session.EnvironmentSession, Optional): An activated shell
+            session for the environment.  Default is None.
+
+    Returns:
+        str: The log output from `pip wheel`.
+    '''
+    env_name = set_env_ref(env_ref)[0]
+    Path(wheelhouse).mkdir(parents=True, exist_ok=True)
+    requirements = quote_specs(pip_package_list)
+    wheel_cmd = (f'pip wheel --quiet --wheel-dir "{wheelhouse}" '
+                 f'--find-links "{wheelhouse}" {requirements}')
+    err_msg = f'Unable to build wheels for {", ".join(pip_package_list)}!'
+    return run_in_environment(env_name, wheel_cmd, AnacondaException,
+                              err_msg, session=session)
+
+
+def pip_install_group(env_name: str, pip_package_list: List[str],
+                      session=None, wheelhouse: Path = None)->Dict[str, Any]:
+    '''Install a group of pip packages with a single `pip install` call.
+
+    If a wheelhouse is given, the packages are installed from it with
+    `--no-index`.  If that fails because wheels are missing, the wheels are
+    built into the wheelhouse and the install is repeated.
+
+    Args:
+        env_name (str): The name of the Conda environment.
+        pip_package_list (List[str]): A list of pip "requirement specifiers".
+        session (env_session.EnvironmentSession, Optional): An activated shell
+            session for the environment.  Default is None.
+        wheelhouse (Path, optional): A folder of prebuilt wheels.  Default is
+            None.
+
+    Returns:
+        Dict[str, Any]: The `pip install --report` output.
+    '''
+    requirements = quote_specs(pip_package_list)
+    install_cmd = f'pip install {requirements} --quiet --report -'
+    err_msg = (f'Unable to install {", ".join(pip_package_list)} '
+               f'in "{env_name}"!')
+    if wheelhouse is None:
+        return json.loads(run_in_environment(env_name, install_cmd,
+                                             AnacondaException, err_msg,
+                                             session=session))
+    local_cmd = f'{install_cmd} --no-index --find-links "{wheelhouse}"'
+    try:
+        pip_output = run_in_environment(env_name, local_cmd,
+                                        AnacondaException, err_msg,
+                                        session=session)
+    except AnacondaException:
+        logger.info('Adding %s to wheelhouse %s',
+                    ', '.join(pip_package_list), wheelhouse)
+        build_wheels(env_name, pip_package_list, wheelhouse, session)
+        pip_output = run_in_environment(env_name, local_cmd,
+                                        AnacondaException, err_msg,
+                                        session=session)
+    return json.loads(pip_output)
+
+
+@traced_operation
+def pip_install_packages(env_ref: EnvRef, pip_package_list: List[str],
+                         session=None, batch: bool = False,
+                         wheelhouse: Path = None)->List[Dict[str, Any]]:
     '''Use pip to install packages in an Anaconda environment
 
     This is intended to be used for installing packages that that cannot be
@@ -501,19 +1975,248 @@ def pip_install_packages(env_ref: EnvRef, pip_package_list: List[str])->Dict[str
             (typically package names) to install in the Conda environment.  See
             [Requirement Specifiers](https://pip.pypa.io/en/stable/reference/requirement-specifiers/)
             for more details.
+        session (env_session.EnvironmentSession, Optional): An activated shell
+            session for the environment.  If None, the environment is
+            activated separately for each pip call. Default is None.
+        batch (bool, Optional): If True, resolve and install all of the
+            packages with one `pip install` call, and split its report into
+            one report per package.  Default is False.
+        wheelhouse (Path, Optional): A folder of wheels shared by environment
+            builds.  Packages are installed from it without using the
+            package index, and missing wheels are built into it first.
+            Default is None.
     Returns:
-        Dict[str,str]: Log output, as a dictionary of dictionaries, generated
-            when installing the packages.
+        List[Dict[str, Any]]: The `pip install --report` output for each
+            package.
     '''
     env_name = set_env_ref(env_ref)[0]
-    activate_cmd = activate_environment(env_name)
-
+    if not pip_package_list:
+        return []
+    if batch:
+        report = pip_install_group(env_name, pip_package_list, session,
+                                   wheelhouse)
+        return split_pip_report(report, pip_package_list)
     install_logs = []
     for pkg_req in pip_package_list:
-        install_cmd = activate_cmd + f'pip install {pkg_req} --quiet --report -'
-        err_msg = f'Unable to install {pkg_req} in "{env_name}"!'
-        pip_output = console_command(install_cmd, AnacondaException, err_msg)
-        install_log_dict = json.loads(pip_output)
-        install_logs.append(install_log_dict)
-
+        install_logs.append(pip_install_group(env_name, [pkg_req], session,
+                                              wheelhouse))
     return install_logs
+
+
+# %% Command line interface
+def configure_logging(verbosity: int = 0):
+    '''Configure logging for command line use.
+
+    Args:
+        verbosity (int, optional): 0 for INFO messages, 1 or more for DEBUG
+            messages and -1 or less for WARNING messages only. Defaults to 0.
+    '''
+    if verbosity > 0:
+        level = logging.DEBUG
+    elif verbosity < 0:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    logging.basicConfig(level=level, format='%(levelname)-8s %(message)s')
+
+
+def print_json(data: Any):
+    '''Print command output as indented json.'''
+    print(json.dumps(data, indent=2, default=str))
+
+
+def run_list(options: argparse.Namespace)->int:
+    '''List the Conda environments.'''
+    if options.table:
+        env_data = build_env_table(options.table)
+        print(env_data.to_string(index=False))
+        return 0
+    for env_name, env_path in list_environments(options.refresh):
+        print(f'{env_name}\t{env_path}')
+    return 0
+
+
+def run_snapshot(options: argparse.Namespace)->int:
+    '''Save the environment info for every environment.'''
+    options.folder.mkdir(parents=True, exist_ok=True)
+    store = SnapshotStore(options.store) if options.store else None
+    try:
+        results = log_all_envs(options.folder, max_workers=options.workers,
+                               incremental=options.incremental, store=store)
+    finally:
+        if store is not None:
+            store.close()
+    for result in results:
+        print(f'{result.env_name:<30} {result.status:<10} '
+              f'{result.duration:6.1f} s  {result.message}')
+    return 0 if all(result.succeeded for result in results) else 1
+
+
+def run_export(options: argparse.Namespace)->int:
+    '''Save the spec, .yml and history files for one environment.'''
+    options.folder.mkdir(parents=True, exist_ok=True)
+    save_env_specs(options.env, options.folder,
+                   spec_file=not options.no_spec, yml_file=not options.no_yml,
+                   history_json=not options.no_history)
+    return 0
+
+
+def run_create(options: argparse.Namespace)->int:
+    '''Create an environment, either from a spec file or from packages.'''
+    if options.spec:
+        print_json(create_environment_from_spec(options.env, options.spec,
+                                                offline=not options.online))
+        return 0
+    output = {'create': create_environment(options.env, options.python)}
+    if options.packages:
+        output['install'] = install_packages(options.env, options.packages)
+    print_json(output)
+    return 0
+
+
+def run_install(options: argparse.Namespace)->int:
+    '''Install Conda or pip packages in an environment.'''
+    if options.pip:
+        print_json(pip_install_packages(options.env, options.packages,
+                                        batch=True,
+                                        wheelhouse=options.wheelhouse))
+    else:
+        print_json(install_packages(options.env, options.packages))
+    return 0
+
+
+def run_remove(options: argparse.Namespace)->int:
+    '''Remove an environment.'''
+    print_json(remove_environment(options.env))
+    return 0
+
+
+def run_info(options: argparse.Namespace)->int:
+    '''Show the Conda information for an environment.'''
+    print_json(get_conda_info(options.env, options.save,
+                              native=not options.conda))
+    return 0
+
+
+def build_parser()->argparse.ArgumentParser:
+    '''Build the command line argument parser.'''
+    parser = argparse.ArgumentParser(
+        prog='python -m env_tools',
+        description='Build and manage Conda project environments.')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='Show debug messages.')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Only show warnings and errors.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help='List the environments.')
+    list_parser.add_argument('--refresh', action='store_true',
+                             help='Query conda even if the cached list is '
+                             'still valid.')
+    list_parser.add_argument('--table', type=Path, default=None,
+                             help='Save the list as a spreadsheet in this '
+                             'folder (requires pandas).')
+    list_parser.set_defaults(run=run_list)
+
+    snapshot_parser = commands.add_parser(
+        'snapshot', help='Save the info files for every environment.')
+    snapshot_parser.add_argument('folder', type=Path,
+                                 help='The snapshot folder.')
+    snapshot_parser.add_argument('--workers', type=int, default=4,
+                                 help='The number of environments exported '
+                                 'at once.')
+    snapshot_parser.add_argument('--incremental', action='store_true',
+                                 help='Reuse the files of unchanged '
+                                 'environments from the previous snapshot.')
+    snapshot_parser.add_argument('--store', type=Path, default=None,
+                                 help='Save the files in the deduplicated '
+                                 'snapshot store in this folder.')
+    snapshot_parser.set_defaults(run=run_snapshot)
+
+    export_parser = commands.add_parser(
+        'export', help='Save the spec, .yml and history files for an '
+        'environment.')
+    export_parser.add_argument('env', help='The environment name or path.')
+    export_parser.add_argument('folder', type=Path,
+                               help='The folder for the files.')
+    export_parser.add_argument('--no-spec', action='store_true',
+                               help='Do not save the explicit spec file.')
+    export_parser.add_argument('--no-yml', action='store_true',
+                               help='Do not save the .yml file.')
+    export_parser.add_argument('--no-history', action='store_true',
+                               help='Do not save the history .json file.')
+    export_parser.set_defaults(run=run_export)
+
+    create_parser = commands.add_parser('create',
+                                        help='Create an environment.')
+    create_parser.add_argument('env', help='The new environment name.')
+    create_parser.add_argument('packages', nargs='*',
+                               help='Packages to install.')
+    create_parser.add_argument('--python', default='3.10',
+                               help='The python version. Defaults to 3.10.')
+    create_parser.add_argument('--spec', type=Path, default=None,
+                               help='Create the environment from an explicit '
+                               'spec file.')
+    create_parser.add_argument('--online', action='store_true',
+                               help='With --spec, do not try the local '
+                               'package cache first.')
+    create_parser.set_defaults(run=run_create)
+
+    install_parser = commands.add_parser(
+        'install', help='Install packages in an environment.')
+    install_parser.add_argument('env', help='The environment name or path.')
+    install_parser.add_argument('packages', nargs='+',
+                                help='Packages to install.')
+    install_parser.add_argument('--pip', action='store_true',
+                                help='Install the packages with pip.')
+    install_parser.add_argument('--wheelhouse', type=Path, default=None,
+                                help='With --pip, a folder of wheels shared '
+                                'by environment builds.')
+    install_parser.set_defaults(run=run_install)
+
+    remove_parser = commands.add_parser('remove',
+                                        help='Remove an environment.')
+    remove_parser.add_argument('env', help='The environment name or path.')
+    remove_parser.set_defaults(run=run_remove)
+
+    info_parser = commands.add_parser('info',
+                                      help='Show the Conda information.')
+    info_parser.add_argument('env', nargs='?', default=None,
+                             help='The environment name or path.  Defaults '
+                             'to the base environment.')
+    info_parser.add_argument('--save', type=Path, default=None,
+                             help='Also save the information to this file or '
+                             'folder.')
+    info_parser.add_argument('--conda', action='store_true',
+                             help='Run `conda info` instead of reading the '
+                             'Conda installation files.')
+    info_parser.set_defaults(run=run_info)
+    return parser
+
+
+def main(args: List[str] = None)->int:
+    '''Run an env_tools command.
+
+    Examples:
+        python -m env_tools list
+        python -m env_tools snapshot "Home envs Jan 28 2024" --incremental
+        python -m env_tools install TestProject units --pip
+
+    Args:
+        args (List[str], optional): The command line arguments.  If None,
+            sys.argv is used.
+
+    Returns:
+        int: The exit status.
+    '''
+    options = build_parser().parse_args(args)
+    configure_logging(-1 if options.quiet else options.verbose)
+    try:
+        return options.run(options)
+    except ProjectException as err:
+        logger.error('%s', err)
+        return 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -9,18 +9,143 @@ Identifies package dependencies for a given project or solution.
 
 
 #%% Imports
+from typing import List, Dict, Tuple, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
 from pathlib import Path
 from pprint import pprint
-import re
+import os
+import abc
+import ast
 import xml.etree.ElementTree as ET
 
 import pandas as pd
-import xlwings as xw
+
+from notebook_reader import read_code_cells
+
+
+#%% Walk the project tree
+# Folders that are never searched.  Names may be fnmatch patterns.
+DEFAULT_IGNORE_DIRS = (
+    '.git', '.hg', '.svn', '.vs', '.vscode', '.idea', '__pycache__',
+    '.ipynb_checkpoints', '.mypy_cache', '.pytest_cache', '.tox', '.nox',
+    'node_modules', 'site-packages', '.venv', 'venv', '*.egg-info'
+    )
+
+# Files that mark a folder as a virtual environment or Conda environment.
+ENVIRONMENT_MARKERS = ('pyvenv.cfg', 'conda-meta')
+
+
+@dataclass
+class ProjectTree():
+    '''The files found in one walk of a project tree.
+
+    Solution and requirements files are only collected from the root folder;
+    the other file types are collected from every folder that is searched.
+
+    Attributes:
+        root_path (Path): The top folder searched.
+        solutions (List[Path]): `*.sln` files in the root folder.
+        requirements (List[Path]): `requirements.txt` in the root folder.
+        projects (List[Path]): `*.pyproj` files.
+        python_files (List[Path]): `*.py` files.
+        notebooks (List[Path]): `*.ipynb` files.
+    '''
+    root_path: Path
+    solutions: List[Path] = field(default_factory=list)
+    requirements: List[Path] = field(default_factory=list)
+    projects: List[Path] = field(default_factory=list)
+    python_files: List[Path] = field(default_factory=list)
+    notebooks: List[Path] = field(default_factory=list)
+
+    def collect(self, file: Path, top_level: bool):
+        '''Add a file to the matching file lists.
+
+        Args:
+            file (Path): The file found.
+            top_level (bool): True if the file is in the root folder.
+        '''
+        name = file.name
+        suffix = file.suffix.lower()
+        if suffix == '.py':
+            self.python_files.append(file)
+        elif suffix == '.ipynb':
+            self.notebooks.append(file)
+        elif suffix == '.pyproj':
+            self.projects.append(file)
+        elif top_level and suffix == '.sln':
+            self.solutions.append(file)
+        elif top_level and name == 'requirements.txt':
+            self.requirements.append(file)
+
+
+def is_ignored(name: str, ignore_dirs: Iterable[str])->bool:
+    """Test whether a folder name matches any of the ignore rules.
+
+    Args:
+        name (str): The folder name.
+        ignore_dirs (Iterable[str]): Folder names or fnmatch patterns.
+
+    Returns:
+        bool: True if the folder should not be searched.
+    """
+    return any(name == pattern or fnmatch(name, pattern)
+               for pattern in ignore_dirs)
+
+
+def walk_project_tree(root_path: Path,
+                      ignore_dirs: Iterable[str] = DEFAULT_IGNORE_DIRS,
+                      skip_environments: bool = True)->ProjectTree:
+    """Find all project files below root_path in a single directory walk.
+
+    Args:
+        root_path (Path): The top folder to search.
+        ignore_dirs (Iterable[str], optional): Folder names or fnmatch
+            patterns that are not searched.  Default is DEFAULT_IGNORE_DIRS.
+        skip_environments (bool, optional): If True, do not search folders
+            containing a virtual environment or Conda environment (any folder
+            with a `pyvenv.cfg` file or `conda-meta` folder).  Default is
+            True.
+
+    Returns:
+        ProjectTree: The files found, grouped by type.
+    """
+    ignore_dirs = tuple(ignore_dirs)
+    tree = ProjectTree(root_path)
+    folders = [root_path]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as folder_entries:
+                entries = sorted(folder_entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        top_level = folder == root_path
+        if skip_environments and not top_level:
+            if any(entry.name in ENVIRONMENT_MARKERS for entry in entries):
+                continue
+        sub_folders = list()
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if not is_ignored(entry.name, ignore_dirs):
+                    sub_folders.append(folder / entry.name)
+            else:
+                tree.collect(folder / entry.name, top_level)
+        # Reversed so that folders are searched in name order.
+        folders.extend(reversed(sub_folders))
+    return tree
 
 
 #%% Get Requirements
-def get_requirements(root_path: Path)->pd.DataFrame:
-    requirements_files = [file for file in root_path.glob('requirements.txt')]
+def get_requirements(root_path: Path,
+                     requirements_files: List[Path] = None)->pd.DataFrame:
+    if requirements_files is None:
+        requirements_files = [file for file in root_path.glob('requirements.txt')]
     if requirements_files:
         req_list = list()
         for requirements_file in requirements_files:
@@ -43,8 +168,9 @@ def get_requirements(root_path: Path)->pd.DataFrame:
 
 
 #%% Find Projects in solution
-def get_solution(root_path)->pd.DataFrame:
-    solution_files = [file for file in root_path.glob('*.sln')]
+def get_solution(root_path, solution_files: List[Path] = None)->pd.DataFrame:
+    if solution_files is None:
+        solution_files = [file for file in root_path.glob('*.sln')]
     if solution_files:
         solution_file = solution_files[0]
         sln_txt = solution_file.read_text().splitlines()
@@ -72,11 +198,13 @@ def get_solution(root_path)->pd.DataFrame:
 
 
 #%% Find Project Files
-def get_projects(root_path: Path)->pd.DataFrame:
+def get_projects(root_path: Path,
+                 project_files: List[Path] = None)->pd.DataFrame:
     ns = {'msp': r'http://schemas.microsoft.com/developer/msbuild/2003'}
-    project_files = [file.name for file in root_path.glob('**/*.pyproj')]
+    if project_files is None:
+        project_files = walk_project_tree(root_path).projects
     project_info = list()
-    for proj in root_path.glob('**/*.pyproj'):
+    for proj in project_files:
         tree = ET.parse(proj)
         root = tree.getroot()
         project = root.find(r'msp:PropertyGroup/msp:Name', namespaces=ns)
@@ -101,49 +229,237 @@ def get_projects(root_path: Path)->pd.DataFrame:
 
 
 #%% Get imports
-def get_imports(root_path: Path)->pd.DataFrame:
-    # Patterns for identifying import statements in python files.
-    pattern1 = re.compile('from[ ]+([^ \t]+)[ ]+import[ ]+([^\n]+)')
-    pattern2 = re.compile('import[ ]+([^ \t]+)')
+# ImportRecord is one import statement found in a python file.
+ImportRecord = Dict[str, str]
+
+# The number of files sent to each worker process at a time.
+SCAN_CHUNK_SIZE = 64
+
+
+def find_module_imports(tree: ast.AST, folder: str,
+                        file_name: str)->List[ImportRecord]:
+    """Find all import statements in a parsed python module.
+
+    Imports inside functions, classes, `if` blocks and `try` blocks are
+    included.  Relative imports keep their leading dots, e.g. `..utils`.
+
+    Args:
+        tree (ast.AST): The parsed module.
+        folder (str): The folder containing the module.
+        file_name (str): The module file name.
+
+    Returns:
+        List[ImportRecord]: One record for each imported module.
+    """
+    import_list = list()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                import_list.append({
+                    'Folder': folder,
+                    'File': file_name,
+                    'Import Module': alias.name
+                    })
+        elif isinstance(node, ast.ImportFrom):
+            module = '.' * node.level + (node.module or '')
+            functions = ', '.join(alias.name for alias in node.names)
+            import_list.append({
+                'Folder': folder,
+                'File': file_name,
+                'Import Module': module,
+                'Import Functions': functions
+                })
+    return import_list
+
+
+def scan_python_file(file_path: str)->List[ImportRecord]:
+    """Find the import statements in a python file.
+
+    Args:
+        file_path (str): The path to the python file.
+
+    Returns:
+        List[ImportRecord]: One record for each imported module.  Files that
+            cannot be parsed return an empty list.
+    """
+    file = Path(file_path)
+    try:
+        # Parsing bytes lets ast honour the file's encoding declaration.
+        tree = ast.parse(file.read_bytes(), filename=str(file))
+    except (SyntaxError, ValueError, OSError):
+        return list()
+    return find_module_imports(tree, str(file.parent), file.name)
+
+
+def scan_notebook_file(file_path: str)->List[ImportRecord]:
+    """Find the import statements in the code cells of a Jupyter notebook.
+
+    The notebook is streamed, so cell outputs are never loaded.  IPython
+    magics are removed before parsing; cells that still cannot be parsed
+    are skipped.
+
+    Args:
+        file_path (str): The path to the notebook.
+
+    Returns:
+        List[ImportRecord]: One record for each imported module.  Notebooks
+            that cannot be read return an empty list.
+    """
+    file = Path(file_path)
+    import_list = list()
+    for source in read_code_cells(file):
+        try:
+            tree = ast.parse(source, filename=str(file))
+        except (SyntaxError, ValueError):
+            continue
+        import_list.extend(find_module_imports(tree, str(file.parent),
+                                               file.name))
+    return import_list
+
+
+def scan_file(file_path: str)->List[ImportRecord]:
+    """Find the import statements in a python file or Jupyter notebook.
+
+    Args:
+        file_path (str): The path to the `.py` or `.ipynb` file.
+
+    Returns:
+        List[ImportRecord]: One record for each imported module.
+    """
+    if str(file_path).endswith('.ipynb'):
+        return scan_notebook_file(file_path)
+    return scan_python_file(file_path)
+
+
+def scan_file_group(file_paths: List[str]
+                    )->List[Tuple[str, List[ImportRecord]]]:
+    """Find the import statements in a group of files.
+
+    This is the unit of work sent to each worker process.
+
+    Args:
+        file_paths (List[str]): The paths to the `.py` or `.ipynb` files.
+
+    Returns:
+        List[Tuple[str, List[ImportRecord]]]: The path and the import
+            records for each file.
+    """
+    return [(file_path, scan_file(file_path)) for file_path in file_paths]
+
+
+def scan_imports_by_file(files: List[Path], max_workers: int = None,
+                         chunk_size: int = SCAN_CHUNK_SIZE
+                         )->Dict[str, List[ImportRecord]]:
+    """Find the import statements in each file using a process pool.
+
+    Args:
+        files (List[Path]): The `.py` or `.ipynb` files to scan.
+        max_workers (int, optional): The number of worker processes.  If
+            None, use one per CPU.  If 1, scan in this process.
+        chunk_size (int, optional): The number of files sent to a worker at
+            a time.
+
+    Returns:
+        Dict[str, List[ImportRecord]]: The import records for each file,
+            indexed by file path and in file order.
+    """
+    file_paths = [str(file) for file in files]
+    chunks = [file_paths[start:start + chunk_size]
+              for start in range(0, len(file_paths), chunk_size)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers <= 1 or len(chunks) <= 1:
+        return dict(scan_file_group(file_paths))
+    file_imports = dict()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_imports in executor.map(scan_file_group, chunks):
+            file_imports.update(chunk_imports)
+    return file_imports
+
+
+def scan_imports(python_files: List[Path], max_workers: int = None,
+                 chunk_size: int = SCAN_CHUNK_SIZE)->List[ImportRecord]:
+    """Find the import statements in python files using a process pool.
+
+    Args:
+        python_files (List[Path]): The python files to scan.
+        max_workers (int, optional): The number of worker processes.  If
+            None, use one per CPU.  If 1, scan in this process.
+        chunk_size (int, optional): The number of files sent to a worker at
+            a time.
+
+    Returns:
+        List[ImportRecord]: The import records for all of the files, in file
+            order.
+    """
+    file_imports = scan_imports_by_file(python_files, max_workers, chunk_size)
+    import_list = list()
+    for records in file_imports.values():
+        import_list.extend(records)
+    return import_list
+
+
+def mark_local_imports(import_df: pd.DataFrame,
+                       local_modules: set)->pd.Series:
+    """Identify imports that refer to local python files.
+
+    An import is local if it is relative, or if the module or its top level
+    package matches the name of a python file in the scanned tree.
+
+    Args:
+        import_df (pd.DataFrame): The import records.
+        local_modules (set): The names (stems) of the scanned python files.
+
+    Returns:
+        pd.Series: True for each local import.
+    """
+    modules = import_df['Import Module']
+    top_level = modules.str.split('.').str[0]
+    relative = modules.str.startswith('.')
+    return relative | modules.isin(local_modules) | top_level.isin(local_modules)
+
+
+def get_imports(root_path: Path, max_workers: int = None,
+                python_files: List[Path] = None, cache=None
+                )->Tuple[pd.DataFrame, pd.DataFrame]:
+    """Find the import statements in all python files below root_path.
+
+    Args:
+        root_path (Path): The top folder to search.
+        max_workers (int, optional): The number of worker processes used to
+            parse the files.  If None, use one per CPU.
+        python_files (List[Path], optional): The python files to scan.  If
+            None, the python files found by `walk_project_tree` are scanned.
+        cache (import_cache.ImportCache, optional): A persistent cache of
+            parsed import records.  If supplied, only new or changed files
+            are parsed.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The import table indexed by
+            Folder, File and Import Module, and the import frequency count.
+    """
     # Sort order and index for resulting DataFrame
     sort_order = ['Local Import', 'Import Module', 'Folder', 'File']
     data_index = ['Folder', 'File', 'Import Module']
     # search all python files for import statements
-    python_files = root_path.glob('**/*.py')
-    local_modules = list()
-    import_list = list()
-    for file in python_files:
-        local_modules.append(file.stem)
-        for line in file.read_text().splitlines():
-            if 'import' in line:
-                if '*' not in line:
-                    found = pattern1.search(line)
-                    if found:
-                        import_data = {
-                            'Folder': str(file.parent),
-                            'File': file.name,
-                            'Import Module': found.groups()[0],
-                            'Import Functions': found.groups()[1]
-                            }
-                        import_list.append(import_data)
-                    else:
-                        found = pattern2.search(line)
-                        if found:
-                            import_data = {
-                                'Folder': str(file.parent),
-                                'File': file.name,
-                                'Import Module': found.groups()[0]
-                                }
-                            import_list.append(import_data)
+    cache_root = None
+    if python_files is None:
+        python_files = walk_project_tree(root_path).python_files
+        cache_root = root_path
+    local_modules = set(file.stem for file in python_files)
+    if cache is not None:
+        import_list = cache.scan(python_files, max_workers, cache_root)
+    else:
+        import_list = scan_imports(python_files, max_workers)
 
     if len(import_list) > 0:
         import_df = pd.DataFrame(import_list)
+        if 'Import Functions' not in import_df.columns:
+            import_df['Import Functions'] = None
         import_df['Import Module'] = import_df['Import Module'].str.strip()
         # identify import statements that refer to local python files
-        local_modules = set(local_modules)
-        local_import = import_df['Import Module'].isin(local_modules)
-        import_df.loc[local_import, 'Local Import'] = True
-        import_df.loc[~local_import, 'Local Import'] = False
+        import_df['Local Import'] = mark_local_imports(import_df,
+                                                       local_modules)
         # Format the DataFrame
         import_df.sort_values(sort_order, inplace=True)
         import_df.set_index(data_index, inplace=True)
@@ -156,39 +472,235 @@ def get_imports(root_path: Path)->pd.DataFrame:
 
 
 #%% Save Data
+# The name of the saved table for each result DataFrame.
+TABLE_NAMES = ('Requirements', 'Solution', 'Projects', 'Imports',
+               'Import Counts')
+
+# File extensions for each output format and compression method.
+FORMAT_EXTENSIONS = {'parquet': '.parquet', 'csv': '.csv', 'jsonl': '.jsonl'}
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz',
+                          'zstd': '.zst', 'zip': '.zip'}
+
+
+def table_file_name(table_name: str, output_format: str,
+                    compression: str = None)->str:
+    """Build the file name used to save a table.
+
+    Args:
+        table_name (str): The table name, e.g. 'Import Counts'.
+        output_format (str): One of 'parquet', 'csv' or 'jsonl'.
+        compression (str, optional): The compression method.  Parquet
+            compression is internal to the file, so it does not change the
+            file name.
+
+    Returns:
+        str: The file name, e.g. 'import_counts.csv.gz'.
+    """
+    file_name = table_name.lower().replace(' ', '_')
+    file_name += FORMAT_EXTENSIONS[output_format]
+    if compression and output_format != 'parquet':
+        file_name += COMPRESSION_EXTENSIONS[compression]
+    return file_name
+
+
+class ImportDataWriter(abc.ABC):
+    """Base class for the import scan output backends.
+
+    Tables are written one at a time as each collector finishes, so a
+    backend never needs to hold all of the results at once.  Use the writer
+    as a context manager:
+        with open_import_writer(save_path, 'csv') as writer:
+            writer.write_table('Imports', import_df)
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @abc.abstractmethod
+    def write_table(self, table_name: str, data: pd.DataFrame):
+        """Save one result table.
+
+        Args:
+            table_name (str): The table name, e.g. 'Imports'.
+            data (pd.DataFrame): The table to save.  Empty tables are
+                skipped.
+        """
+
+    def close(self):
+        """Finish writing the output."""
+
+
+class FolderWriter(ImportDataWriter):
+    """Write each table to its own Parquet, CSV or JSON-lines file.
+
+    Parquet output requires pyarrow or fastparquet, which are not
+    dependencies of this project, so it must be requested explicitly.
+
+    Attributes:
+        save_folder (Path): The folder receiving the table files.
+        output_format (str): One of 'parquet', 'csv' or 'jsonl'.
+        compression (str): The compression method, or None.
+    """
+    def __init__(self, save_folder: Path, output_format: str = 'csv',
+                 compression: str = None):
+        if output_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f'Unknown output format: {output_format}')
+        self.save_folder = Path(save_folder)
+        self.output_format = output_format
+        self.compression = compression
+        self.save_folder.mkdir(parents=True, exist_ok=True)
+
+    def table_path(self, table_name: str)->Path:
+        """The file used to save a table."""
+        return self.save_folder / table_file_name(
+            table_name, self.output_format, self.compression)
+
+    def write_table(self, table_name: str, data: pd.DataFrame):
+        if data.size == 0:
+            return
+        table_path = self.table_path(table_name)
+        if self.output_format == 'parquet':
+            data.to_parquet(table_path, compression=self.compression)
+        elif self.output_format == 'csv':
+            data.to_csv(table_path, compression=self.compression)
+        else:
+            data.reset_index().to_json(table_path, orient='records',
+                                       lines=True,
+                                       compression=self.compression)
+
+
+class ExcelWorkbookWriter(ImportDataWriter):
+    """Write each table to a sheet of an Excel workbook.
+
+    Attributes:
+        save_file (Path): The Excel file.
+        view (bool): If True, open the Imports table in Excel using xlwings.
+    """
+    def __init__(self, save_file: Path, view: bool = False):
+        self.save_file = Path(save_file)
+        self.view = view
+        self.writer = pd.ExcelWriter(self.save_file)
+
+    def write_table(self, table_name: str, data: pd.DataFrame):
+        if data.size == 0:
+            return
+        data.to_excel(self.writer, sheet_name=table_name)
+        if self.view and table_name == 'Imports':
+            # xlwings requires a desktop Excel installation.
+            import xlwings as xw  # pylint: disable=import-outside-toplevel
+            xw.view(data)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_import_writer(save_path: Path, output_format: str = None,
+                       compression: str = None,
+                       view: bool = False)->ImportDataWriter:
+    """Select the output backend for the import scan results.
+
+    Args:
+        save_path (Path): The Excel file or the folder to receive the table
+            files.
+        output_format (str, optional): One of 'excel', 'parquet', 'csv' or
+            'jsonl'.  If None, 'excel' is used when save_path ends in
+            `.xlsx`, otherwise 'csv'.  'parquet' requires pyarrow or
+            fastparquet.
+        compression (str, optional): The compression method for Parquet,
+            CSV or JSON-lines files, e.g. 'gzip', 'zstd' or 'snappy'.
+        view (bool, optional): If True, open the Imports table in Excel
+            (Excel output only).  Default is False.
+
+    Returns:
+        ImportDataWriter: The output backend.
+    """
+    save_path = Path(save_path)
+    if output_format is None:
+        if save_path.suffix.lower() == '.xlsx':
+            output_format = 'excel'
+        else:
+            output_format = 'csv'
+    if output_format == 'excel':
+        return ExcelWorkbookWriter(save_path, view)
+    return FolderWriter(save_path, output_format, compression)
+
+
 def save_import_data(req_df, sln_df, project_df, import_df, import_freq,
-                     save_file):
-    with pd.ExcelWriter(save_file) as writer:
-        if req_df.size > 0:
-            req_df.to_excel(writer, sheet_name="Requirements")
-        if sln_df.size > 0:
-            sln_df.to_excel(writer, sheet_name="Solution")
-        if project_df.size > 0:
-            project_df.to_excel(writer, sheet_name="Projects")
-        if import_df.size > 0:
-            import_df.to_excel(writer, sheet_name="Imports")
-            xw.view(import_df)
-        if import_freq.size > 0:
-            import_freq.to_excel(writer, sheet_name="Import Counts")
+                     save_file, output_format: str = None,
+                     compression: str = None, view: bool = False):
+    """Save all of the import scan results.
+
+    The arguments after save_file match `open_import_writer`.
+    """
+    tables = (req_df, sln_df, project_df, import_df, import_freq)
+    with open_import_writer(save_file, output_format, compression,
+                            view) as writer:
+        for table_name, data in zip(TABLE_NAMES, tables):
+            writer.write_table(table_name, data)
+
+
+def load_import_data(save_folder: Path, output_format: str = 'csv',
+                     compression: str = None)->Dict[str, pd.DataFrame]:
+    """Load import scan results saved by a FolderWriter.
+
+    Args:
+        save_folder (Path): The folder containing the table files.
+        output_format (str, optional): One of 'parquet', 'csv' or 'jsonl'.
+            Default is 'csv'.
+        compression (str, optional): The compression method used when the
+            tables were saved.
+
+    Returns:
+        Dict[str, pd.DataFrame]: The saved tables, indexed by table name.
+            Tables that were not saved are omitted.  Parquet restores the
+            original index; CSV and JSON-lines tables have a default index.
+    """
+    tables = dict()
+    for table_name in TABLE_NAMES:
+        table_path = Path(save_folder) / table_file_name(
+            table_name, output_format, compression)
+        if not table_path.exists():
+            continue
+        if output_format == 'parquet':
+            tables[table_name] = pd.read_parquet(table_path)
+        elif output_format == 'csv':
+            tables[table_name] = pd.read_csv(table_path)
+        else:
+            tables[table_name] = pd.read_json(table_path, lines=True)
+    return tables
 
 
 #%% Main
-def main():
+def main(output_format: str = 'csv', compression: str = None,
+         view: bool = False):
     root_path = Path.cwd() / '..'
     root_path = root_path.resolve()
-    save_file = root_path / 'Environment' / "plan_check_env_analysis.xlsx"
+    if output_format == 'excel':
+        save_path = root_path / 'Environment' / "plan_check_env_analysis.xlsx"
+    else:
+        save_path = root_path / 'Environment' / "plan_check_env_analysis"
 
-    sln_df = get_solution(root_path)
-    req_df = get_requirements(root_path)
-    project_df = get_projects(root_path)
-    import_df, import_freq = get_imports(root_path)
+    project_tree = walk_project_tree(root_path)
+    # Each table is saved as soon as it is collected.
+    with open_import_writer(save_path, output_format, compression,
+                            view) as writer:
+        sln_df = get_solution(root_path, project_tree.solutions)
+        writer.write_table('Solution', sln_df)
+        req_df = get_requirements(root_path, project_tree.requirements)
+        writer.write_table('Requirements', req_df)
+        project_df = get_projects(root_path, project_tree.projects)
+        writer.write_table('Projects', project_df)
+        import_df, import_freq = get_imports(
+            root_path, python_files=project_tree.python_files)
+        writer.write_table('Imports', import_df)
+        writer.write_table('Import Counts', import_freq)
 
     env_packages = list(req_df.reset_index()['Package'])
     modules = import_df.reset_index()[['Import Module', 'Local Import']]
     required_pkgs = set(modules.loc[modules['Import Module'].isin(env_packages), 'Import Module'])
     print(required_pkgs)
 
-    save_import_data(req_df, sln_df, project_df, import_df, import_freq, save_file)
-
 if __name__ == '__Main__':
     main()
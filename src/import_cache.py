@@ -0,0 +1,328 @@
+'''Persistent Import Scan Cache.
+
+ Store the import statements parsed from each `.py` and `.ipynb` file in a
+ local SQLite database, so that repeated scans of the same tree only parse
+ the files that have changed since the previous scan.
+ '''
+
+# %%  Imports
+from typing import List, Dict, Iterable, Set
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import json
+import hashlib
+import sqlite3
+
+from find_imports import ImportRecord, scan_imports_by_file
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+DEFAULT_CACHE_FILE = Path.home() / '.cache' / 'env_tools' / 'import_cache.db'
+
+# Increase when the scanners change, so that older cache entries are dropped.
+SCANNER_VERSION = 2
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS file_imports (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        imports TEXT NOT NULL
+        )
+    '''
+
+
+# %% Helper functions
+def file_hash(file_path: str)->str:
+    '''Calculate the sha256 hash of a file's contents.
+
+    Args:
+        file_path (str): The file to hash.
+
+    Returns:
+        str: The hex digest of the file contents.
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_imports(records: List[ImportRecord])->str:
+    '''Convert import records to the JSON text stored in the cache.
+
+    Only the module and function names are stored; the folder and file name
+    are rebuilt from the path when the records are read back.
+
+    Args:
+        records (List[ImportRecord]): The import records for one file.
+
+    Returns:
+        str: The JSON encoded [module, functions] pairs.
+    '''
+    return json.dumps([[record['Import Module'],
+                        record.get('Import Functions')]
+                       for record in records])
+
+
+def unpack_imports(file_path: str, imports: str)->List[ImportRecord]:
+    '''Rebuild the import records for a file from the cached JSON text.
+
+    Args:
+        file_path (str): The path to the file.
+        imports (str): The JSON encoded [module, functions] pairs.
+
+    Returns:
+        List[ImportRecord]: The import records for the file.
+    '''
+    file = Path(file_path)
+    folder = str(file.parent)
+    records = list()
+    for module, functions in json.loads(imports):
+        record = {'Folder': folder, 'File': file.name, 'Import Module': module}
+        if functions is not None:
+            record['Import Functions'] = functions
+        records.append(record)
+    return records
+
+
+def is_below(path: str, root: str)->bool:
+    '''Test whether a path is inside a folder.
+
+    Args:
+        path (str): An absolute file path.
+        root (str): An absolute folder path.
+
+    Returns:
+        bool: True if path is below root.
+    '''
+    return path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+# %% Cache statistics
+@dataclass
+class CacheStats():
+    '''Hit and miss counts for one scan.
+
+    Attributes:
+        hits (int): Files whose size and modification time were unchanged.
+        rehashed (int): Files that were touched but whose content hash was
+            unchanged.  These are not re-parsed.
+        misses (int): New or changed files that were parsed.
+        removed (int): Cache entries dropped because the file was deleted.
+    '''
+    hits: int = 0
+    rehashed: int = 0
+    misses: int = 0
+    removed: int = 0
+
+    @property
+    def files(self)->int:
+        '''The total number of files scanned.'''
+        return self.hits + self.rehashed + self.misses
+
+    @property
+    def hit_rate(self)->float:
+        '''The fraction of scanned files that did not need to be parsed.'''
+        if self.files == 0:
+            return 0.0
+        return (self.hits + self.rehashed) / self.files
+
+    def __str__(self)->str:
+        return (f'{self.files} files: {self.hits} hits, '
+                f'{self.rehashed} unchanged after rehash, '
+                f'{self.misses} parsed, {self.removed} removed '
+                f'({self.hit_rate:.0%} hit rate)')
+
+
+# %% Cache class
+class ImportCache():
+    '''A persistent cache of the import statements found in source files.
+
+    Each entry is keyed by the file's absolute path and stores its size,
+    modification time, content hash and parsed imports.  A file is re-parsed
+    only if its size changed, or its modification time changed and its
+    content hash no longer matches.
+
+    Use the cache as a context manager to make sure the database is closed:
+        with ImportCache() as cache:
+            import_df, import_freq = get_imports(root_path, cache=cache)
+            print(cache.stats)
+
+    Attributes:
+        cache_file (Path): The SQLite database file.
+        stats (CacheStats): The hit and miss counts for the latest scan.
+    '''
+    def __init__(self, cache_file: Path = DEFAULT_CACHE_FILE):
+        self.cache_file = Path(cache_file)
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.cache_file))
+        with self.connection:
+            self.connection.execute(CACHE_SCHEMA)
+            version = self.connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if version != SCANNER_VERSION:
+                # Entries made by an older scanner may be incomplete.
+                self.connection.execute('DELETE FROM file_imports')
+                self.connection.execute(
+                    f'PRAGMA user_version = {SCANNER_VERSION}')
+        self.stats = CacheStats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Close the cache database.'''
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def cached_entries(self)->Dict[str, tuple]:
+        '''Read all cache entries.
+
+        Returns:
+            Dict[str, tuple]: (size, mtime_ns, content_hash, imports) indexed
+                by file path.
+        '''
+        cursor = self.connection.execute(
+            'SELECT path, size, mtime_ns, content_hash, imports '
+            'FROM file_imports')
+        return {row[0]: row[1:] for row in cursor}
+
+    def scan_by_file(self, files: Iterable[Path], max_workers: int = None,
+                     root: Path = None)->Dict[str, List[ImportRecord]]:
+        '''Find the import statements in each file, using cached results for
+        unchanged files.
+
+        Args:
+            files (Iterable[Path]): The `.py` or `.ipynb` files to scan.
+            max_workers (int, optional): The number of worker processes used
+                to parse changed files.  If None, use one per CPU.
+            root (Path, optional): The folder that was searched for files.
+                If given, cache entries for any deleted file below root are
+                dropped.  Otherwise, only entries for files in files that no
+                longer exist are dropped.
+
+        Returns:
+            Dict[str, List[ImportRecord]]: The import records for each file,
+                indexed by file path and in file order.
+        '''
+        self.stats = CacheStats()
+        entries = self.cached_entries()
+        cached_imports = dict()
+        changed = dict()
+        updates = list()
+        removed = list()
+        file_keys = dict()
+        for file in files:
+            file_path = str(file)
+            key = os.path.abspath(file_path)
+            file_keys[file_path] = key
+            entry = entries.get(key)
+            try:
+                file_stat = os.stat(file_path)
+                if (entry is not None and entry[0] == file_stat.st_size
+                        and entry[1] == file_stat.st_mtime_ns):
+                    self.stats.hits += 1
+                    cached_imports[file_path] = entry[3]
+                    continue
+                # Hashed before parsing, so that an edit made during the scan
+                # is found by the next scan.
+                new_hash = file_hash(file_path)
+            except OSError:
+                if key in entries:
+                    removed.append(key)
+                continue
+            if entry is not None and entry[2] == new_hash:
+                self.stats.rehashed += 1
+                cached_imports[file_path] = entry[3]
+                updates.append((key, file_stat.st_size, file_stat.st_mtime_ns,
+                                new_hash, entry[3]))
+                continue
+            changed[file_path] = (file_stat, new_hash)
+        if root is not None:
+            scanned = set(file_keys.values())
+            root_path = os.path.abspath(str(root))
+            removed.extend(key for key in entries
+                           if key not in scanned and is_below(key, root_path)
+                           and not os.path.exists(key))
+        self.stats.misses = len(changed)
+        self.stats.removed = len(removed)
+
+        parsed_imports = scan_imports_by_file(list(changed), max_workers)
+        for file_path, (file_stat, content_hash) in changed.items():
+            imports = pack_imports(parsed_imports.get(file_path, []))
+            updates.append((file_keys[file_path], file_stat.st_size,
+                            file_stat.st_mtime_ns, content_hash, imports))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO file_imports '
+                '(path, size, mtime_ns, content_hash, imports) '
+                'VALUES (?, ?, ?, ?, ?)', updates)
+            self.connection.executemany(
+                'DELETE FROM file_imports WHERE path = ?',
+                [(key,) for key in removed])
+        logger.info('Import cache: %s', self.stats)
+
+        file_imports = dict()
+        for file_path in file_keys:
+            if file_path in parsed_imports:
+                file_imports[file_path] = parsed_imports[file_path]
+            elif file_path in cached_imports:
+                file_imports[file_path] = unpack_imports(
+                    file_path, cached_imports[file_path])
+        return file_imports
+
+    def scan(self, files: Iterable[Path], max_workers: int = None,
+             root: Path = None)->List[ImportRecord]:
+        '''Find the import statements in files, using cached results for
+        unchanged files.
+
+        The arguments match `scan_by_file`.
+
+        Returns:
+            List[ImportRecord]: The import records for all of the files, in
+                file order.
+        '''
+        import_list = list()
+        for records in self.scan_by_file(files, max_workers, root).values():
+            import_list.extend(records)
+        return import_list
+
+    def module_imports(self, files: Iterable[Path], max_workers: int = None,
+                       root: Path = None)->Dict[Path, Set[str]]:
+        '''Find the names of the modules imported by each file.
+
+        This gives the same result as applying `parse_python_imports` or
+        `parse_notebook_imports` from module_dependency_analysis.ipynb to
+        each file: relative imports are listed without their leading dots
+        and `from . import x` is ignored.
+
+        The arguments match `scan_by_file`.
+
+        Returns:
+            Dict[Path, Set[str]]: The imported module names for each file.
+        '''
+        module_imports = dict()
+        for file_path, records in self.scan_by_file(files, max_workers,
+                                                    root).items():
+            modules = (record['Import Module'].lstrip('.')
+                       for record in records)
+            module_imports[Path(file_path)] = set(
+                module for module in modules if module)
+        return module_imports
+
+    def clear(self):
+        '''Remove all cache entries.'''
+        with self.connection:
+            self.connection.execute('DELETE FROM file_imports')
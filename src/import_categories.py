@@ -0,0 +1,393 @@
+'''Import Categorization and Module Dependency Graphs.
+
+ Sort imported module names into standard library, third-party and local
+ modules, and build the dependency graph between a project's files and the
+ modules they import.
+
+ Each import is categorized by looking up its dotted name in a trie of
+ known module names, so the cost does not grow with the number of
+ installed packages, and results are memoized so that each distinct name
+ is categorized only once.  The dependency graph is updated file by file,
+ so after a change only the changed files need to be processed.
+ '''
+
+# %%  Imports
+from typing import Any, Dict, Iterable, List, Set, Union
+from pathlib import Path
+import sys
+import pkgutil
+
+try:
+    import networkx as nx
+except ImportError:
+    nx = None
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+STANDARD = 'standard'
+THIRD_PARTY = 'third_party'
+LOCAL = 'local'
+CATEGORIES = (STANDARD, THIRD_PARTY, LOCAL)
+
+
+# %% Module name trie
+class ModuleTrie():
+    '''A trie of dotted module names.
+
+    A name matches the longest registered prefix made of whole name parts,
+    so registering 'xml' matches 'xml.etree.ElementTree' but not 'xmlrpc'.
+    '''
+    def __init__(self):
+        self.root: Dict[str, Any] = dict()
+
+    def add(self, module_name: str, value: str):
+        '''Register a module name and all of its submodules.
+
+        Args:
+            module_name (str): The dotted module name.
+            value (str): The value returned for the module and its
+                submodules.
+        '''
+        node = self.root
+        for part in module_name.split('.'):
+            node = node.setdefault(part, dict())
+        node[None] = value
+
+    def lookup(self, module_name: str)->Union[str, None]:
+        '''Find the value of the longest registered prefix of a name.
+
+        Args:
+            module_name (str): The dotted module name.
+
+        Returns:
+            Union[str, None]: The registered value, or None if no prefix of
+                the name is registered.
+        '''
+        node = self.root
+        value = None
+        for part in module_name.split('.'):
+            node = node.get(part)
+            if node is None:
+                break
+            value = node.get(None, value)
+        return value
+
+
+# %% Categorizer
+def standard_module_names()->Set[str]:
+    '''The top-level names of the standard library modules.'''
+    if hasattr(sys, 'stdlib_module_names'):
+        standard_libs = set(sys.stdlib_module_names)
+    else:
+        # Fallback for Python versions < 3.10
+        import sysconfig  # pylint: disable=import-outside-toplevel
+        stdlib_path = sysconfig.get_paths()['stdlib']
+        standard_libs = {name for _, name, _ in
+                         pkgutil.iter_modules([stdlib_path])}
+    return standard_libs | set(sys.builtin_module_names)
+
+
+def installed_module_names()->Set[str]:
+    '''The top-level names of the modules that can be imported.'''
+    return {name for _, name, _ in pkgutil.iter_modules()}
+
+
+class ImportCategorizer():
+    '''Sort module names into standard, third_party and local modules.
+
+    Standard library modules take precedence over installed modules, and
+    any name that is neither is local.  Additional names can be registered
+    with `add`; dotted names apply only to that module and its submodules.
+
+    Attributes:
+        trie (ModuleTrie): The registered module names.
+        categories (Dict[str, str]): The memoized category of each name.
+    '''
+    def __init__(self, third_party: Iterable[str] = None,
+                 standard: Iterable[str] = None,
+                 local: Iterable[str] = None):
+        '''Build the module name index.
+
+        Args:
+            third_party (Iterable[str], optional): Third-party module names.
+                If None, the modules that can be imported in the running
+                python are used.
+            standard (Iterable[str], optional): Standard library module
+                names.  If None, the running python's standard library is
+                used.
+            local (Iterable[str], optional): Module names that are always
+                local, even if a module with the same name is installed.
+        '''
+        if third_party is None:
+            third_party = installed_module_names()
+        if standard is None:
+            standard = standard_module_names()
+        self.trie = ModuleTrie()
+        self.categories: Dict[str, str] = dict()
+        for name in third_party:
+            self.trie.add(name, THIRD_PARTY)
+        for name in standard:
+            self.trie.add(name, STANDARD)
+        for name in local or []:
+            self.trie.add(name, LOCAL)
+
+    def add(self, module_names: Union[str, Iterable[str]], category: str):
+        '''Register module names under a category.
+
+        Args:
+            module_names (Union[str, Iterable[str]]): One or more dotted
+                module names.
+            category (str): One of 'standard', 'third_party' or 'local'.
+
+        Raises:
+            ValueError: The category is not known.
+        '''
+        if category not in CATEGORIES:
+            raise ValueError(f'Unknown import category: {category}')
+        if isinstance(module_names, str):
+            module_names = [module_names]
+        for name in module_names:
+            self.trie.add(name, category)
+        self.categories.clear()
+
+    def categorize(self, module_name: str)->str:
+        '''Find the category of an imported module name.
+
+        Args:
+            module_name (str): The dotted module name.  Leading dots from
+                relative imports are ignored.
+
+        Returns:
+            str: 'standard', 'third_party' or 'local'.
+        '''
+        category = self.categories.get(module_name)
+        if category is None:
+            category = self.trie.lookup(module_name.lstrip('.')) or LOCAL
+            self.categories[module_name] = category
+        return category
+
+    def categorize_batch(self, module_names: Iterable[str])->Dict[str, str]:
+        '''Categorize many module names, looking up each distinct name once.
+
+        Args:
+            module_names (Iterable[str]): The module names.
+
+        Returns:
+            Dict[str, str]: The category of each distinct name.
+        '''
+        return {name: self.categorize(name) for name in set(module_names)}
+
+    def categorize_imports(self, imports: Iterable[str],
+                           top_level: bool = False)->Dict[str, Set[str]]:
+        '''Sort a file's imports by category.
+
+        Args:
+            imports (Iterable[str]): The imported module names.
+            top_level (bool, optional): If True, only the top level name of
+                each import is kept.  Defaults to False.
+
+        Returns:
+            Dict[str, Set[str]]: The imports in each category.
+        '''
+        categorized = {category: set() for category in CATEGORIES}
+        for name, category in self.categorize_batch(imports).items():
+            if top_level:
+                name = name.lstrip('.').split('.')[0]
+            categorized[category].add(name)
+        return categorized
+
+    def categorize_files(self, file_imports: Dict[Path, Iterable[str]],
+                         top_level: bool = False
+                         )->Dict[Path, Dict[str, Set[str]]]:
+        '''Sort the imports of several files by category.
+
+        Args:
+            file_imports (Dict[Path, Iterable[str]]): The imports of each
+                file.
+            top_level (bool, optional): If True, only the top level name of
+                each import is kept.  Defaults to False.
+
+        Returns:
+            Dict[Path, Dict[str, Set[str]]]: The categorized imports of each
+                file.
+        '''
+        return {file: self.categorize_imports(imports, top_level)
+                for file, imports in file_imports.items()}
+
+
+# %% Dependency graph
+class DependencyGraph():
+    '''A module dependency graph that is updated one file at a time.
+
+    Each file is a node, with an edge to each module it imports whose
+    category is included.  Nodes are named by the file's path relative to
+    the project root, so files with the same name in different folders are
+    kept apart; the file name is stored as the node's *label* for display.
+    The module names of the project's files are always local, even if the
+    project folder is on the python path, unless they are standard library
+    module names.  When a file's imports change only that file's edges are
+    replaced, so the graph can be kept up to date as files are edited.
+
+    Attributes:
+        categorizer (ImportCategorizer): Used to categorize the imports.
+        categories (Set[str]): The import categories included as edges.
+        root (Path): The project folder.  Only files inside it register
+            their module names as local.  If None, every file does.
+        file_imports (Dict[Path, Set[str]]): The imports of each file.
+        edges (Dict[str, Set[str]]): The imported modules for each node.
+    '''
+    def __init__(self, categorizer: ImportCategorizer = None,
+                 categories: Iterable[str] = (LOCAL,), root: Path = None):
+        self.categorizer = categorizer or ImportCategorizer()
+        self.categories = set(categories or CATEGORIES)
+        self.root = Path(root) if root is not None else None
+        self.file_imports: Dict[Path, Set[str]] = dict()
+        self.edges: Dict[str, Set[str]] = dict()
+        self.graph = nx.DiGraph() if nx is not None else None
+
+    def relative_path(self, file: Path)->Union[Path, None]:
+        '''The file's path relative to the project root.
+
+        Returns:
+            Union[Path, None]: The relative path, or None if the file is not
+                inside the project root.
+        '''
+        if self.root is None:
+            return None
+        try:
+            return Path(file).relative_to(self.root)
+        except ValueError:
+            return None
+
+    def node_name(self, file: Path)->str:
+        '''The graph node name for a file.'''
+        relative_path = self.relative_path(file)
+        if relative_path is not None:
+            return relative_path.as_posix()
+        return str(file)
+
+    @staticmethod
+    def label(file: Path)->str:
+        '''The display label for a file's node.'''
+        return Path(file).name
+
+    def is_project_file(self, file: Path)->bool:
+        '''Check whether a file belongs to the scanned project.'''
+        return self.root is None or self.relative_path(file) is not None
+
+    def remove(self, files: Iterable[Path]):
+        '''Remove files and their edges from the graph.
+
+        Args:
+            files (Iterable[Path]): The files to remove.
+        '''
+        for file in files:
+            if self.file_imports.pop(file, None) is None:
+                continue
+            node = self.node_name(file)
+            self.edges.pop(node, None)
+            if self.graph is not None and node in self.graph:
+                self.graph.remove_edges_from(list(self.graph.out_edges(node)))
+                if self.graph.degree(node) == 0:
+                    self.graph.remove_node(node)
+
+    def update(self, file_imports: Dict[Path, Iterable[str]])->List[Path]:
+        '''Add or replace the edges for files whose imports changed.
+
+        Args:
+            file_imports (Dict[Path, Iterable[str]]): The current imports of
+                each file.
+
+        Returns:
+            List[Path]: The files whose edges were replaced.
+        '''
+        changed = [file for file, imports in file_imports.items()
+                   if self.file_imports.get(file) != set(imports)]
+        new_modules = {Path(file).stem for file in changed
+                       if file not in self.file_imports
+                       and self.is_project_file(file)}
+        new_modules -= {name for name in new_modules
+                        if self.categorizer.trie.lookup(name)
+                        in (LOCAL, STANDARD)}
+        if new_modules:
+            self.categorizer.add(new_modules, LOCAL)
+        self.remove(changed)
+        for file in changed:
+            imports = set(file_imports[file])
+            self.file_imports[file] = imports
+            node = self.node_name(file)
+            targets = {name for name, category in
+                       self.categorizer.categorize_batch(imports).items()
+                       if category in self.categories}
+            self.edges[node] = targets
+            if self.graph is not None:
+                self.graph.add_node(node, label=self.label(file))
+                self.graph.add_edges_from((node, target)
+                                          for target in targets)
+        return changed
+
+    def sync(self, file_imports: Dict[Path, Iterable[str]])->List[Path]:
+        '''Make the graph match a complete set of files.
+
+        Files that are no longer present are removed and files whose
+        imports changed are updated.
+
+        Args:
+            file_imports (Dict[Path, Iterable[str]]): The imports of every
+                file in the project.
+
+        Returns:
+            List[Path]: The files that were added, changed or removed.
+        '''
+        removed = [file for file in self.file_imports
+                   if file not in file_imports]
+        self.remove(removed)
+        return removed + self.update(file_imports)
+
+    def update_from_cache(self, import_cache, files: List[Path])->List[Path]:
+        '''Update the graph from an import cache.
+
+        Only files that are new or modified are parsed by the cache, and only
+        files whose imports changed have their edges replaced.
+
+        Args:
+            import_cache (import_cache.ImportCache): An open import cache.
+            files (List[Path]): Every file in the project.
+
+        Returns:
+            List[Path]: The files that were added, changed or removed.
+        '''
+        return self.sync(import_cache.module_imports(files))
+
+    def to_networkx(self):
+        '''Get the graph as a networkx DiGraph.
+
+        Raises:
+            ImportError: networkx is not installed.
+        '''
+        if self.graph is None:
+            raise ImportError('networkx is required for dependency graphs.')
+        return self.graph
+
+    def dependency_table(self)->List[Dict[str, str]]:
+        '''List the local modules and third-party packages used by each file.
+
+        Returns:
+            List[Dict[str, str]]: 'Module', 'Local Modules' and
+                'Third-Party Packages' for each file.
+        '''
+        table = list()
+        for file, imports in self.file_imports.items():
+            categorized = self.categorizer.categorize_imports(imports,
+                                                              top_level=True)
+            table.append({
+                'Module': self.node_name(file),
+                'Local Modules': ', '.join(sorted(categorized[LOCAL])),
+                'Third-Party Packages': ', '.join(
+                    sorted(categorized[THIRD_PARTY]))
+                })
+        return table
@@ -0,0 +1,343 @@
+'''Import Name to Distribution Index.
+
+ Find which installed distribution provides each importable top-level
+ module in a Conda environment, by reading the environment's
+ `conda-meta/*.json` package records and the *.dist-info* folders of
+ packages installed by pip.  Python is not started in the environment.
+
+ The index for each environment is cached and rebuilt only when the
+ environment changes, so questions such as "which environments can run
+ this project's imports" can be answered without probing each
+ environment.
+ '''
+
+# %%  Imports
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+import json
+import hashlib
+
+from conda_meta import read_package_records, find_site_packages
+from conda_meta import read_dist_metadata, env_fingerprint, DIST_SUFFIXES
+from import_categories import standard_module_names
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Type Definitions
+class Distribution(NamedTuple):
+    '''An installed distribution that provides an import name.'''
+    name: str
+    version: str
+    installer: str
+
+
+# ModuleIndex maps each top-level import name to the distributions that
+# provide it.
+ModuleIndex = Dict[str, List[Distribution]]
+
+
+# %% Constants
+DEFAULT_INDEX_CACHE = Path.home() / '.cache' / 'env_tools' / 'import_index'
+
+# Entries in site-packages that are not importable modules.
+SKIPPED_ENTRIES = {'__pycache__', '__init__.py', 'README.txt'}
+
+
+# %% Index builders
+def module_name(entry: str)->str:
+    '''Find the top-level import name for an entry in site-packages.
+
+    Args:
+        entry (str): The first path component below site-packages, e.g.
+            'numpy', 'six.py' or
+            '_cffi_backend.cpython-311-x86_64-linux-gnu.so'.
+
+    Returns:
+        str: The import name, or '' if the entry is not importable.
+    '''
+    if entry in SKIPPED_ENTRIES or entry.endswith(DIST_SUFFIXES):
+        return ''
+    name, dot, extension = entry.partition('.')
+    if not dot:
+        return name if name.isidentifier() else ''
+    extension = extension.rsplit('.', 1)[-1]
+    if extension in ('py', 'pyc', 'pyd', 'so') and name.isidentifier():
+        return name
+    return ''
+
+
+def site_packages_entry(file_name: str)->str:
+    '''Get the first path component below site-packages in a file path.
+
+    Args:
+        file_name (str): A path relative to the environment or to
+            site-packages.
+
+    Returns:
+        str: The first component below site-packages, or '' if the file is
+            not in site-packages.
+    '''
+    parts = file_name.replace('\\', '/').split('/')
+    if 'site-packages' not in parts:
+        return ''
+    position = parts.index('site-packages') + 1
+    if position >= len(parts):
+        return ''
+    return parts[position]
+
+
+def conda_modules(records: List[dict])->Tuple[ModuleIndex, Set[str]]:
+    '''Index the import names provided by Conda packages.
+
+    Args:
+        records (List[dict]): The environment's conda-meta package records.
+
+    Returns:
+        Tuple[ModuleIndex, Set[str]]: The import names provided by each
+            package, and the (lower case) *.dist-info* and *.egg-info*
+            folder names that belong to Conda packages.
+    '''
+    index = dict()
+    conda_dist_folders = set()
+    for record in records:
+        distribution = Distribution(record['name'], record.get('version', ''),
+                                    'conda')
+        names = set()
+        for file_name in record.get('files', []):
+            entry = site_packages_entry(file_name)
+            if not entry:
+                continue
+            if entry.endswith(DIST_SUFFIXES):
+                conda_dist_folders.add(entry.lower())
+                continue
+            name = module_name(entry)
+            if name:
+                names.add(name)
+        for name in names:
+            index.setdefault(name, []).append(distribution)
+    return index, conda_dist_folders
+
+
+def dist_modules(dist_folder: Path)->Set[str]:
+    '''Read the import names provided by a pip installed distribution.
+
+    `top_level.txt` is used if it exists; otherwise the top-level entries in
+    the `RECORD` file are used.
+
+    Args:
+        dist_folder (Path): The *.dist-info* or *.egg-info* folder.
+
+    Returns:
+        Set[str]: The import names.
+    '''
+    top_level_file = dist_folder / 'top_level.txt'
+    if top_level_file.is_file():
+        lines = top_level_file.read_text(encoding='utf-8',
+                                         errors='replace').splitlines()
+        return {line.strip().replace('/', '.').split('.')[0]
+                for line in lines if line.strip()}
+    names = set()
+    record_file = dist_folder / 'RECORD'
+    if record_file.is_file():
+        with record_file.open(encoding='utf-8', errors='replace') as file:
+            for line in file:
+                entry = line.split(',', 1)[0].replace('\\', '/').split('/')[0]
+                name = module_name(entry)
+                if name:
+                    names.add(name)
+    return names
+
+
+def build_module_index(env_path: Path)->ModuleIndex:
+    '''Build the import name index for a Conda environment.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        ModuleIndex: The distributions that provide each import name.
+    '''
+    index, conda_dist_folders = conda_modules(read_package_records(env_path))
+    for site_packages in find_site_packages(env_path):
+        for dist_folder in site_packages.iterdir():
+            if not dist_folder.name.endswith(DIST_SUFFIXES):
+                continue
+            if dist_folder.name.lower() in conda_dist_folders:
+                continue
+            metadata = read_dist_metadata(dist_folder)
+            if 'Name' not in metadata:
+                continue
+            distribution = Distribution(metadata['Name'],
+                                        metadata.get('Version', ''), 'pip')
+            for name in dist_modules(dist_folder):
+                index.setdefault(name, []).append(distribution)
+    return index
+
+
+def index_fingerprint(env_path: Path)->str:
+    '''Generate a fingerprint that changes when an environment's packages
+    change.
+
+    pip does not update `conda-meta`, so the *.dist-info* and *.egg-info*
+    entries in site-packages are included with the environment fingerprint.
+
+    Args:
+        env_path (Path): The path to the Conda environment.
+
+    Returns:
+        str: A hexadecimal sha256 fingerprint.
+    '''
+    fingerprint = hashlib.sha256(env_fingerprint(env_path).encode('utf-8'))
+    for site_packages in find_site_packages(env_path):
+        with os.scandir(site_packages) as entries:
+            dist_stats = sorted((entry.name, entry.stat().st_mtime_ns)
+                                for entry in entries
+                                if entry.name.endswith(DIST_SUFFIXES))
+        for name, mtime in dist_stats:
+            fingerprint.update(f'{name}|{mtime}\n'.encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+# %% Cached index
+class ImportIndex():
+    '''Cached import name indexes for Conda environments.
+
+    Each environment's index is saved as a .json file in the cache folder
+    together with the environment's fingerprint, and is rebuilt only when
+    the fingerprint changes.
+
+    Example:
+        import_index = ImportIndex()
+        import_index.environments_for({'pandas', 'xlwings', 'units'})
+
+    Attributes:
+        cache_path (Path): The folder containing the cached indexes.
+    '''
+    def __init__(self, cache_path: Path = DEFAULT_INDEX_CACHE):
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def cache_file(self, env_path: Path)->Path:
+        '''The cache file for an environment's index.'''
+        path_text = str(Path(env_path).resolve()).lower()
+        path_hash = hashlib.sha1(path_text.encode('utf-8')).hexdigest()[:16]
+        return self.cache_path / f'{Path(env_path).name}_{path_hash}.json'
+
+    def env_index(self, env_path: Path)->ModuleIndex:
+        '''Get the import name index for an environment.
+
+        Args:
+            env_path (Path): The path to the Conda environment.
+
+        Returns:
+            ModuleIndex: The distributions that provide each import name.
+        '''
+        fingerprint = index_fingerprint(env_path)
+        cache_file = self.cache_file(env_path)
+        if cache_file.exists():
+            try:
+                cached = json.loads(cache_file.read_text(encoding='utf-8'))
+            except ValueError:
+                cached = {}
+            if cached.get('fingerprint') == fingerprint:
+                return {name: [Distribution(*item) for item in providers]
+                        for name, providers in cached['modules'].items()}
+        logger.debug('Indexing imports in %s', env_path)
+        index = build_module_index(env_path)
+        cached = {'env_path': str(env_path), 'fingerprint': fingerprint,
+                  'modules': index}
+        temporary_file = cache_file.with_suffix('.tmp')
+        temporary_file.write_text(json.dumps(cached), encoding='utf-8')
+        temporary_file.replace(cache_file)
+        return index
+
+    def index_environments(self, environments: Dict[str, Path] = None,
+                           max_workers: int = None)->Dict[str, ModuleIndex]:
+        '''Get the import name indexes for several environments.
+
+        Args:
+            environments (Dict[str, Path], optional): The path of each
+                environment, by name.  If None, all Conda environments are
+                indexed.
+            max_workers (int, optional): The number of environments indexed
+                at once.  If None, the ThreadPoolExecutor default is used.
+
+        Returns:
+            Dict[str, ModuleIndex]: The index for each environment.
+        '''
+        if environments is None:
+            # Imported here so that the index can be used without env_tools.
+            from env_tools import list_environments  # pylint: disable=import-outside-toplevel
+            environments = dict(list_environments())
+        names = list(environments)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            indexes = executor.map(self.env_index,
+                                   [environments[name] for name in names])
+            return dict(zip(names, indexes))
+
+    def providers(self, import_name: str,
+                  environments: Dict[str, Path] = None
+                  )->Dict[str, List[Distribution]]:
+        '''Find the distributions that provide an import in each environment.
+
+        Args:
+            import_name (str): The imported module name.
+            environments (Dict[str, Path], optional): The environments to
+                search.  If None, all Conda environments are searched.
+
+        Returns:
+            Dict[str, List[Distribution]]: The providing distributions in each
+                environment that has the import.
+        '''
+        top_level = import_name.lstrip('.').split('.')[0]
+        return {env_name: index[top_level]
+                for env_name, index in
+                self.index_environments(environments).items()
+                if top_level in index}
+
+    def missing_imports(self, imports: Iterable[str],
+                        environments: Dict[str, Path] = None
+                        )->Dict[str, Set[str]]:
+        '''Find the imports that each environment cannot satisfy.
+
+        Standard library modules and relative imports (names starting with
+        '.') are ignored; pass only third-party imports to also ignore a
+        project's other local modules.
+
+        Args:
+            imports (Iterable[str]): The imported module names.
+            environments (Dict[str, Path], optional): The environments to
+                check.  If None, all Conda environments are checked.
+
+        Returns:
+            Dict[str, Set[str]]: The top-level import names missing from each
+                environment.
+        '''
+        standard = standard_module_names()
+        required = {name.split('.')[0] for name in imports
+                    if not name.startswith('.')}
+        required -= standard
+        return {env_name: required - set(index)
+                for env_name, index in
+                self.index_environments(environments).items()}
+
+    def environments_for(self, imports: Iterable[str],
+                         environments: Dict[str, Path] = None)->List[str]:
+        '''List the environments that provide all of a project's imports.
+
+        Args:
+            imports (Iterable[str]): The imported module names.
+            environments (Dict[str, Path], optional): The environments to
+                check.  If None, all Conda environments are checked.
+
+        Returns:
+            List[str]: The names of the environments with no missing imports.
+        '''
+        return [env_name for env_name, missing in
+                self.missing_imports(imports, environments).items()
+                if not missing]
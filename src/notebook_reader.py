@@ -0,0 +1,313 @@
+'''Streaming Jupyter Notebook Reader.
+
+ Read the code cell sources from a Jupyter notebook without loading the
+ whole notebook.  The notebook JSON is scanned in fixed size blocks and
+ only the `cell_type` and `source` of each cell are kept; cell outputs
+ (which can hold many megabytes of base64 images) are skipped as they are
+ read, so memory use does not depend on the size of the outputs.
+
+ IPython magics and shell escapes (`%` and `!` lines) are removed from the
+ sources so that the cells can be parsed with `ast`.
+ '''
+
+# %%  Imports
+from typing import Iterator, List, TextIO, Tuple, Union
+from pathlib import Path
+import re
+import json
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+BLOCK_SIZE = 1 << 16
+
+WHITESPACE = ' \t\n\r'
+
+# The characters that open, close or quote JSON values.
+STRUCTURE_PATTERN = re.compile(r'[{}\[\]"]')
+# The characters that end a JSON number or literal.
+SCALAR_END_PATTERN = re.compile(r'[,}\]\s]')
+
+# Magic lines, shell escapes and assignments from them, e.g.
+# `%matplotlib inline`, `!pip install units`, `files = !ls`.
+MAGIC_LINE_PATTERN = re.compile(
+    r'^(\s*)(?:[%!]|[\w.,\s\[\]()]+=\s*[%!])')
+
+# Cell magics whose cell body is python code.
+PYTHON_CELL_MAGICS = {'time', 'timeit', 'capture', 'prun', 'debug'}
+
+
+# %% JSON scanner
+class NotebookScanner():
+    '''An incremental scanner for the JSON text of a notebook.
+
+    Only the block being scanned is held in memory, plus any value that is
+    being kept.
+
+    Attributes:
+        file (TextIO): The open notebook file.
+        buffer (str): The text that has been read but not yet scanned.
+        position (int): The scan position in buffer.
+    '''
+    def __init__(self, file: TextIO, block_size: int = BLOCK_SIZE):
+        self.file = file
+        self.block_size = block_size
+        self.buffer = ''
+        self.position = 0
+
+    def fill(self)->bool:
+        '''Discard the scanned text and read the next block.
+
+        Returns:
+            bool: False if the end of the file has been reached.
+        '''
+        block = self.file.read(self.block_size)
+        self.buffer = self.buffer[self.position:] + block
+        self.position = 0
+        return bool(block)
+
+    def peek(self)->str:
+        '''Skip whitespace and return the next character.
+
+        Returns:
+            str: The next character, or '' at the end of the file.
+        '''
+        while True:
+            while self.position < len(self.buffer):
+                character = self.buffer[self.position]
+                if character not in WHITESPACE:
+                    return character
+                self.position += 1
+            if not self.fill():
+                return ''
+
+    def expect(self, expected: str):
+        '''Consume an expected character.
+
+        Raises:
+            ValueError: The next character is not the expected one.
+        '''
+        character = self.peek()
+        if character != expected:
+            raise ValueError(f'Expected {expected!r} in notebook, found '
+                             f'{character!r}')
+        self.position += 1
+
+    def next_item(self, closing: str)->bool:
+        '''Move to the next item in an object or array.
+
+        Args:
+            closing (str): The character that closes the object or array.
+
+        Returns:
+            bool: False if the object or array has ended.
+        '''
+        character = self.peek()
+        if character == ',':
+            self.position += 1
+            character = self.peek()
+        if character == closing:
+            self.position += 1
+            return False
+        if not character:
+            raise ValueError('Unexpected end of notebook')
+        return True
+
+    def scan_string(self, keep: bool)->Union[str, None]:
+        '''Scan a string value, keeping it only if requested.
+
+        Args:
+            keep (bool): If True, decode and return the string.
+
+        Returns:
+            Union[str, None]: The string, or None if it is not kept.
+        '''
+        self.expect('"')
+        pieces = list()
+        while True:
+            end = self.buffer.find('"', self.position)
+            if end < 0:
+                # Keep any trailing backslashes, since they may escape the
+                # first character of the next block.
+                keep_from = len(self.buffer)
+                while (keep_from > self.position
+                       and self.buffer[keep_from - 1] == '\\'):
+                    keep_from -= 1
+                if keep:
+                    pieces.append(self.buffer[self.position:keep_from])
+                self.position = keep_from
+                if not self.fill():
+                    raise ValueError('Unterminated string in notebook')
+                continue
+            backslashes = 0
+            while (end - backslashes - 1 >= self.position
+                   and self.buffer[end - backslashes - 1] == '\\'):
+                backslashes += 1
+            if keep:
+                pieces.append(self.buffer[self.position:end])
+            self.position = end + 1
+            if backslashes % 2 == 0:
+                break
+            if keep:
+                pieces.append('"')
+        if keep:
+            return json.loads('"' + ''.join(pieces) + '"')
+        return None
+
+    def skip_value(self):
+        '''Skip a JSON value of any type without keeping it.'''
+        character = self.peek()
+        if character == '"':
+            self.scan_string(keep=False)
+            return
+        if character not in '{[':
+            while True:
+                match = SCALAR_END_PATTERN.search(self.buffer, self.position)
+                if match:
+                    self.position = match.start()
+                    return
+                self.position = len(self.buffer)
+                if not self.fill():
+                    return
+        depth = 0
+        while True:
+            match = STRUCTURE_PATTERN.search(self.buffer, self.position)
+            if match is None:
+                self.position = len(self.buffer)
+                if not self.fill():
+                    raise ValueError('Unexpected end of notebook')
+                continue
+            self.position = match.start()
+            character = match.group()
+            if character == '"':
+                self.scan_string(keep=False)
+                continue
+            self.position += 1
+            depth += 1 if character in '{[' else -1
+            if depth == 0:
+                return
+
+    def read_source(self)->str:
+        '''Read a cell source, stored as a string or a list of strings.'''
+        if self.peek() == '"':
+            return self.scan_string(keep=True)
+        if self.peek() != '[':
+            self.skip_value()
+            return ''
+        self.expect('[')
+        lines = list()
+        while self.next_item(']'):
+            if self.peek() == '"':
+                lines.append(self.scan_string(keep=True))
+            else:
+                self.skip_value()
+        return ''.join(lines)
+
+    def read_cell(self)->Tuple[str, str]:
+        '''Read the type and source of a cell, skipping everything else.
+
+        Returns:
+            Tuple[str, str]: The cell type and source.
+        '''
+        cell_type = ''
+        source = ''
+        self.expect('{')
+        while self.next_item('}'):
+            key = self.scan_string(keep=True)
+            self.expect(':')
+            if key == 'cell_type' and self.peek() == '"':
+                cell_type = self.scan_string(keep=True)
+            elif key == 'source':
+                source = self.read_source()
+            else:
+                self.skip_value()
+        return cell_type, source
+
+    def iter_cells(self)->Iterator[Tuple[str, str]]:
+        '''Yield the type and source of each cell in the notebook.'''
+        self.expect('{')
+        while self.next_item('}'):
+            key = self.scan_string(keep=True)
+            self.expect(':')
+            if key != 'cells' or self.peek() != '[':
+                self.skip_value()
+                continue
+            self.expect('[')
+            while self.next_item(']'):
+                if self.peek() == '{':
+                    yield self.read_cell()
+                else:
+                    self.skip_value()
+
+
+# %% Source readers
+def strip_magics(source: str)->str:
+    '''Remove IPython magics and shell escapes from a cell source.
+
+    Magic lines are replaced by `pass` at the same indentation, so that line
+    numbers and indented blocks are kept.  A cell that starts with a cell
+    magic (e.g. `%%bash`) is dropped unless the magic runs python code.
+
+    Args:
+        source (str): The cell source.
+
+    Returns:
+        str: Python source that can be parsed with `ast`.
+    '''
+    lines = source.splitlines()
+    if lines and lines[0].lstrip().startswith('%%'):
+        magic_name = lines[0].lstrip()[2:].split(maxsplit=1)
+        if not magic_name or magic_name[0] not in PYTHON_CELL_MAGICS:
+            return ''
+    stripped = list()
+    for line in lines:
+        match = MAGIC_LINE_PATTERN.match(line)
+        if match:
+            stripped.append(match.group(1) + 'pass')
+        else:
+            stripped.append(line)
+    return '\n'.join(stripped)
+
+
+def iter_code_cells(file_path: Path,
+                    block_size: int = BLOCK_SIZE)->Iterator[str]:
+    '''Yield the source of each code cell in a notebook, with magics
+    removed.
+
+    Args:
+        file_path (Path): The path to the notebook.
+        block_size (int, optional): The number of characters read at once.
+            Defaults to BLOCK_SIZE.
+
+    Raises:
+        ValueError: The notebook is not valid JSON.
+        OSError: The notebook cannot be read.
+
+    Yields:
+        str: The source of each code cell.
+    '''
+    with Path(file_path).open('r', encoding='utf-8') as file:
+        for cell_type, source in NotebookScanner(file,
+                                                 block_size).iter_cells():
+            if cell_type == 'code':
+                yield strip_magics(source)
+
+
+def read_code_cells(file_path: Path)->List[str]:
+    '''Read the source of each code cell in a notebook, with magics removed.
+
+    Args:
+        file_path (Path): The path to the notebook.
+
+    Returns:
+        List[str]: The source of each code cell, or an empty list if the
+            notebook cannot be read.
+    '''
+    try:
+        return list(iter_code_cells(file_path))
+    except (ValueError, OSError) as err:
+        logger.debug('Unable to read notebook %s: %s', file_path, err)
+        return list()
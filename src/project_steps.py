@@ -0,0 +1,187 @@
+'''Project Environment Build Steps.
+
+ The steps used to finish a project environment after its packages are
+ installed: the Jupyter kernel, xlwings, the batch files that open the
+ project and the saved install logs.  These were previously defined in the
+ BuildEnv notebook.
+ '''
+
+# %%  Imports
+from typing import Any, Dict, List
+from pathlib import Path
+import json
+
+from env_tools import AnacondaException, AbortedCmdException
+from env_tools import run_in_environment, traced_operation
+from env_session import WINDOWS_ANACONDA_ROOT
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Install Jupyter Kernel
+@traced_operation
+def install_kernel(new_env: str, session=None)->str:
+    '''Install the ipython kernel in the new environment.
+
+    Args:
+        new_env (str): Name of Conda environment.
+        session (EnvironmentSession, optional): An activated shell session for
+            the environment.  If None, activate the environment for this
+            command only.
+
+    Returns:
+        str: The log output from the install.
+    '''
+    kernel_cmd = f'python -m ipykernel install --user --name {new_env} '
+    kernel_cmd += f'--display-name "Python ({new_env})"'
+
+    kernel_install_log = run_in_environment(
+        new_env,
+        kernel_cmd,
+        AnacondaException,
+        f'Unable to install ipython kernel in "{new_env}"!',
+        session=session
+        )
+    return kernel_install_log
+
+
+# %% Configure xlwings
+@traced_operation
+def configure_xlwings(new_env: str, session=None)->str:
+    '''Install and configure xlwings binaries for environment.
+
+    NOTE: This is still a works in progress.
+
+    Args:
+        new_env (str): Name of Conda environment.
+        session (EnvironmentSession, optional): An activated shell session for
+            the environment.  If None, activate the environment for each
+            command.
+
+    Returns:
+        str: The log output from the install.
+    '''
+    logger.debug('Updating Xlwings licence for %s', new_env)
+    xlwings_license = 'xlwings license update -k noncommercial'
+    license_log = run_in_environment(
+        new_env, xlwings_license, AnacondaException,
+        f'Unable to set xlwings license in environment {new_env}',
+        session=session)
+
+    logger.debug('Installing Xlwings add-in for %s', new_env)
+    xlwings_add_in = 'xlwings addin install'
+    add_in_log = ''
+    try:
+        add_in_log = run_in_environment(
+            new_env, xlwings_add_in, AnacondaException,
+            f'Unable to install xlwings addin in environment {new_env}',
+            abort_after=2, session=session)
+    except AbortedCmdException:
+        logger.warning('Xlwings Add-in install timed out\n'
+                       'This is likely due to insufficient rights to install '
+                       'the add-in.')
+
+    logger.debug('Creating Xlwings config file for %s', new_env)
+    xlwings_config = 'xlwings config create --force'
+    config_log = run_in_environment(
+        new_env, xlwings_config, AnacondaException,
+        f'Unable to configure xlwings in environment {new_env}',
+        session=session)
+
+    xlwings_log = '\n\n'.join([license_log, add_in_log, config_log])
+    return xlwings_log
+
+
+# %% Batch files
+def project_batch_text(env_name: str, project_folder: Path,
+                       project_drive: str, command: str)->str:
+    '''Build the text of a batch file that runs a command for a project.
+
+    Args:
+        env_name (str): Name of Conda environment.
+        project_folder (Path): The top folder of the project.
+        project_drive (str): The drive containing the project folder.
+        command (str): The command to run in the activated environment.
+
+    Returns:
+        str: The batch file text.
+    '''
+    return '\n'.join([
+        rf'CALL {WINDOWS_ANACONDA_ROOT}\Scripts\activate.bat '
+        rf'{WINDOWS_ANACONDA_ROOT}',
+        f'CALL conda activate "{env_name}"',
+        f'CD "{project_folder}"',
+        f'{project_drive}',
+        command
+        ])
+
+
+def build_jupyter_bat(env_name: str, env_folder: Path, project_folder: Path,
+                      project_drive: str)->Path:
+    '''Write a batch file that starts JupyterLab for the project.
+
+    Args:
+        env_name (str): Name of Conda environment.
+        env_folder (Path): The folder to contain the batch file.
+        project_folder (Path): The top folder of the project.
+        project_drive (str): The drive containing the project folder.
+
+    Returns:
+        Path: The batch file.
+    '''
+    jupyter_batch_file = Path(env_folder) / f'JupyterLab ({env_name}).bat'
+    jupyter_batch = project_batch_text(env_name, project_folder,
+                                       project_drive, 'jupyter-lab')
+    jupyter_batch_file.write_text(jupyter_batch)
+    return jupyter_batch_file
+
+
+def build_vs_code_bat(env_name: str, env_folder: Path, project_folder: Path,
+                      project_drive: str)->Path:
+    '''Write a batch file that opens the project workspace in VS Code.
+
+    Args:
+        env_name (str): Name of Conda environment.
+        env_folder (Path): The folder to contain the batch file.
+        project_folder (Path): The top folder of the project.
+        project_drive (str): The drive containing the project folder.
+
+    Returns:
+        Path: The batch file.
+    '''
+    vscode_batch_file = Path(env_folder) / f'VS Code ({env_name}).bat'
+    vscode_batch = project_batch_text(env_name, project_folder,
+                                      project_drive,
+                                      f'code {env_name}.code-workspace')
+    vscode_batch_file.write_text(vscode_batch)
+    return vscode_batch_file
+
+
+# %% Install logs
+def save_logs(create_output: Dict[str, Any], install_output: Dict[str, Any],
+              pip_install_output: List[Dict[str, Any]], env_name: str,
+              env_folder: Path)->Path:
+    '''Save the output from building an environment as a .json file.
+
+    Args:
+        create_output (Dict[str, Any]): The output from creating the
+            environment.
+        install_output (Dict[str, Any]): The output from installing the
+            Conda packages.
+        pip_install_output (List[Dict[str, Any]]): The output from installing
+            the pip packages.
+        env_name (str): Name of Conda environment.
+        env_folder (Path): The folder to contain the log file.
+
+    Returns:
+        Path: The log file.
+    '''
+    environment_logs = {'Create': create_output,
+                        'Install': install_output,
+                        'Pip Install':pip_install_output}
+    log_file = Path(env_folder) / f'{env_name}EnvironmentLog.json'
+    with log_file.open('w', encoding='utf-8') as file:
+        json.dump(environment_logs, file, indent=4)
+    return log_file
@@ -0,0 +1,352 @@
+'''Environment Snapshot Differences.
+
+ Compare two snapshot folders saved by `env_tools.log_all_envs` and report
+ the packages added, removed, upgraded and downgraded in each environment,
+ as well as the environments created or deleted.
+
+ Usage:
+    python snapshot_diff.py OLD_FOLDER NEW_FOLDER [--json FILE] [--csv FILE]
+ '''
+
+# %%  Imports
+from typing import List, Dict, Tuple
+from dataclasses import dataclass, field
+from pathlib import Path
+import sys
+import json
+import argparse
+
+import pandas as pd
+
+from env_snapshots import SnapshotTable, load_snapshot_folder, version_key
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Type Definitions
+# PackageRecord is the (Version, Build, Channel, Pip) of one package.
+PackageRecord = Tuple[str, str, str, bool]
+# EnvRecords is the PackageRecord of every package in one environment.
+EnvRecords = Dict[str, PackageRecord]
+
+
+# %% Constants
+DIFF_COLUMNS = ['Environment', 'Change', 'Package', 'Old Version',
+                'New Version', 'Old Build', 'New Build']
+
+
+# %% Diff classes
+@dataclass
+class EnvironmentDiff():
+    '''The package changes in one environment.
+
+    Attributes:
+        env_name (str): The environment name.
+        added (Dict[str, PackageRecord]): New packages.
+        removed (Dict[str, PackageRecord]): Packages no longer installed.
+        upgraded (Dict[str, Tuple[PackageRecord, PackageRecord]]): Packages
+            with a higher version, as (old, new) records.
+        downgraded (Dict[str, Tuple[PackageRecord, PackageRecord]]): Packages
+            with a lower version, as (old, new) records.
+        rebuilt (Dict[str, Tuple[PackageRecord, PackageRecord]]): Packages
+            with the same version but a different build, channel or
+            installer, as (old, new) records.
+    '''
+    env_name: str
+    added: Dict[str, PackageRecord] = field(default_factory=dict)
+    removed: Dict[str, PackageRecord] = field(default_factory=dict)
+    upgraded: Dict[str, Tuple[PackageRecord, PackageRecord]] = field(
+        default_factory=dict)
+    downgraded: Dict[str, Tuple[PackageRecord, PackageRecord]] = field(
+        default_factory=dict)
+    rebuilt: Dict[str, Tuple[PackageRecord, PackageRecord]] = field(
+        default_factory=dict)
+
+    @property
+    def has_changes(self)->bool:
+        '''True if any package changed.'''
+        return any((self.added, self.removed, self.upgraded, self.downgraded,
+                    self.rebuilt))
+
+    def rows(self)->List[dict]:
+        '''One table row for each changed package.'''
+        rows = list()
+        for package, record in sorted(self.added.items()):
+            rows.append(change_row(self.env_name, 'added', package,
+                                   None, record))
+        for package, record in sorted(self.removed.items()):
+            rows.append(change_row(self.env_name, 'removed', package,
+                                   record, None))
+        for change in ('upgraded', 'downgraded', 'rebuilt'):
+            for package, (old, new) in sorted(getattr(self, change).items()):
+                rows.append(change_row(self.env_name, change, package,
+                                       old, new))
+        return rows
+
+
+@dataclass
+class SnapshotDiff():
+    '''The differences between two snapshots.
+
+    Attributes:
+        old_name (str): The name of the earlier snapshot.
+        new_name (str): The name of the later snapshot.
+        created (List[str]): Environments only in the later snapshot.
+        deleted (List[str]): Environments only in the earlier snapshot.
+        changed (Dict[str, EnvironmentDiff]): The package changes for each
+            environment in both snapshots that changed.
+        unchanged (List[str]): Environments in both snapshots with identical
+            packages.
+    '''
+    old_name: str
+    new_name: str
+    created: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    changed: Dict[str, EnvironmentDiff] = field(default_factory=dict)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self)->bool:
+        '''True if any environment was created, deleted or changed.'''
+        return bool(self.created or self.deleted or self.changed)
+
+    def to_frame(self)->pd.DataFrame:
+        '''Build a table with one row for each change.
+
+        Created and deleted environments have a single row with an empty
+        Package.
+
+        Returns:
+            pd.DataFrame: The changes with the columns in DIFF_COLUMNS.
+        '''
+        rows = [change_row(env_name, 'created', None, None, None)
+                for env_name in self.created]
+        rows += [change_row(env_name, 'deleted', None, None, None)
+                 for env_name in self.deleted]
+        for env_diff in self.changed.values():
+            rows.extend(env_diff.rows())
+        return pd.DataFrame(rows, columns=DIFF_COLUMNS)
+
+    def to_dict(self)->dict:
+        '''Convert the differences to a JSON serializable dictionary.'''
+        def versions(records: Dict[str, PackageRecord])->Dict[str, str]:
+            return {package: record[0]
+                    for package, record in sorted(records.items())}
+
+        def changes(records: Dict[str, Tuple[PackageRecord, PackageRecord]]
+                    )->Dict[str, List[str]]:
+            return {package: [old[0], new[0]]
+                    for package, (old, new) in sorted(records.items())}
+
+        environments = dict()
+        for env_name, env_diff in sorted(self.changed.items()):
+            environments[env_name] = {
+                'added': versions(env_diff.added),
+                'removed': versions(env_diff.removed),
+                'upgraded': changes(env_diff.upgraded),
+                'downgraded': changes(env_diff.downgraded),
+                'rebuilt': changes(env_diff.rebuilt)
+                }
+        return {'old': self.old_name, 'new': self.new_name,
+                'created': self.created, 'deleted': self.deleted,
+                'changed': environments}
+
+    def save_json(self, json_file: Path):
+        '''Save the differences as a JSON file.'''
+        with Path(json_file).open('w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def save_csv(self, csv_file: Path):
+        '''Save the differences table as a CSV file.'''
+        self.to_frame().to_csv(csv_file, index=False)
+
+    def summary(self)->str:
+        '''A short text report of the differences.'''
+        lines = [f'{self.old_name} -> {self.new_name}']
+        for env_name in self.created:
+            lines.append(f'  + {env_name} (created)')
+        for env_name in self.deleted:
+            lines.append(f'  - {env_name} (deleted)')
+        for env_name, env_diff in sorted(self.changed.items()):
+            counts = ', '.join(
+                f'{len(getattr(env_diff, change))} {change}'
+                for change in ('added', 'removed', 'upgraded', 'downgraded',
+                               'rebuilt')
+                if getattr(env_diff, change))
+            lines.append(f'  * {env_name}: {counts}')
+        if not self.has_changes:
+            lines.append('  No changes.')
+        return '\n'.join(lines)
+
+
+def change_row(env_name: str, change: str, package: str,
+               old: PackageRecord, new: PackageRecord)->dict:
+    '''Build one row of the differences table.'''
+    return {'Environment': env_name, 'Change': change, 'Package': package,
+            'Old Version': old[0] if old else None,
+            'New Version': new[0] if new else None,
+            'Old Build': old[1] if old else None,
+            'New Build': new[1] if new else None}
+
+
+# %% Diff functions
+def environment_records(snapshot: SnapshotTable)->Dict[str, EnvRecords]:
+    '''Group the package records in a snapshot by environment.
+
+    Args:
+        snapshot (SnapshotTable): The snapshot.
+
+    Returns:
+        Dict[str, EnvRecords]: The package records for each environment.
+    '''
+    packages = snapshot.packages
+    columns = [packages[column].astype(object).where(packages[column].notna(),
+                                                     None).tolist()
+               for column in ('Environment', 'Package', 'Version', 'Build',
+                              'Channel')]
+    env_records = {env_name: dict() for env_name in snapshot.environments}
+    for env_name, package, version, build, channel, pip in zip(
+            *columns, packages['Pip'].tolist()):
+        env_records[env_name][package] = (version, build, channel, bool(pip))
+    return env_records
+
+
+def is_rebuilt(old: PackageRecord, new: PackageRecord)->bool:
+    '''Test whether a package with an unchanged version was reinstalled.
+
+    The channel is only compared if it is known in both snapshots, since
+    snapshots saved without a spec file do not record Conda channels.
+
+    Args:
+        old (PackageRecord): The earlier package record.
+        new (PackageRecord): The later package record.
+
+    Returns:
+        bool: True if the build, installer or channel changed.
+    '''
+    if old[1] != new[1] or old[3] != new[3]:
+        return True
+    return None not in (old[2], new[2]) and old[2] != new[2]
+
+
+def diff_environment(env_name: str, old_records: EnvRecords,
+                     new_records: EnvRecords)->EnvironmentDiff:
+    '''Compare the packages in two versions of an environment.
+
+    Args:
+        env_name (str): The environment name.
+        old_records (EnvRecords): The earlier package records.
+        new_records (EnvRecords): The later package records.
+
+    Returns:
+        EnvironmentDiff: The package changes.
+    '''
+    env_diff = EnvironmentDiff(env_name)
+    old_packages = old_records.keys()
+    new_packages = new_records.keys()
+    env_diff.added = {package: new_records[package]
+                      for package in new_packages - old_packages}
+    env_diff.removed = {package: old_records[package]
+                        for package in old_packages - new_packages}
+    # Only packages whose records differ need a version comparison.
+    changed = (set(old_records.items()) - set(new_records.items()))
+    for package, old in changed:
+        new = new_records.get(package)
+        if new is None:
+            continue
+        old_key = version_key(old[0])
+        new_key = version_key(new[0])
+        if new_key > old_key:
+            env_diff.upgraded[package] = (old, new)
+        elif new_key < old_key:
+            env_diff.downgraded[package] = (old, new)
+        elif is_rebuilt(old, new):
+            env_diff.rebuilt[package] = (old, new)
+    return env_diff
+
+
+def diff_snapshots(old: SnapshotTable, new: SnapshotTable)->SnapshotDiff:
+    '''Compare two snapshots.
+
+    Environments whose package records are identical are detected by
+    comparing hashes of their record sets, so only changed environments
+    are compared package by package.
+
+    Args:
+        old (SnapshotTable): The earlier snapshot.
+        new (SnapshotTable): The later snapshot.
+
+    Returns:
+        SnapshotDiff: The differences between the snapshots.
+    '''
+    old_envs = environment_records(old)
+    new_envs = environment_records(new)
+    snapshot_diff = SnapshotDiff(old.name, new.name)
+    snapshot_diff.created = sorted(new_envs.keys() - old_envs.keys())
+    snapshot_diff.deleted = sorted(old_envs.keys() - new_envs.keys())
+    for env_name in sorted(old_envs.keys() & new_envs.keys()):
+        old_records = old_envs[env_name]
+        new_records = new_envs[env_name]
+        old_set = frozenset(old_records.items())
+        new_set = frozenset(new_records.items())
+        if hash(old_set) == hash(new_set) and old_set == new_set:
+            snapshot_diff.unchanged.append(env_name)
+            continue
+        env_diff = diff_environment(env_name, old_records, new_records)
+        if env_diff.has_changes:
+            snapshot_diff.changed[env_name] = env_diff
+        else:
+            snapshot_diff.unchanged.append(env_name)
+    return snapshot_diff
+
+
+def diff_snapshot_folders(old_folder: Path, new_folder: Path,
+                          max_workers: int = None)->SnapshotDiff:
+    '''Compare the snapshots saved in two folders.
+
+    Args:
+        old_folder (Path): The earlier snapshot folder.
+        new_folder (Path): The later snapshot folder.
+        max_workers (int, optional): The number of files read at once.
+
+    Returns:
+        SnapshotDiff: The differences between the snapshots.
+    '''
+    old = load_snapshot_folder(old_folder, max_workers)
+    new = load_snapshot_folder(new_folder, max_workers)
+    return diff_snapshots(old, new)
+
+
+# %% Main
+def main(args: List[str] = None)->int:
+    '''Compare two snapshot folders from the command line.
+
+    Returns:
+        int: 1 if there are differences, otherwise 0, so that the command
+            can flag drift in scheduled jobs.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Compare two environment snapshot folders.')
+    parser.add_argument('old_folder', type=Path,
+                        help='The earlier snapshot folder.')
+    parser.add_argument('new_folder', type=Path,
+                        help='The later snapshot folder.')
+    parser.add_argument('--json', type=Path, dest='json_file',
+                        help='Save the differences to this JSON file.')
+    parser.add_argument('--csv', type=Path, dest='csv_file',
+                        help='Save the differences to this CSV file.')
+    options = parser.parse_args(args)
+    snapshot_diff = diff_snapshot_folders(options.old_folder,
+                                          options.new_folder)
+    print(snapshot_diff.summary())
+    if options.json_file:
+        snapshot_diff.save_json(options.json_file)
+    if options.csv_file:
+        snapshot_diff.save_csv(options.csv_file)
+    return int(snapshot_diff.has_changes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
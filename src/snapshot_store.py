@@ -0,0 +1,292 @@
+'''Deduplicated Environment Snapshot Store.
+
+ Store environment export files (`<env>_spec.txt`, `<env>.yml` and
+ `<env>.json`) by content hash in a single SQLite database.  Each distinct
+ file is stored once, compressed, so environments that have not changed
+ between snapshots take no extra space.  A small compressed manifest for
+ each snapshot references the stored files, and any snapshot can be
+ restored to a folder byte for byte.
+ '''
+
+# %%  Imports
+from typing import List, Dict
+from pathlib import Path
+import json
+import time
+import zlib
+import hashlib
+import sqlite3
+import threading
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Type Definitions
+# StoreManifest maps each environment name to its {file name: file hash}.
+StoreManifest = Dict[str, Dict[str, str]]
+
+
+# %% Constants
+STORE_FILE = 'snapshots.db'
+
+STORE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS files (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL
+        );
+    CREATE TABLE IF NOT EXISTS snapshots (
+        name TEXT PRIMARY KEY,
+        created REAL NOT NULL,
+        manifest BLOB NOT NULL
+        );
+    '''
+
+# Export files are small, so the best zlib compression costs little time.
+COMPRESSION_LEVEL = 9
+
+
+# %% Helper functions
+def content_hash(data: bytes)->str:
+    '''Calculate the content hash used to identify a stored file.
+
+    Args:
+        data (bytes): The file contents.
+
+    Returns:
+        str: The sha256 hex digest of the contents.
+    '''
+    return hashlib.sha256(data).hexdigest()
+
+
+# %% Store class
+class SnapshotStore():
+    '''A content-addressed store of environment snapshots.
+
+    Files that are already stored are recognized by their content hash and
+    are not processed again, so the time and space needed for a snapshot
+    grow with the number of changed environments rather than the total
+    number of environments.
+
+    Use the store as a context manager to make sure the database is closed:
+        with SnapshotStore(archive_folder) as store:
+            log_all_envs(Path('Home envs Jan 28 2024'), store=store)
+            store.restore_snapshot('Home envs Jan 28 2024', restore_folder)
+
+    The store may be shared by several threads.
+
+    Attributes:
+        store_path (Path): The folder containing the store database.
+    '''
+    def __init__(self, store_path: Path):
+        self.store_path = Path(store_path)
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.store_path / STORE_FILE),
+                                          check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.lock, self.connection:
+            self.connection.executescript(STORE_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Close the store database.'''
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    # Files
+    def has_file(self, file_hash: str)->bool:
+        '''Test whether a file is in the store.
+
+        Args:
+            file_hash (str): The file's content hash.
+
+        Returns:
+            bool: True if the file is stored.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT 1 FROM files WHERE hash = ?', (file_hash,)).fetchone()
+        return row is not None
+
+    def put_file(self, data: bytes)->str:
+        '''Add a file to the store.
+
+        Args:
+            data (bytes): The file contents.
+
+        Returns:
+            str: The file's content hash.
+        '''
+        file_hash = content_hash(data)
+        if self.has_file(file_hash):
+            return file_hash
+        packed = zlib.compress(data, COMPRESSION_LEVEL)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO files (hash, size, data) '
+                'VALUES (?, ?, ?)', (file_hash, len(data), packed))
+        return file_hash
+
+    def get_file(self, file_hash: str)->bytes:
+        '''Read a stored file.
+
+        Args:
+            file_hash (str): The file's content hash.
+
+        Raises:
+            KeyError: The file is not in the store.
+            ValueError: The stored file does not match its content hash.
+
+        Returns:
+            bytes: The file contents.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data FROM files WHERE hash = ?',
+                (file_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f'File {file_hash} is not in the store')
+        data = zlib.decompress(row[0])
+        if content_hash(data) != file_hash:
+            raise ValueError(f'Stored file {file_hash} is corrupt')
+        return data
+
+    # Snapshots
+    def save_snapshot(self, name: str, manifest: StoreManifest):
+        '''Save or replace a snapshot manifest.
+
+        Args:
+            name (str): The snapshot name, usually the snapshot folder name.
+            manifest (StoreManifest): The stored file hashes for each
+                environment.
+        '''
+        packed = zlib.compress(json.dumps(manifest, sort_keys=True).encode())
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO snapshots (name, created, manifest) '
+                'VALUES (?, ?, ?)', (name, time.time(), packed))
+
+    def load_snapshot(self, name: str)->StoreManifest:
+        '''Read a snapshot manifest.
+
+        Args:
+            name (str): The snapshot name.
+
+        Raises:
+            KeyError: The snapshot is not in the store.
+
+        Returns:
+            StoreManifest: The stored file hashes for each environment.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT manifest FROM snapshots WHERE name = ?',
+                (name,)).fetchone()
+        if row is None:
+            raise KeyError(f'Snapshot {name} is not in the store')
+        return json.loads(zlib.decompress(row[0]))
+
+    def snapshots(self)->List[str]:
+        '''List the stored snapshots, oldest first.'''
+        with self.lock:
+            cursor = self.connection.execute(
+                'SELECT name FROM snapshots ORDER BY created')
+            return [row[0] for row in cursor]
+
+    def remove_snapshot(self, name: str):
+        '''Remove a snapshot manifest.
+
+        The stored files are kept, since they may be shared with other
+        snapshots.
+
+        Args:
+            name (str): The snapshot name.
+        '''
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM snapshots WHERE name = ?',
+                                    (name,))
+
+    def add_folder(self, snapshot_folder: Path, name: str = None,
+                   file_names: Dict[str, List[str]] = None)->StoreManifest:
+        '''Store the environment export files in an existing snapshot folder.
+
+        Args:
+            snapshot_folder (Path): The folder containing the export files.
+            name (str, optional): The snapshot name.  If None, the folder
+                name is used.
+            file_names (Dict[str, List[str]], optional): The file names for
+                each environment.  If None, every file in the folder is
+                stored under an environment named for the file stem.
+
+        Returns:
+            StoreManifest: The saved snapshot manifest.
+        '''
+        snapshot_folder = Path(snapshot_folder)
+        if file_names is None:
+            file_names = dict()
+            for file in sorted(snapshot_folder.iterdir()):
+                if file.is_file():
+                    env_name = file.stem
+                    if env_name.endswith('_spec'):
+                        env_name = env_name[:-len('_spec')]
+                    file_names.setdefault(env_name, []).append(file.name)
+        manifest = dict()
+        for env_name, env_files in file_names.items():
+            manifest[env_name] = {
+                file_name: self.put_file(
+                    (snapshot_folder / file_name).read_bytes())
+                for file_name in env_files}
+        self.save_snapshot(name or snapshot_folder.name, manifest)
+        return manifest
+
+    def restore_snapshot(self, name: str, restore_folder: Path,
+                         env_names: List[str] = None)->List[Path]:
+        '''Write the files for a stored snapshot to a folder.
+
+        Args:
+            name (str): The snapshot name.
+            restore_folder (Path): The folder to receive the files.
+            env_names (List[str], optional): Only restore these
+                environments.  If None, restore all environments.
+
+        Returns:
+            List[Path]: The restored files.
+        '''
+        manifest = self.load_snapshot(name)
+        restore_folder = Path(restore_folder)
+        restore_folder.mkdir(parents=True, exist_ok=True)
+        restored = list()
+        for env_name, env_files in manifest.items():
+            if env_names is not None and env_name not in env_names:
+                continue
+            for file_name, file_hash in env_files.items():
+                file_path = restore_folder / file_name
+                file_path.write_bytes(self.get_file(file_hash))
+                restored.append(file_path)
+        return restored
+
+    def size_summary(self)->Dict[str, int]:
+        '''Count the stored items.
+
+        Returns:
+            Dict[str, int]: The number of snapshots and distinct files, the
+                total size of the distinct files, and the size of the store
+                database, in bytes.
+        '''
+        with self.lock:
+            counts = {table: self.connection.execute(
+                          f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in ('snapshots', 'files')}
+            counts['file bytes'] = self.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+        counts['bytes'] = (self.store_path / STORE_FILE).stat().st_size
+        return counts
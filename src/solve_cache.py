@@ -0,0 +1,392 @@
+'''Conda Solve Cache.
+
+ Save the explicit spec (lock file) resolved the first time an environment
+ is built from a package request, and create later environments with the
+ same request directly from the saved spec.  Explicit specs list the exact
+ package files, so Conda skips the solver and can install offline from the
+ local package cache.
+
+ Usage:
+    python solve_cache.py list
+    python solve_cache.py invalidate [KEY ...] [--all]
+    python solve_cache.py refresh KEY [KEY ...]
+ '''
+
+# %%  Imports
+from typing import List, Dict, Union
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+
+from conda_meta import read_channels, export_env_specs
+from env_tools import AnacondaException, MissingEnvironment, OutputCallback
+from env_tools import console_command, build_file_string, env_registry
+from env_tools import quote_specs
+from env_tools import create_environment, install_packages
+from env_tools import create_environment_from_spec, configure_logging
+
+# %% Initialize logging
+import logging  # pylint: disable=wrong-import-position wrong-import-order
+logger = logging.getLogger(__name__)
+
+
+# %% Constants
+DEFAULT_SOLVE_CACHE = Path.home() / '.cache' / 'env_tools' / 'solve_cache'
+
+SPEC_SUFFIX = '.txt'
+REQUEST_SUFFIX = '.json'
+
+# Conda's names for the processor part of a platform subdir.
+MACHINE_NAMES = {'x86_64': '64', 'amd64': '64', 'i386': '32', 'i686': '32',
+                 'x86': '32', 'arm64': 'arm64', 'aarch64': 'aarch64',
+                 'ppc64le': 'ppc64le', 's390x': 's390x'}
+SYSTEM_NAMES = {'win32': 'win', 'linux': 'linux', 'darwin': 'osx'}
+
+# Whitespace in a package match specification.
+SPACE_PATTERN = re.compile(r'\s+')
+
+
+# %% Request normalization
+def current_platform()->str:
+    '''Get the Conda platform (subdir) of this computer, e.g. 'win-64'.'''
+    system = SYSTEM_NAMES.get(sys.platform, sys.platform)
+    machine = platform.machine().lower()
+    return f'{system}-{MACHINE_NAMES.get(machine, machine)}'
+
+
+def normalize_package(package: str)->str:
+    '''Convert a package match specification to a standard form.
+
+    Whitespace is removed and the package name is lower case, so
+    'NumPy >= 1.24' and 'numpy>=1.24' give the same request.
+
+    Args:
+        package (str): The match specification.
+
+    Returns:
+        str: The normalized match specification.
+    '''
+    package = SPACE_PATTERN.sub('', package)
+    name = re.match(r'^[^=<>!~\[]*', package).group()
+    return name.lower() + package[len(name):]
+
+
+def base_prefix()->Path:
+    '''Get the path to the base Conda environment, or None if unknown.'''
+    try:
+        return env_registry.lookup('base')[1]
+    except (MissingEnvironment, AnacondaException):
+        return None
+
+
+@dataclass
+class SolveRequest():
+    '''The inputs that determine the result of a Conda solve.
+
+    Attributes:
+        packages (List[str]): The normalized, sorted package specifications.
+        python_version (str): The requested python version.
+        channels (List[str]): The configured channels, in priority order.
+        platform (str): The Conda platform, e.g. 'win-64'.
+    '''
+    packages: List[str]
+    python_version: str
+    channels: List[str] = field(default_factory=list)
+    platform: str = ''
+
+    @classmethod
+    def build(cls, package_list: List[str], python_version: str,
+              channels: List[str] = None)->'SolveRequest':
+        '''Build a normalized solve request.
+
+        Args:
+            package_list (List[str]): The packages to install.
+            python_version (str): The python version for the environment.
+            channels (List[str], optional): The channels to use.  If None,
+                the channels in the Conda configuration are used.
+
+        Returns:
+            SolveRequest: The normalized request.
+        '''
+        packages = sorted(set(normalize_package(package)
+                              for package in package_list
+                              if package.strip()))
+        if channels is None:
+            channels = read_channels(base_prefix())
+        return cls(packages, str(python_version), list(channels),
+                   current_platform())
+
+    @property
+    def key(self)->str:
+        '''The cache key for the request.'''
+        request_text = json.dumps(asdict(self), sort_keys=True)
+        return hashlib.sha256(request_text.encode('utf-8')).hexdigest()[:32]
+
+
+# %% Cache class
+class SolveCache():
+    '''A folder of explicit specs indexed by solve request.
+
+    Each entry is a pair of files named for the request key: `<key>.txt` is
+    the explicit spec and `<key>.json` records the request and when the spec
+    was saved.
+
+    Attributes:
+        cache_path (Path): The cache folder.
+    '''
+    def __init__(self, cache_path: Path = DEFAULT_SOLVE_CACHE):
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def spec_file(self, key: str)->Path:
+        '''The explicit spec file for a cache key.'''
+        return self.cache_path / f'{key}{SPEC_SUFFIX}'
+
+    def request_file(self, key: str)->Path:
+        '''The request record file for a cache key.'''
+        return self.cache_path / f'{key}{REQUEST_SUFFIX}'
+
+    def lookup(self, request: SolveRequest)->Path:
+        '''Find the cached explicit spec for a request.
+
+        Args:
+            request (SolveRequest): The solve request.
+
+        Returns:
+            Path: The explicit spec file, or None if the request is not
+                cached.
+        '''
+        spec_file = self.spec_file(request.key)
+        if spec_file.exists():
+            return spec_file
+        return None
+
+    def store(self, request: SolveRequest, spec_text: str,
+              source: str = '')->Path:
+        '''Save the explicit spec resolved for a request.
+
+        Args:
+            request (SolveRequest): The solve request.
+            spec_text (str): The explicit spec.
+            source (str, optional): The environment the spec was exported
+                from.
+
+        Returns:
+            Path: The saved explicit spec file.
+        '''
+        key = request.key
+        spec_file = self.spec_file(key)
+        temp_file = spec_file.with_suffix('.tmp')
+        temp_file.write_text(spec_text, encoding='utf-8')
+        os.replace(temp_file, spec_file)
+        record = {'request': asdict(request), 'source': source,
+                  'saved': time.strftime('%Y-%m-%d %H:%M:%S')}
+        self.request_file(key).write_text(json.dumps(record, indent=2),
+                                          encoding='utf-8')
+        logger.info('Saved solve %s from %s', key, source)
+        return spec_file
+
+    def entries(self)->Dict[str, Dict[str, Union[str, dict]]]:
+        '''List the cached solves.
+
+        Returns:
+            Dict[str, Dict[str, Union[str, dict]]]: The request record for
+                each cache key.
+        '''
+        entries = dict()
+        for request_file in sorted(self.cache_path.glob(f'*{REQUEST_SUFFIX}')):
+            key = request_file.stem
+            if not self.spec_file(key).exists():
+                continue
+            try:
+                entries[key] = json.loads(
+                    request_file.read_text(encoding='utf-8'))
+            except ValueError:
+                logger.warning('Ignoring unreadable solve record %s',
+                               request_file)
+        return entries
+
+    def request(self, key: str)->SolveRequest:
+        '''Get the request for a cache key.
+
+        Raises:
+            KeyError: The key is not in the cache.
+        '''
+        entry = self.entries().get(key)
+        if entry is None:
+            raise KeyError(f'Solve {key} is not in the cache')
+        return SolveRequest(**entry['request'])
+
+    def invalidate(self, key: str = None):
+        '''Remove one cached solve, or all of them.
+
+        Args:
+            key (str, optional): The cache key to remove.  If None, remove
+                all cached solves.
+        '''
+        keys = [key] if key else [file.stem for file in
+                                  self.cache_path.glob(f'*{SPEC_SUFFIX}')]
+        for cache_key in keys:
+            for file in (self.spec_file(cache_key),
+                         self.request_file(cache_key)):
+                if file.exists():
+                    file.unlink()
+            logger.info('Removed solve %s', cache_key)
+
+    def refresh(self, key: str)->Path:
+        '''Solve a cached request again with the current channels.
+
+        The request is installed into a temporary environment prefix, its
+        explicit spec is saved, and the temporary environment is removed.
+
+        Args:
+            key (str): The cache key to refresh.
+
+        Returns:
+            Path: The updated explicit spec file.
+        '''
+        request = self.request(key)
+        with tempfile.TemporaryDirectory() as temp_folder:
+            prefix = Path(temp_folder) / 'env'
+            solve_cmd = 'conda create -y --json --quiet '
+            solve_cmd += f'--prefix {build_file_string(prefix)} '
+            solve_cmd += quote_specs([f'python={request.python_version}',
+                                      *request.packages])
+            solve_cmd += ''.join(f' -c {channel}'
+                                 for channel in request.channels)
+            console_command(solve_cmd, AnacondaException,
+                            f'Unable to refresh solve {key}!')
+            spec_text = export_spec(prefix)
+            shutil.rmtree(prefix, ignore_errors=True)
+        # The channels are recorded, so the key does not change.
+        return self.store(request, spec_text, 'refresh')
+
+
+# %% Build functions
+def export_spec(env_ref: Union[str, Path])->str:
+    '''Get the explicit spec for an environment.
+
+    The spec is built from the `conda-meta` folder, falling back to
+    `conda list --explicit`.
+
+    Args:
+        env_ref (Union[str, Path]): The environment name or path.
+
+    Returns:
+        str: The explicit spec text.
+    '''
+    env_path = Path(env_ref)
+    if not env_path.is_dir():
+        env_path = env_registry.lookup(env_ref)[1]
+    try:
+        return export_env_specs(env_path.name, env_path, spec=True, yml=False,
+                                history=False)['spec']
+    except (OSError, ValueError, KeyError):
+        spec_cmd = f'conda list --explicit --prefix {build_file_string(env_path)}'
+        return console_command(spec_cmd, AnacondaException,
+                               f'Unable to export spec for {env_path}.')
+
+
+def build_locked_environment(new_env: str, package_list: List[str],
+                             python_version: str = '3.10',
+                             cache: SolveCache = None,
+                             channels: List[str] = None,
+                             offline: bool = True, refresh: bool = False,
+                             progress: OutputCallback = None
+                             )->Dict[str, Union[bool, str, dict]]:
+    '''Create an environment, reusing the cached solve for the same request.
+
+    On a cache miss the environment is built with `create_environment` and
+    `install_packages`, and its explicit spec is saved.  On a hit the
+    environment is created directly from the saved spec.
+
+    Args:
+        new_env (str): The name for the new Conda environment.
+        package_list (List[str]): The packages to install.
+        python_version (str, optional): The python version. Defaults to
+            '3.10'.
+        cache (SolveCache, optional): The solve cache.  If None, the cache in
+            DEFAULT_SOLVE_CACHE is used.
+        channels (List[str], optional): The channels included in the cache
+            key.  If None, the configured channels are used.
+        offline (bool, optional): If True, install cached solves from the
+            local package cache when possible.  Defaults to True.
+        refresh (bool, optional): If True, ignore any cached solve and save
+            a new one.  Defaults to False.
+        progress (OutputCallback, optional): A function called with each
+            `conda --json` progress record.
+
+    Returns:
+        Dict[str, Union[bool, str, dict]]: 'cached' (True if the cached spec
+            was used), 'key', 'spec_file' and the conda output for 'create'
+            and, on a cache miss, 'install'.
+    '''
+    if cache is None:
+        cache = SolveCache()
+    request = SolveRequest.build(package_list, python_version, channels)
+    spec_file = None if refresh else cache.lookup(request)
+    if spec_file is not None:
+        logger.info('Using cached solve %s for %s', request.key, new_env)
+        create_output = create_environment_from_spec(new_env, spec_file,
+                                                     offline, progress)
+        return {'cached': True, 'key': request.key,
+                'spec_file': str(spec_file), 'create': create_output}
+    create_output = create_environment(new_env, python_version, progress)
+    install_output = {}
+    if request.packages:
+        install_output = install_packages(new_env, request.packages,
+                                          progress)
+    spec_file = cache.store(request, export_spec(new_env), new_env)
+    return {'cached': False, 'key': request.key, 'spec_file': str(spec_file),
+            'create': create_output, 'install': install_output}
+
+
+# %% Main
+def main(args: List[str] = None):
+    '''List, invalidate or refresh cached solves from the command line.'''
+    parser = argparse.ArgumentParser(description='Manage the Conda solve cache.')
+    parser.add_argument('--cache', type=Path, default=DEFAULT_SOLVE_CACHE,
+                        help='The solve cache folder.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List the cached solves.')
+    invalidate_parser = commands.add_parser(
+        'invalidate', help='Remove cached solves.')
+    invalidate_parser.add_argument('keys', nargs='*',
+                                   help='The cache keys to remove.')
+    invalidate_parser.add_argument('--all', action='store_true',
+                                   help='Remove all cached solves.')
+    refresh_parser = commands.add_parser(
+        'refresh', help='Solve cached requests again.')
+    refresh_parser.add_argument('keys', nargs='+',
+                                help='The cache keys to refresh.')
+    options = parser.parse_args(args)
+    configure_logging()
+    cache = SolveCache(options.cache)
+    if options.command == 'list':
+        for key, entry in cache.entries().items():
+            request = entry['request']
+            print(f'{key}  {entry["saved"]}  python={request["python_version"]}'
+                  f'  {" ".join(request["packages"])}')
+    elif options.command == 'invalidate':
+        if options.all:
+            cache.invalidate()
+        elif not options.keys:
+            parser.error('Give the cache keys to remove, or --all.')
+        for key in options.keys:
+            cache.invalidate(key)
+    else:
+        for key in options.keys:
+            cache.refresh(key)
+
+
+if __name__ == '__main__':
+    main()